@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import CustomUser, FirebaseOutbox, FirebaseSyncLease, FirebaseSyncState, FirebaseUserEvent
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -14,4 +14,25 @@ class CustomUserAdmin(UserAdmin):
         ('Firebase', {'fields': ('firebase_uid', 'email_verified')}),
         ('Permissões', {'fields': ('is_active', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         ('Datas importantes', {'fields': ('last_login', 'date_joined')}),
-    )
\ No newline at end of file
+    )
+
+@admin.register(FirebaseSyncState)
+class FirebaseSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('project_id', 'watermark', 'last_sync_at', 'last_full_sync_at')
+    readonly_fields = ('updated_at',)
+
+@admin.register(FirebaseSyncLease)
+class FirebaseSyncLeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner', 'acquired_at', 'heartbeat_at', 'expires_at')
+
+@admin.register(FirebaseOutbox)
+class FirebaseOutboxAdmin(admin.ModelAdmin):
+    list_display = ('firebase_uid', 'operation', 'fields', 'email', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('operation', 'status')
+    search_fields = ('firebase_uid', 'email')
+
+@admin.register(FirebaseUserEvent)
+class FirebaseUserEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'firebase_uid', 'event_time', 'status', 'attempts', 'received_at')
+    list_filter = ('event_type', 'status')
+    search_fields = ('event_id', 'firebase_uid')
@@ -2,6 +2,7 @@ from django.apps import AppConfig
 import threading
 import time
 import logging
+import os
 import sys
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,11 @@ class AccountsConfig(AppConfig):
         # Importa aqui para evitar import circular
         from django.conf import settings
         
+        if getattr(settings, 'FIREBASE_LAST_LOGIN_WRITE_BEHIND', False):
+            # last_login gravado em lote por uma thread, fora do caminho do login
+            from .last_login import install_last_login_buffer
+            install_last_login_buffer()
+        
         # Verifica se estamos em modo de teste de forma segura
         is_testing = getattr(settings, 'TESTING', False)
         
@@ -27,7 +33,14 @@ class AccountsConfig(AppConfig):
             logger.debug("✅ Sincronização já executada, ignorando...")
             return
         
-        if settings.DEBUG and not is_testing and is_runserver and not is_createsuperuser:
+        if is_testing or is_createsuperuser:
+            logger.debug("✅ Sincronização automática ignorada")
+        elif getattr(settings, 'FIREBASE_SYNC_SCHEDULER_ENABLED', False) and (is_runserver or not self.is_management_command()):
+            # Agendador periódico dentro do processo web; o lease escolhe um único nó por rodada
+            from .scheduler import SyncScheduler
+            self._sync_executed = True
+            SyncScheduler().start()
+        elif settings.DEBUG and is_runserver:
             # Marca que já executamos a sincronização
             self._sync_executed = True
             # Sincroniza automaticamente no startup (apenas em desenvolvimento com runserver)
@@ -43,18 +56,16 @@ class AccountsConfig(AppConfig):
         """Verifica se o comando atual é createsuperuser"""
         return len(sys.argv) > 1 and sys.argv[1] == 'createsuperuser'
     
+    def is_management_command(self):
+        """Verifica se o processo é um manage.py/django-admin (e não um servidor WSGI/ASGI)"""
+        return os.path.basename(sys.argv[0]) in ('manage.py', 'django-admin', '__main__.py')
+    
     def delayed_sync(self):
         """Sincronização com delay para evitar problemas de inicialização"""
         time.sleep(3)  # Aguarda 3 segundos para o Django carregar completamente
         
         try:
-            from .sync_utils import sync_firebase_users
-            logger.info("🔄 Iniciando sincronização automática de usuários do Firebase...")
-            result = sync_firebase_users()
-            if result:
-                synced, created, updated = result
-                logger.info(f"✅ Sincronização concluída: {synced} sincronizados, {created} criados, {updated} atualizados")
-            else:
-                logger.info("✅ Nenhum usuário para sincronizar")
+            from .scheduler import run_scheduled_sync
+            run_scheduled_sync()
         except Exception as e:
             logger.error(f"❌ Erro na sincronização automática: {e}")
\ No newline at end of file
@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import BaseBackend, ModelBackend
+from .cache import user_cache
+from .tokens import verify_id_token, InvalidIdToken
+import logging
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend que carrega o usuário da sessão pelo cache em vez de consultar o banco a cada requisição"""
+    
+    def get_user(self, user_id):
+        try:
+            user = user_cache.get_by_pk(user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+class FirebaseTokenBackend(BaseBackend):
+    """Autentica pelo ID token do Firebase, validado localmente, mapeando "sub" para firebase_uid"""
+    
+    def authenticate(self, request, id_token=None, **kwargs):
+        if not id_token:
+            return None
+        
+        try:
+            claims = verify_id_token(id_token)
+        except InvalidIdToken as e:
+            logger.debug(f"⚠️ ID token recusado: {e}")
+            return None
+        
+        try:
+            user = user_cache.get_by_firebase_uid(claims['sub'])
+        except User.DoesNotExist:
+            return None
+        
+        if not user.is_active:
+            return None
+        
+        user.firebase_claims = claims
+        return user
+    
+    def get_user(self, user_id):
+        try:
+            return user_cache.get_by_pk(user_id)
+        except User.DoesNotExist:
+            return None
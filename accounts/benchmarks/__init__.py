@@ -0,0 +1,5 @@
+"""Benchmarks da sincronização e do login, rodados por `manage.py benchmark_firebase`.
+
+Nada aqui fala com o Firebase de verdade: o Admin SDK é trocado por um fake em
+memória (fakes.py) e a API Identity Toolkit por um servidor HTTP local (stub_server.py).
+"""
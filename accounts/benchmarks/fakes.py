@@ -0,0 +1,190 @@
+from contextlib import contextmanager
+from firebase_admin import auth as firebase_auth
+import firebase_config
+import threading
+import time
+
+# 2024-01-01 em ms, base dos timestamps sintéticos
+BASE_TIMESTAMP = 1704067200000
+
+class FakeUserMetadata:
+    def __init__(self, creation_timestamp, last_sign_in_timestamp=None, last_refresh_timestamp=None):
+        self.creation_timestamp = creation_timestamp
+        self.last_sign_in_timestamp = last_sign_in_timestamp
+        self.last_refresh_timestamp = last_refresh_timestamp
+
+class FakeUserRecord:
+    """Mesmos atributos de firebase_admin.auth.UserRecord usados pelo projeto"""
+    
+    def __init__(self, uid, email, email_verified=False, display_name=None, user_metadata=None, disabled=False):
+        self.uid = uid
+        self.email = email
+        self.email_verified = email_verified
+        self.display_name = display_name
+        self.user_metadata = user_metadata or FakeUserMetadata(BASE_TIMESTAMP)
+        self.disabled = disabled
+
+class FakeListUsersPage:
+    def __init__(self, fake_auth, start, max_results):
+        if fake_auth.latency:
+            time.sleep(fake_auth.latency)
+        self._auth = fake_auth
+        self._max_results = max_results
+        self.users, self.next_page_token = fake_auth._page(start, max_results)
+    
+    @property
+    def has_next_page(self):
+        return self.next_page_token is not None
+    
+    def get_next_page(self):
+        if self.next_page_token is None:
+            return None
+        return FakeListUsersPage(self._auth, self.next_page_token, self._max_results)
+
+class FakeBatchResult:
+    def __init__(self, total, errors=()):
+        self.errors = list(errors)
+        self.failure_count = len(self.errors)
+        self.success_count = total - self.failure_count
+
+class FakeAuth:
+    """Fake em memória de firebase_admin.auth com usuários sintéticos.
+    
+    Os usuários base são gerados sob demanda a partir do índice, então 1M de
+    usuários não ocupam memória; só as alterações (update/delete/create) são guardadas.
+    `latency` (segundos) simula a ida e volta à API em cada página do list_users.
+    """
+    
+    ImportUserRecord = firebase_auth.ImportUserRecord
+    UserNotFoundError = firebase_auth.UserNotFoundError
+    
+    def __init__(self, user_count, domains=50, latency=0.0):
+        self.user_count = user_count
+        self.latency = latency
+        self.domains = domains
+        self._changed = {}
+        self._deleted = set()
+        self._extra = []
+        self._lock = threading.Lock()
+        self.calls = {}
+    
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+    
+    def uid_for(self, index):
+        return f'bench{index:023d}'
+    
+    def _generate(self, index):
+        created = BASE_TIMESTAMP + index * 1000
+        return FakeUserRecord(
+            uid=self.uid_for(index),
+            email=f'user{index}@example{index % self.domains}.com',
+            email_verified=bool(index % 2),
+            # Um terço sem display_name, como contas criadas só com email/senha
+            display_name=None if index % 3 == 0 else f'User {index}',
+            user_metadata=FakeUserMetadata(created, last_sign_in_timestamp=created),
+        )
+    
+    def _record(self, index):
+        if index < self.user_count:
+            uid, record = self.uid_for(index), None
+        else:
+            record = self._extra[index - self.user_count]
+            uid = record.uid
+        if uid in self._deleted:
+            return None
+        return self._changed.get(uid) or record or self._generate(index)
+    
+    def _page(self, start, max_results):
+        total = self.user_count + len(self._extra)
+        users = []
+        index = start
+        while index < total and len(users) < max_results:
+            record = self._record(index)
+            if record is not None:
+                users.append(record)
+            index += 1
+        return users, index if index < total else None
+    
+    def list_users(self, page_token=None, max_results=1000, app=None):
+        self._count('list_users')
+        return FakeListUsersPage(self, int(page_token or 0), max_results)
+    
+    def _find(self, uid):
+        if uid in self._deleted:
+            return None
+        if uid in self._changed:
+            return self._changed[uid]
+        if uid.startswith('bench') and uid[5:].isdigit() and int(uid[5:]) < self.user_count:
+            return self._generate(int(uid[5:]))
+        for record in self._extra:
+            if record.uid == uid and uid not in self._deleted:
+                return record
+        return None
+    
+    def get_user(self, uid, app=None):
+        self._count('get_user')
+        record = self._find(uid)
+        if record is None:
+            raise self.UserNotFoundError(f'Usuário {uid} não encontrado')
+        return record
+    
+    def create_user(self, uid=None, email=None, email_verified=False, display_name=None, password=None, app=None, **kwargs):
+        self._count('create_user')
+        with self._lock:
+            uid = uid or f'created{len(self._extra):021d}'
+            record = FakeUserRecord(uid, email, email_verified, display_name)
+            self._extra.append(record)
+        return record
+    
+    def update_user(self, uid, email=None, display_name=None, email_verified=None, app=None, **kwargs):
+        self._count('update_user')
+        record = self.get_user(uid)
+        updated = FakeUserRecord(
+            uid,
+            email if email is not None else record.email,
+            email_verified if email_verified is not None else record.email_verified,
+            display_name if display_name is not None else record.display_name,
+            record.user_metadata,
+        )
+        with self._lock:
+            self._changed[uid] = updated
+        return updated
+    
+    def delete_user(self, uid, app=None):
+        self._count('delete_user')
+        self.get_user(uid)
+        with self._lock:
+            self._deleted.add(uid)
+    
+    def import_users(self, users, hash_alg=None, app=None):
+        self._count('import_users')
+        for record in users:
+            self.create_user(
+                uid=record.uid,
+                email=record.email,
+                email_verified=record.email_verified,
+                display_name=record.display_name,
+            )
+        return FakeBatchResult(len(users))
+    
+    def delete_users(self, uids, app=None):
+        self._count('delete_users')
+        with self._lock:
+            self._deleted.update(uids)
+        return FakeBatchResult(len(uids))
+
+@contextmanager
+def fake_firebase_auth(fake_auth):
+    """Troca o módulo auth usado por firebase_config pelo fake enquanto o bloco roda"""
+    original_auth = firebase_config.auth
+    original_initialized = firebase_config._firebase_initialized
+    firebase_config.auth = fake_auth
+    # Com a flag ligada initialize_firebase() não tenta criar o app de verdade
+    firebase_config._firebase_initialized = True
+    try:
+        yield fake_auth
+    finally:
+        firebase_config.auth = original_auth
+        firebase_config._firebase_initialized = original_initialized
@@ -0,0 +1,289 @@
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from .fakes import FakeAuth, fake_firebase_auth
+from .stub_server import IdentityToolkitStub
+import gc
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = {}
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+def run_scenario(name, **params):
+    metrics = SCENARIOS[name](**params)
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    return metrics
+
+def peak_rss_mb():
+    """Pico de memória residente do processo (None onde o módulo resource não existe)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    # Nearest-rank: o menor valor com pelo menos `fraction` das amostras abaixo ou iguais
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def _rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+@contextmanager
+def benchmark_database():
+    """Banco de teste descartável; no SQLite em arquivo, para que várias threads possam escrever"""
+    db_settings = connection.settings_dict
+    tmpdir = None
+    if connection.vendor == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='firebase-bench-')
+        db_settings.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmpdir:
+            os.rmdir(tmpdir)
+
+def _timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+@scenario('sync')
+def run_sync_benchmark(users=10000, page_size=None, batch_size=None, changed_ratio=0.01,
+                       workers=None, queue_depth=None, admin_latency=0.0):
+    """Sincronização completa num banco vazio, de novo com parte dos usuários alterada e uma incremental"""
+    from accounts.sync_utils import sync_firebase_users
+    
+    fake_auth = FakeAuth(users, latency=admin_latency)
+    options = {'page_size': page_size, 'batch_size': batch_size, 'workers': workers, 'queue_depth': queue_depth}
+    with benchmark_database(), fake_firebase_auth(fake_auth):
+        initial, initial_seconds = _timed(sync_firebase_users, full=True, **options)
+        
+        step = max(1, int(1 / changed_ratio)) if changed_ratio else 0
+        changed = 0
+        if step:
+            for index in range(0, users, step):
+                fake_auth.update_user(fake_auth.uid_for(index), display_name=f'Renamed {index}')
+                changed += 1
+        
+        resync, resync_seconds = _timed(sync_firebase_users, full=True, **options)
+        incremental, incremental_seconds = _timed(sync_firebase_users, full=False, **options)
+    
+    return {
+        'users': users,
+        'changed': changed,
+        'initial_created': initial[1],
+        'initial_seconds': round(initial_seconds, 3),
+        'initial_users_per_sec': _rate(users, initial_seconds),
+        'resync_updated': resync[2],
+        'resync_seconds': round(resync_seconds, 3),
+        'resync_users_per_sec': _rate(users, resync_seconds),
+        'incremental_seconds': round(incremental_seconds, 3),
+        'list_users_calls': fake_auth.calls.get('list_users', 0),
+    }
+
+def _traced(build):
+    """Bytes alocados (tracemalloc) que continuam vivos depois de `build()`, e o pico durante"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        retained = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del retained
+    return current, peak
+
+def _listed_users(fake_auth, page_size):
+    page = fake_auth.list_users(max_results=page_size)
+    while page:
+        yield from page.users
+        page = page.get_next_page()
+
+@scenario('memory')
+def run_memory_benchmark(users=1000000, page_size=None):
+    """Memória para manter todos os usuários listados: um dict por usuário vs FirebaseUserRecord"""
+    from firebase_config import FirebaseUserRecord, firebase_user_to_dict, get_list_users_page_size
+    
+    fake_auth = FakeAuth(users)
+    page_size = get_list_users_page_size(page_size)
+    
+    dict_bytes, dict_peak = _traced(
+        lambda: [firebase_user_to_dict(user) for user in _listed_users(fake_auth, page_size)]
+    )
+    record_bytes, record_peak = _traced(
+        lambda: [FirebaseUserRecord.from_user(user) for user in _listed_users(fake_auth, page_size)]
+    )
+    # O conjunto de UIDs que a varredura completa guarda para detectar órfãos
+    uid_set_bytes, _ = _traced(lambda: {user.uid for user in _listed_users(fake_auth, page_size)})
+    
+    return {
+        'users': users,
+        'dict_mb': round(dict_bytes / 2 ** 20, 1),
+        'record_mb': round(record_bytes / 2 ** 20, 1),
+        'dict_peak_mb': round(dict_peak / 2 ** 20, 1),
+        'record_peak_mb': round(record_peak / 2 ** 20, 1),
+        'uid_set_mb': round(uid_set_bytes / 2 ** 20, 1),
+        'dict_bytes_per_user': round(dict_bytes / max(users, 1)),
+        'record_bytes_per_user': round(record_bytes / max(users, 1)),
+        'memory_reduction': round(1 - record_bytes / dict_bytes, 3) if dict_bytes else None,
+    }
+
+@scenario('login')
+def run_login_benchmark(requests=2000, users=500, concurrency=8, latency=0.0, write_behind=False,
+                        password='benchmark-password'):
+    """POSTs em /login/ pelo cliente de teste do Django contra o stub local da Identity Toolkit.
+    
+    Os emails se repetem (requests > users): mede tanto o primeiro login, que
+    cria o usuário, quanto os seguintes. write_behind=True grava o last_login
+    pelo buffer em lote em vez do UPDATE síncrono.
+    """
+    from accounts import http_client
+    from accounts.last_login import install_last_login_buffer, uninstall_last_login_buffer
+    
+    latencies = []
+    errors = []
+    next_request = iter(range(requests))
+    lock = threading.Lock()
+    
+    def worker():
+        client = Client()
+        url = reverse('login')
+        try:
+            while True:
+                with lock:
+                    number = next(next_request, None)
+                if number is None:
+                    return
+                # Sem os cookies da sessão anterior a view não cai no atalho de "já autenticado"
+                client.cookies.clear()
+                started = time.perf_counter()
+                response = client.post(url, {'email': f'login{number % users}@example.com', 'password': password})
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status_code != 302:
+                        errors.append(response.status_code)
+        finally:
+            connection.close()
+    
+    setup_test_environment()
+    try:
+        with benchmark_database(), IdentityToolkitStub(latency=latency) as stub:
+            # Todas as requisições vêm do mesmo IP e repetem emails: o limite de taxa recusaria quase todas
+            with override_settings(FIREBASE_IDENTITY_TOOLKIT_URL=stub.base_url, FIREBASE_RATELIMIT_ENABLED=False):
+                http_client._client = None
+                if write_behind:
+                    install_last_login_buffer()
+                threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                seconds = time.perf_counter() - started
+                if write_behind:
+                    uninstall_last_login_buffer()
+                client_stats = http_client.get_identity_toolkit_client().stats()
+                http_client._client = None
+    finally:
+        teardown_test_environment()
+    
+    return {
+        'requests': requests,
+        'users': users,
+        'concurrency': concurrency,
+        'stub_latency_ms': _ms(latency),
+        'write_behind': write_behind,
+        'errors': len(errors),
+        'seconds': round(seconds, 3),
+        'requests_per_sec': _rate(requests, seconds),
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'mean_ms': _ms(sum(latencies) / len(latencies)) if latencies else None,
+        'stub_requests': sum(stub.counts.values()),
+        'connections_opened': client_stats['connections_opened'],
+    }
+
+# Roda num processo novo: o que um worker WSGI faz ao subir e ao atender a primeira requisição
+WORKER_BOOT_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'firebase_login.settings')
+from django.core.wsgi import get_wsgi_application
+from django.conf import settings
+from django.urls import get_resolver
+application = get_wsgi_application()
+get_resolver(settings.ROOT_URLCONF).url_patterns
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'modules': len(sys.modules),
+    'firebase_admin_loaded': 'firebase_admin' in sys.modules,
+}))
+"""
+
+def _run_timed(command):
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(command[:3])} falhou: {completed.stderr.strip()[-500:]}")
+    return elapsed, completed.stdout
+
+@scenario('startup')
+def run_startup_benchmark(runs=5):
+    """Partida a frio: `manage.py check` e o boot de um worker, cada execução num processo novo"""
+    check_times = []
+    boot_times = []
+    boot_internal = []
+    boot_info = {}
+    for _ in range(runs):
+        elapsed, _ = _run_timed([sys.executable, 'manage.py', 'check'])
+        check_times.append(elapsed)
+        
+        elapsed, output = _run_timed([sys.executable, '-c', WORKER_BOOT_SCRIPT])
+        boot_info = json.loads(output.strip().splitlines()[-1])
+        boot_times.append(elapsed)
+        boot_internal.append(boot_info['seconds'])
+    
+    return {
+        'runs': runs,
+        'check_p50_ms': _ms(percentile(check_times, 0.5)),
+        'check_min_ms': _ms(min(check_times)),
+        'worker_boot_p50_ms': _ms(percentile(boot_times, 0.5)),
+        'worker_boot_min_ms': _ms(min(boot_times)),
+        'worker_boot_django_p50_ms': _ms(percentile(boot_internal, 0.5)),
+        'modules_loaded_at_boot': boot_info.get('modules'),
+        'firebase_admin_loaded_at_boot': boot_info.get('firebase_admin_loaded'),
+    }
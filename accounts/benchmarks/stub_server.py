@@ -0,0 +1,142 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+import hashlib
+import itertools
+import json
+import threading
+import time
+
+class IdentityToolkitStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            data = dict(parse_qsl(body.decode()))
+        else:
+            data = json.loads(body or b'{}')
+        server = self.server
+        
+        if server.latency:
+            time.sleep(server.latency)
+        
+        endpoint = self.path.split('?', 1)[0].rsplit('/', 1)[-1]
+        handler = server.endpoints.get(endpoint)
+        if handler is None:
+            self._send_json(404, {'error': {'code': 404, 'message': 'NOT_FOUND'}})
+            return
+        
+        with server.lock:
+            server.counts[endpoint] = server.counts.get(endpoint, 0) + 1
+        status, payload = handler(server, data)
+        self._send_json(status, payload)
+
+def _local_id(email):
+    # UID estável por email: logins repetidos caem no mesmo usuário do Django
+    return hashlib.sha1(email.encode()).hexdigest()[:28]
+
+def _sign_in(server, data):
+    email = data.get('email') or ''
+    if not email or not data.get('password'):
+        return 400, {'error': {'code': 400, 'message': 'INVALID_LOGIN_CREDENTIALS'}}
+    local_id = _local_id(email)
+    return 200, {
+        'localId': local_id,
+        'email': email,
+        'idToken': f'stub-id-token-{next(server.token_ids)}',
+        # O refresh token carrega o UID, como um opaco que o stub consegue ler de volta
+        'refreshToken': f'stub-refresh-{local_id}',
+        'expiresIn': str(server.expires_in),
+        'registered': True,
+    }
+
+def _sign_up(server, data):
+    email = data.get('email') or ''
+    with server.lock:
+        if email in server.registered:
+            return 400, {'error': {'code': 400, 'message': 'EMAIL_EXISTS'}}
+        server.registered.add(email)
+    status, payload = _sign_in(server, data)
+    payload.pop('registered', None)
+    return status, payload
+
+def _refresh_token(server, data):
+    refresh_token = data.get('refresh_token') or ''
+    if data.get('grant_type') != 'refresh_token' or not refresh_token.startswith('stub-refresh-'):
+        return 400, {'error': {'code': 400, 'message': 'INVALID_REFRESH_TOKEN'}}
+    if refresh_token in server.revoked:
+        return 400, {'error': {'code': 400, 'message': 'TOKEN_EXPIRED'}}
+    return 200, {
+        'id_token': f'stub-id-token-{next(server.token_ids)}',
+        'refresh_token': refresh_token,
+        'expires_in': str(server.expires_in),
+        'token_type': 'Bearer',
+        'user_id': refresh_token[len('stub-refresh-'):],
+    }
+
+class IdentityToolkitStub:
+    """Servidor HTTP local que responde como os endpoints accounts:signInWithPassword, accounts:signUp
+    e o `token` do securetoken (use `base_url` também como FIREBASE_SECURE_TOKEN_URL).
+    
+    `latency` (segundos) simula o tempo de rede até o Google em cada resposta;
+    `expires_in` é a validade (s) dos ID tokens emitidos e `revoked` guarda
+    refresh tokens que devem ser recusados.
+    """
+    
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0, expires_in=3600):
+        self.server = ThreadingHTTPServer((host, port), IdentityToolkitStubHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.lock = threading.Lock()
+        self.server.counts = {}
+        self.server.registered = set()
+        self.server.revoked = set()
+        self.server.expires_in = expires_in
+        self.server.token_ids = itertools.count(1)
+        self.server.endpoints = {
+            'accounts:signInWithPassword': _sign_in,
+            'accounts:signUp': _sign_up,
+            'token': _refresh_token,
+        }
+        self._thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+    
+    @property
+    def revoked(self):
+        return self.server.revoked
+    
+    @property
+    def counts(self):
+        with self.server.lock:
+            return dict(self.server.counts)
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
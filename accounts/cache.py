@@ -0,0 +1,259 @@
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 5 * 60
+DEFAULT_LOCAL_TTL = 5
+DEFAULT_LOCAL_SIZE = 1024
+
+# Versão no prefixo: muda quando o formato das entradas muda (v2: chave de email normalizada, v3: só CACHED_FIELDS)
+KEY_PREFIX = 'accounts:user:v3'
+
+# Campos guardados no cache: os que a autenticação por sessão e por token e o login leem. O hash da senha
+# não sai do banco; os demais campos ficam adiados na instância e são lidos do banco se forem acessados
+CACHED_FIELDS = (
+    'id',
+    'username',
+    'email',
+    'email_normalized',
+    'firebase_uid',
+    'email_verified',
+    'first_name',
+    'last_name',
+    'is_active',
+    'is_staff',
+    'is_superuser',
+    'last_login',
+    'date_joined',
+)
+
+# Backends que não são compartilhados entre workers: com eles a invalidação feita num processo não chega aos
+# outros, que continuariam servindo is_active e o hash da sessão antigos por até FIREBASE_USER_CACHE_TIMEOUT
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+_MISSING = object()
+
+class LocalLRU:
+    """LRU em memória, por processo, com TTL curto para limitar dados desatualizados entre workers"""
+    
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class UserCache:
+    """Cache read-through de CustomUser por pk, firebase_uid e email.
+    
+    O usuário é guardado uma vez, na chave do pk, só com os CACHED_FIELDS e o
+    hash da sessão (nunca o hash da senha); as chaves de UID e email apontam
+    para o pk e são conferidas na leitura, então uma chave antiga (email
+    alterado, por exemplo) vira apenas um miss.
+    
+    O cache do Django só é usado se for compartilhado entre os workers (Redis,
+    memcached, banco, arquivos); com LocMemCache ou DummyCache fica só o LRU
+    local, cujo TTL curto limita quanto tempo outro worker vê dados antigos.
+    """
+    
+    def __init__(self):
+        self._local = None
+        self._local_lock = threading.Lock()
+        self._warned_aliases = set()
+    
+    @property
+    def backend(self):
+        """Cache compartilhado entre workers, ou None se o alias configurado é local ao processo"""
+        alias = getattr(settings, 'FIREBASE_USER_CACHE_ALIAS', 'default')
+        backend = caches[alias]
+        if isinstance(backend, PROCESS_LOCAL_BACKENDS):
+            if alias not in self._warned_aliases:
+                self._warned_aliases.add(alias)
+                logger.warning(
+                    f"⚠️ O cache '{alias}' ({type(backend).__name__}) não é compartilhado entre workers; "
+                    f"o cache de usuários fica só no LRU local"
+                )
+            return None
+        return backend
+    
+    @property
+    def local(self):
+        if self._local is None:
+            with self._local_lock:
+                if self._local is None:
+                    self._local = LocalLRU(
+                        getattr(settings, 'FIREBASE_USER_CACHE_LOCAL_SIZE', DEFAULT_LOCAL_SIZE),
+                        getattr(settings, 'FIREBASE_USER_CACHE_LOCAL_TTL', DEFAULT_LOCAL_TTL),
+                    )
+        return self._local
+    
+    @property
+    def timeout(self):
+        return getattr(settings, 'FIREBASE_USER_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    
+    def _key(self, kind, value):
+        if kind == 'email':
+            # Emails podem ter caracteres não aceitos como chave pelo memcached
+            value = hashlib.md5(value.encode()).hexdigest()
+        return f'{KEY_PREFIX}:{kind}:{value}'
+    
+    def _get(self, key):
+        value = self.local.get(key)
+        backend = self.backend
+        if value is _MISSING and backend is not None:
+            value = backend.get(key, _MISSING)
+            if value is not _MISSING:
+                self.local.set(key, value)
+        return value
+    
+    def _set(self, key, value):
+        self.local.set(key, value)
+        backend = self.backend
+        if backend is not None:
+            backend.set(key, value, self.timeout)
+    
+    def _user_keys(self, user):
+        keys = [self._key('pk', user.pk)]
+        if user.firebase_uid:
+            keys.append(self._key('uid', user.firebase_uid))
+        if user.email_normalized:
+            keys.append(self._key('email', user.email_normalized))
+        return keys
+    
+    def _entry(self, user):
+        data = {field: user.__dict__[field] for field in CACHED_FIELDS if field in user.__dict__}
+        # HMAC do hash da senha com o SECRET_KEY: valida a sessão sem guardar a senha no cache
+        return user._state.db, data, user.get_session_auth_hash()
+    
+    def _build(self, entry):
+        from .models import CustomUser
+        
+        db, data, session_auth_hash = entry
+        # from_db espera os valores na ordem dos campos do modelo; os ausentes ficam adiados
+        field_names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in data]
+        user = CustomUser.from_db(db, field_names, [data[field] for field in field_names])
+        user._cached_session_auth_hash = session_auth_hash
+        return user
+    
+    def store(self, user):
+        """Guarda o usuário e a chave do UID; a de email só é gravada por get_by_email"""
+        self._set(self._key('pk', user.pk), self._entry(user))
+        if user.firebase_uid:
+            self._set(self._key('uid', user.firebase_uid), user.pk)
+    
+    def _from_pk(self, pk):
+        entry = self._get(self._key('pk', pk))
+        # Cada chamador recebe sua própria instância: a entrada do cache local é compartilhada entre threads
+        return None if entry is _MISSING else self._build(entry)
+    
+    def get_by_pk(self, pk):
+        from .models import CustomUser
+        
+        user = self._from_pk(pk)
+        if user is None:
+            user = CustomUser.objects.get(pk=pk)
+            self.store(user)
+        return user
+    
+    def _get_cached(self, kind, field, value):
+        pk = self._get(self._key(kind, value))
+        if pk is not _MISSING:
+            user = self._from_pk(pk)
+            if user is not None and getattr(user, field) == value:
+                return user
+        return None
+    
+    def get_by_firebase_uid(self, firebase_uid):
+        """Como CustomUser.objects.get(firebase_uid=...), incluindo o DoesNotExist"""
+        from .models import CustomUser
+        
+        user = self._get_cached('uid', 'firebase_uid', firebase_uid)
+        if user is None:
+            user = CustomUser.objects.get(firebase_uid=firebase_uid)
+            self.store(user)
+        return user
+    
+    def get_by_email(self, email):
+        """Busca por email_normalized, levantando DoesNotExist como o get().
+        
+        email_normalized não é único: tabelas antigas podem ter variações de
+        caixa do mesmo email. Nesse caso vence a linha com o email exatamente
+        igual ao informado, senão a mais antiga, e a chave de email não é
+        guardada no cache (a escolha depende do email informado).
+        """
+        from .models import CustomUser, normalize_email
+        
+        normalized = normalize_email(email)
+        user = self._get_cached('email', 'email_normalized', normalized)
+        if user is not None:
+            return user
+        
+        users = list(CustomUser.objects.filter(email_normalized=normalized).order_by('pk'))
+        if not users:
+            raise CustomUser.DoesNotExist(f'Nenhum usuário com o email {normalized}')
+        
+        exact = (email or '').strip()
+        user = next((candidate for candidate in users if candidate.email == exact), users[0])
+        self.store(user)
+        if len(users) == 1:
+            self._set(self._key('email', normalized), user.pk)
+        else:
+            logger.warning(f"⚠️ {len(users)} usuários com variações do email {normalized}; usando o de id {user.pk}")
+        return user
+    
+    def invalidate(self, user):
+        self.invalidate_keys(self._user_keys(user))
+    
+    def invalidate_pks(self, pks):
+        self.invalidate_keys([self._key('pk', pk) for pk in pks])
+    
+    def invalidate_keys(self, keys):
+        def delete():
+            self.local.delete_many(keys)
+            backend = self.backend
+            if backend is not None:
+                backend.delete_many(keys)
+        
+        delete()
+        # De novo após o commit: outra requisição pode ter lido a versão antiga nesse meio tempo
+        transaction.on_commit(delete)
+
+user_cache = UserCache()
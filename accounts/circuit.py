@@ -0,0 +1,208 @@
+from django.conf import settings
+from .metrics import record_circuit_state
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIMEOUT = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """O circuito do endpoint está aberto: a chamada nem foi feita"""
+    
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuito {name} aberto; nova tentativa em {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Circuit breaker de um endpoint do Firebase, com os estados closed, open e half_open.
+    
+    Depois de `failure_threshold` falhas seguidas o circuito abre e as chamadas
+    falham na hora, sem esperar timeouts, por `recovery_timeout` segundos. Aí
+    uma única chamada de teste passa (half_open): se der certo o circuito
+    fecha, se falhar ele abre de novo pelo mesmo tempo. O estado é por processo.
+    """
+    
+    def __init__(self, name, failure_threshold=None, recovery_timeout=None):
+        self.name = name
+        overrides = getattr(settings, 'FIREBASE_CIRCUIT_BREAKERS', {}).get(name, {})
+        if failure_threshold is None:
+            failure_threshold = overrides.get(
+                'failure_threshold',
+                getattr(settings, 'FIREBASE_CIRCUIT_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD),
+            )
+        if recovery_timeout is None:
+            recovery_timeout = overrides.get(
+                'recovery_timeout',
+                getattr(settings, 'FIREBASE_CIRCUIT_RECOVERY_TIMEOUT', DEFAULT_RECOVERY_TIMEOUT),
+            )
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_timeout = max(0.0, float(recovery_timeout))
+        
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+    
+    def _set_state(self, state):
+        if state != self._state:
+            self._state = state
+            record_circuit_state(self.name, state)
+            if state == OPEN:
+                logger.warning(f"⚠️ Circuito {self.name} aberto após {self._failures} falhas seguidas")
+            elif state == CLOSED:
+                logger.info(f"✅ Circuito {self.name} fechado")
+    
+    def _retry_after(self, now):
+        return max(0.0, self._opened_at + self.recovery_timeout - now)
+    
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and not self._retry_after(time.monotonic()):
+                return HALF_OPEN
+            return self._state
+    
+    @property
+    def is_open(self):
+        """True enquanto as chamadas falhariam na hora (inclui half_open com o teste em andamento)"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                return self._probing
+            return self._state == OPEN and self._retry_after(time.monotonic()) > 0
+    
+    def retry_after(self):
+        with self._lock:
+            return self._retry_after(time.monotonic()) if self._state == OPEN else 0.0
+    
+    def before_call(self):
+        """Reserva a chamada ou levanta CircuitOpenError; quem chama deve informar o resultado depois"""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            now = time.monotonic()
+            if self._state == OPEN:
+                retry_after = self._retry_after(now)
+                if retry_after:
+                    raise CircuitOpenError(self.name, retry_after)
+                self._set_state(HALF_OPEN)
+            if self._probing:
+                raise CircuitOpenError(self.name, self.recovery_timeout)
+            self._probing = True
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._probing = False
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+    
+    def release(self):
+        """Devolve a reserva de uma chamada que terminou sem indicar nada sobre o serviço"""
+        with self._lock:
+            self._probing = False
+    
+    def guard(self, is_failure=None):
+        return _Guard(self, is_failure)
+    
+    def snapshot(self):
+        with self._lock:
+            state = self._state
+            retry_after = self._retry_after(time.monotonic()) if state == OPEN else 0.0
+            if state == OPEN and not retry_after:
+                state = HALF_OPEN
+            return {
+                'state': state,
+                'failures': self._failures,
+                'retry_after': round(retry_after, 1),
+            }
+
+class _Guard:
+    """Bloco protegido pelo circuito: exceções para as quais is_failure(e) é verdadeiro contam como falha"""
+    
+    def __init__(self, breaker, is_failure):
+        self.breaker = breaker
+        self.is_failure = is_failure
+    
+    def __enter__(self):
+        self.breaker.before_call()
+        return self.breaker
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.breaker.record_success()
+        elif self.is_failure is None or self.is_failure(exc_value):
+            self.breaker.record_failure()
+        else:
+            # Erro da aplicação (usuário inexistente, email duplicado...): o serviço respondeu
+            self.breaker.record_success()
+        return False
+
+class _DisabledBreaker:
+    """Usado com FIREBASE_CIRCUIT_BREAKER_ENABLED desligado: nunca abre"""
+    
+    is_open = False
+    state = CLOSED
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def retry_after(self):
+        return 0.0
+    
+    def before_call(self):
+        pass
+    
+    def record_success(self):
+        pass
+    
+    def record_failure(self):
+        pass
+    
+    def release(self):
+        pass
+    
+    def guard(self, is_failure=None):
+        return _Guard(self, is_failure)
+    
+    def snapshot(self):
+        return {'state': CLOSED, 'failures': 0, 'retry_after': 0.0}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name):
+    """Circuito do endpoint `name`, criado no primeiro uso e compartilhado pelo processo"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                enabled = getattr(settings, 'FIREBASE_CIRCUIT_BREAKER_ENABLED', True)
+                breaker = _breakers[name] = CircuitBreaker(name) if enabled else _DisabledBreaker(name)
+    return breaker
+
+def circuit_states():
+    """Estado de cada circuito já usado no processo, para o health check"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in sorted(breakers, key=lambda b: b.name)}
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
@@ -0,0 +1,309 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import F, Max
+from django.utils import timezone
+from email.utils import parsedate_to_datetime
+from firebase_config import FirebaseUserRecord
+from .lease import SyncLease
+from .metrics import record_user_events
+from .models import CustomUser, FirebaseUserEvent, suppress_firebase_sync
+from .outbox import get_backoff_delay
+from .reconcile import reconcile_firebase_users
+import hashlib
+import hmac
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Firebase-Signature'
+EVENTS_LEASE_NAME = 'firebase-events'
+
+DEFAULT_SIGNATURE_TOLERANCE = 5 * 60
+DEFAULT_EVENTS_BATCH_SIZE = 100
+DEFAULT_EVENTS_MAX_ATTEMPTS = 5
+DEFAULT_EVENTS_RETENTION_DAYS = 7
+MAX_EVENTS_PER_REQUEST = 500
+
+FRACTION_RE = re.compile(r'\.(\d+)')
+
+EVENT_TYPES = {
+    'user.created': FirebaseUserEvent.TYPE_CREATED,
+    'user.updated': FirebaseUserEvent.TYPE_UPDATED,
+    'user.deleted': FirebaseUserEvent.TYPE_DELETED,
+    # Nomes usados pelos gatilhos de auth do Cloud Functions, para encaminhar o evento sem traduzir
+    'providers/firebase.auth/eventTypes/user.create': FirebaseUserEvent.TYPE_CREATED,
+    'providers/firebase.auth/eventTypes/user.delete': FirebaseUserEvent.TYPE_DELETED,
+}
+
+class InvalidEvent(ValueError):
+    pass
+
+def get_webhook_secrets():
+    """Segredos aceitos na assinatura (o primeiro é o usado pelo replay_firebase_events)"""
+    secrets = getattr(settings, 'FIREBASE_WEBHOOK_SECRETS', None) or []
+    return [secrets] if isinstance(secrets, str) else list(secrets)
+
+def get_events_batch_size(batch_size=None):
+    if batch_size is None:
+        batch_size = getattr(settings, 'FIREBASE_EVENTS_BATCH_SIZE', DEFAULT_EVENTS_BATCH_SIZE)
+    return max(1, int(batch_size))
+
+def _digest(body, secret, timestamp):
+    return hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+
+def sign_payload(body, secret, timestamp=None):
+    """Valor do header X-Firebase-Signature: "t=<unix>,v1=<HMAC-SHA256 de '<unix>.<corpo>'>\""""
+    timestamp = int(time.time()) if timestamp is None else int(timestamp)
+    return f't={timestamp},v1={_digest(body, secret, timestamp)}'
+
+def verify_signature(body, header, secrets=None, tolerance=None):
+    """Confere a assinatura e se ela é recente (uma requisição capturada não pode ser reenviada depois)"""
+    secrets = get_webhook_secrets() if secrets is None else secrets
+    if tolerance is None:
+        tolerance = getattr(settings, 'FIREBASE_WEBHOOK_TOLERANCE', DEFAULT_SIGNATURE_TOLERANCE)
+    
+    parts = dict(item.strip().split('=', 1) for item in (header or '').split(',') if '=' in item)
+    try:
+        timestamp = int(parts.get('t', ''))
+    except ValueError:
+        return False
+    signature = parts.get('v1', '')
+    if not signature or abs(time.time() - timestamp) > tolerance:
+        return False
+    return any(hmac.compare_digest(_digest(body, secret, timestamp), signature) for secret in secrets)
+
+def _parse_isoformat(value):
+    """datetime.fromisoformat para horários RFC 3339 também no Python 3.10.
+    
+    Antes do 3.11 ele não aceita o sufixo "Z" nem frações de segundo com
+    outra quantidade de dígitos que 3 ou 6 (o Cloud Functions manda até 9).
+    """
+    if value[-1:] in ('Z', 'z'):
+        value = value[:-1] + '+00:00'
+    value = FRACTION_RE.sub(lambda match: '.' + match.group(1)[:6].ljust(6, '0'), value, count=1)
+    return datetime.fromisoformat(value)
+
+def _timestamp_ms(value):
+    """Aceita ms ou s desde epoch, ISO 8601 ou o formato RFC 1123 dos metadados do UserRecord"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value if value > 1e12 else value * 1000)
+    if not isinstance(value, str):
+        raise InvalidEvent(f'Horário inválido: {value!r}')
+    
+    try:
+        moment = _parse_isoformat(value)
+    except ValueError:
+        try:
+            moment = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            raise InvalidEvent(f'Horário inválido: {value!r}')
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+def _field(data, *names):
+    for name in names:
+        if name in data:
+            return data[name]
+    return None
+
+def _parse_event(raw):
+    if not isinstance(raw, dict):
+        raise InvalidEvent('Cada evento deve ser um objeto')
+    
+    event_id = raw.get('id')
+    if not isinstance(event_id, str) or not event_id or len(event_id) > 128:
+        raise InvalidEvent('Evento sem "id" válido')
+    event_type = EVENT_TYPES.get(raw.get('type'))
+    if event_type is None:
+        raise InvalidEvent(f'Tipo de evento desconhecido: {raw.get("type")!r}')
+    data = raw.get('data')
+    if not isinstance(data, dict) or not isinstance(data.get('uid'), str) or not data['uid']:
+        raise InvalidEvent(f'Evento {event_id} sem "data.uid"')
+    
+    metadata = data.get('metadata') or {}
+    record = FirebaseUserRecord(
+        data['uid'],
+        data.get('email'),
+        bool(_field(data, 'emailVerified', 'email_verified')),
+        _field(data, 'displayName', 'display_name'),
+        _timestamp_ms(_field(metadata, 'creationTime', 'creation_timestamp')),
+        _timestamp_ms(_field(metadata, 'lastRefreshTime', 'last_refresh_timestamp')),
+        _timestamp_ms(_field(metadata, 'lastSignInTime', 'last_sign_in_timestamp')),
+    )
+    return {
+        'event_id': event_id,
+        'event_type': event_type,
+        'firebase_uid': record.uid,
+        'event_time': _timestamp_ms(raw.get('time')) or int(time.time() * 1000),
+        'payload': record.to_dict(),
+    }
+
+def parse_events(body):
+    """Eventos do corpo da requisição: um evento, uma lista ou {"events": [...]}. Levanta InvalidEvent"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise InvalidEvent('JSON inválido')
+    
+    if isinstance(data, dict):
+        data = data['events'] if 'events' in data else [data]
+    if not isinstance(data, list) or not data:
+        raise InvalidEvent('Nenhum evento na requisição')
+    if len(data) > MAX_EVENTS_PER_REQUEST:
+        raise InvalidEvent(f'No máximo {MAX_EVENTS_PER_REQUEST} eventos por requisição')
+    return [_parse_event(raw) for raw in data]
+
+def store_events(events):
+    """Enfileira os eventos ainda não vistos (pelo event_id). Retorna (aceitos, duplicados)"""
+    unique = {}
+    for event in events:
+        unique.setdefault(event['event_id'], event)
+    
+    existing = set(
+        FirebaseUserEvent.objects.filter(event_id__in=list(unique)).values_list('event_id', flat=True)
+    )
+    new = [FirebaseUserEvent(**event) for event_id, event in unique.items() if event_id not in existing]
+    # ignore_conflicts cobre o mesmo evento chegando em duas requisições ao mesmo tempo
+    FirebaseUserEvent.objects.bulk_create(new, ignore_conflicts=True)
+    
+    duplicates = len(events) - len(new)
+    record_user_events('received', len(new))
+    record_user_events('duplicate', duplicates)
+    return len(new), duplicates
+
+def _mark_failed(events, reason):
+    """Adia os eventos de um UID que não foi gravado; depois de FIREBASE_EVENTS_MAX_ATTEMPTS eles ficam como falha"""
+    max_attempts = getattr(settings, 'FIREBASE_EVENTS_MAX_ATTEMPTS', DEFAULT_EVENTS_MAX_ATTEMPTS)
+    attempts = max(event.attempts for event in events) + 1
+    ids = [event.id for event in events]
+    
+    FirebaseUserEvent.objects.filter(id__in=ids).update(
+        attempts=F('attempts') + 1,
+        next_attempt_at=timezone.now() + timedelta(seconds=get_backoff_delay(attempts)),
+        last_error=str(reason)[:2000],
+    )
+    FirebaseUserEvent.objects.filter(id__in=ids, attempts__gte=max_attempts).update(
+        status=FirebaseUserEvent.STATUS_FAILED,
+    )
+    if attempts >= max_attempts:
+        logger.error(f"❌ Desistindo dos eventos de {events[0].firebase_uid} após {attempts} tentativas: {reason}")
+
+def _apply_latest(latest):
+    """Grava o estado final de cada UID ({uid: último evento}). Retorna {uid: erro} dos que não foram gravados"""
+    upserts = [
+        FirebaseUserRecord(**event.payload)
+        for event in latest.values()
+        if event.event_type != FirebaseUserEvent.TYPE_DELETED
+    ]
+    deleted_uids = [
+        uid for uid, event in latest.items()
+        if event.event_type == FirebaseUserEvent.TYPE_DELETED
+    ]
+    
+    errors = {}
+    with suppress_firebase_sync():
+        if upserts:
+            reconcile_firebase_users(upserts, errors=errors)
+        if deleted_uids:
+            CustomUser.objects.filter(firebase_uid__in=deleted_uids).delete()
+    return errors
+
+def _apply_isolated(latest):
+    """Depois de uma falha do lote inteiro, aplica UID a UID para que um usuário problemático não trave os demais"""
+    errors = {}
+    for uid, event in latest.items():
+        try:
+            errors.update(_apply_latest({uid: event}))
+        except Exception as e:
+            errors[uid] = e
+    return errors
+
+def process_events(batch_size=None):
+    """Aplica no banco os eventos pendentes de até `batch_size` UIDs.
+    
+    Os eventos de cada UID são aplicados em ordem de event_time e só o estado
+    final de cada usuário é gravado (reconcile_firebase_users ou delete).
+    Eventos mais antigos que o último já aplicado para o UID chegaram fora de
+    ordem e são descartados. As gravações não voltam para a outbox. Os eventos
+    de um UID que não foi gravado voltam com backoff, sem afetar os outros UIDs.
+    Só um processo aplica eventos por vez (lease 'firebase-events'); se outro já
+    estiver aplicando, levanta SyncLeaseUnavailable. Retorna (processados, falhas).
+    """
+    batch_size = get_events_batch_size(batch_size)
+    
+    with SyncLease(name=EVENTS_LEASE_NAME) as lease:
+        pending = FirebaseUserEvent.objects.filter(status=FirebaseUserEvent.STATUS_PENDING)
+        uids = list(
+            pending.filter(next_attempt_at__lte=timezone.now())
+            .order_by('firebase_uid')
+            .values_list('firebase_uid', flat=True)
+            .distinct()[:batch_size]
+        )
+        if not uids:
+            return 0, 0
+        
+        # Também os eventos ainda em espera do mesmo UID, para não aplicar fora de ordem
+        events = list(pending.filter(firebase_uid__in=uids).order_by('event_time', 'id'))
+        applied_until = dict(
+            FirebaseUserEvent.objects.filter(firebase_uid__in=uids, status=FirebaseUserEvent.STATUS_PROCESSED)
+            .order_by()
+            .values('firebase_uid')
+            .annotate(latest=Max('event_time'))
+            .values_list('firebase_uid', 'latest')
+        )
+        
+        by_uid = {}
+        latest = {}
+        stale_events = []
+        for event in events:
+            by_uid.setdefault(event.firebase_uid, []).append(event)
+            if event.event_time < applied_until.get(event.firebase_uid, event.event_time):
+                stale_events.append(event)
+            else:
+                latest[event.firebase_uid] = event
+        
+        lease.check()
+        try:
+            errors = _apply_latest(latest)
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao aplicar {len(latest)} UIDs de uma vez, aplicando um a um: {e}")
+            errors = _apply_isolated(latest)
+        
+        for uid, error in errors.items():
+            _mark_failed(by_uid[uid], error)
+        
+        done = [event for event in events if event.firebase_uid not in errors]
+        stale = sum(1 for event in stale_events if event.firebase_uid not in errors)
+        FirebaseUserEvent.objects.filter(id__in=[event.id for event in done]).update(
+            status=FirebaseUserEvent.STATUS_PROCESSED,
+            processed_at=timezone.now(),
+        )
+    
+    if stale:
+        logger.info(f"⏭️  {stale} eventos fora de ordem descartados")
+    if errors:
+        logger.error(f"❌ Eventos de {len(errors)} UIDs não aplicados, nova tentativa com backoff")
+    failed = len(events) - len(done)
+    record_user_events('applied', len(done) - stale)
+    record_user_events('stale', stale)
+    record_user_events('failed', failed)
+    return len(done), failed
+
+def purge_processed_events(retention_days=None):
+    """Remove eventos processados há mais de `retention_days` dias (a janela em que reenvios são detectados)"""
+    if retention_days is None:
+        retention_days = getattr(settings, 'FIREBASE_EVENTS_RETENTION_DAYS', DEFAULT_EVENTS_RETENTION_DAYS)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = FirebaseUserEvent.objects.filter(
+        status=FirebaseUserEvent.STATUS_PROCESSED,
+        processed_at__lt=cutoff,
+    ).delete()
+    return deleted
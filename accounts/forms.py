@@ -1,6 +1,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from .models import normalize_email
 
 User = get_user_model()
 
@@ -45,7 +46,7 @@ class RegisterForm(forms.Form):
     
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
+        if User.objects.filter(email_normalized=normalize_email(email)).exists():
             raise ValidationError('Este email já está cadastrado.')
         return email
     
@@ -0,0 +1,300 @@
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from .circuit import get_breaker
+from .metrics import record_identity_toolkit_request
+from urllib3.util.retry import Retry
+import asyncio
+import requests
+import os
+import threading
+import time
+import weakref
+
+IDENTITY_TOOLKIT_URL = 'https://identitytoolkit.googleapis.com/v1'
+SECURE_TOKEN_URL = 'https://securetoken.googleapis.com/v1'
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_ASYNC_POOL_MAXSIZE = 100
+DEFAULT_RETRIES = 2
+DEFAULT_TOTAL_TIMEOUT = 15
+
+# Respostas em que a requisição não foi processada e pode ser repetida com segurança
+RETRY_STATUS_CODES = (502, 503, 504)
+
+class BaseIdentityToolkitClient:
+    """Configuração e contadores comuns aos clientes síncrono e assíncrono"""
+    
+    def __init__(self, base_url=None, api_key=None, connect_timeout=None, read_timeout=None, retries=None,
+                 secure_token_url=None, total_timeout=None):
+        self.base_url = (base_url or getattr(settings, 'FIREBASE_IDENTITY_TOOLKIT_URL', IDENTITY_TOOLKIT_URL)).rstrip('/')
+        self.secure_token_url = (
+            secure_token_url or getattr(settings, 'FIREBASE_SECURE_TOKEN_URL', SECURE_TOKEN_URL)
+        ).rstrip('/')
+        self.api_key = api_key if api_key is not None else settings.FIREBASE_CONFIG['apiKey']
+        self.connect_timeout = connect_timeout or getattr(settings, 'FIREBASE_HTTP_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = read_timeout or getattr(settings, 'FIREBASE_HTTP_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)
+        self.retries = retries if retries is not None else getattr(settings, 'FIREBASE_HTTP_RETRIES', DEFAULT_RETRIES)
+        self.total_timeout = total_timeout or getattr(settings, 'FIREBASE_HTTP_TOTAL_TIMEOUT', DEFAULT_TOTAL_TIMEOUT)
+        
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._retries = 0
+        self._latency_total = 0.0
+    
+    def _record(self, path, status, latency, error=False, retried=False):
+        record_identity_toolkit_request(path, status, latency)
+        with self._lock:
+            self._requests += 1
+            self._latency_total += latency
+            self._errors += error
+            self._retries += retried
+    
+    def _attempt_timeouts(self, deadline):
+        """Timeouts (conexão, leitura) da próxima tentativa, limitados ao que resta do prazo total"""
+        remaining = max(deadline - time.monotonic(), 0.001)
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+    
+    def _retry_delay(self, attempt, attempts, deadline):
+        """Espera antes da próxima tentativa, ou None se as tentativas ou o prazo total acabaram"""
+        if attempt >= attempts - 1:
+            return None
+        delay = 0.1 * 2 ** attempt
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+    
+    def _record_outcome(self, breaker, response):
+        # 5xx depois das novas tentativas conta como falha do serviço; 4xx é resposta normal (senha errada etc.)
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    
+    def stats(self):
+        """Contadores do processo: requisições, erros, novas tentativas e latência"""
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'errors': self._errors,
+                'retries': self._retries,
+                'latency_total': self._latency_total,
+                'latency_avg': self._latency_total / self._requests if self._requests else 0.0,
+            }
+
+class IdentityToolkitClient(BaseIdentityToolkitClient):
+    """Cliente HTTP com pool de conexões (keep-alive) para a API Identity Toolkit.
+    
+    Falhas de conexão são repetidas em qualquer chamada, pois a requisição nunca
+    chegou ao servidor. Timeouts de leitura e respostas 502/503/504 só são
+    repetidos nas chamadas idempotentes (login). Todas as tentativas de uma
+    chamada cabem em FIREBASE_HTTP_TOTAL_TIMEOUT: cada uma usa só o que resta do
+    prazo e não há nova tentativa depois dele.
+    """
+    
+    def __init__(self, pool_maxsize=None, **kwargs):
+        super().__init__(**kwargs)
+        pool_maxsize = pool_maxsize or getattr(settings, 'FIREBASE_HTTP_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)
+        
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(total=None, connect=self.retries, read=0, redirect=0, status=0, other=0),
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def post(self, path, data, idempotent=False, base_url=None, form=False):
+        """Faz o POST (JSON, ou form-urlencoded com form=True) e retorna a resposta; exceções de rede são propagadas.
+        
+        Com o circuito do endpoint aberto levanta CircuitOpenError sem fazer a requisição.
+        """
+        breaker = get_breaker(path)
+        breaker.before_call()
+        try:
+            response = self._post(path, data, idempotent, base_url, form)
+        except requests.exceptions.RequestException:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        self._record_outcome(breaker, response)
+        return response
+    
+    def _post(self, path, data, idempotent, base_url, form):
+        url = f"{base_url or self.base_url}/{path}"
+        body = {'data': data} if form else {'json': data}
+        attempts = 1 + (self.retries if idempotent else 0)
+        deadline = time.monotonic() + self.total_timeout
+        
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                response = self.session.post(
+                    url, params={'key': self.api_key}, timeout=self._attempt_timeouts(deadline), **body
+                )
+            except requests.exceptions.ReadTimeout:
+                retry = self._retry_delay(attempt, attempts, deadline) is not None
+                self._record(path, 'timeout', time.perf_counter() - started, error=True, retried=retry)
+                if not retry:
+                    raise
+                continue
+            except requests.exceptions.RequestException:
+                self._record(path, 'error', time.perf_counter() - started, error=True)
+                raise
+            
+            delay = self._retry_delay(attempt, attempts, deadline) if response.status_code in RETRY_STATUS_CODES else None
+            self._record(
+                path, response.status_code, time.perf_counter() - started,
+                error=response.status_code >= 500, retried=delay is not None,
+            )
+            if delay is None:
+                return response
+            time.sleep(delay)
+    
+    def sign_in_with_password(self, email, password):
+        data = {'email': email, 'password': password, 'returnSecureToken': True}
+        return self.post('accounts:signInWithPassword', data, idempotent=True)
+    
+    def sign_up(self, email, password):
+        data = {'email': email, 'password': password, 'returnSecureToken': True}
+        return self.post('accounts:signUp', data)
+    
+    def refresh_id_token(self, refresh_token):
+        """Troca o refresh token por um ID token novo no endpoint securetoken"""
+        data = {'grant_type': 'refresh_token', 'refresh_token': refresh_token}
+        return self.post('token', data, idempotent=True, base_url=self.secure_token_url, form=True)
+    
+    def stats(self):
+        """Inclui quantas conexões foram abertas e quantas requisições reaproveitaram uma conexão"""
+        opened = sent = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+        
+        stats = super().stats()
+        stats['connections_opened'] = opened
+        stats['connections_reused'] = max(sent - opened, 0)
+        return stats
+    
+    def close(self):
+        self.session.close()
+
+class AsyncIdentityToolkitClient(BaseIdentityToolkitClient):
+    """Versão assíncrona (httpx) do cliente, para as views servidas via ASGI"""
+    
+    def __init__(self, pool_maxsize=None, **kwargs):
+        # httpx só é importado quando há views assíncronas (ASGI)
+        import httpx
+        
+        super().__init__(**kwargs)
+        pool_maxsize = pool_maxsize or getattr(settings, 'FIREBASE_HTTP_ASYNC_POOL_MAXSIZE', DEFAULT_ASYNC_POOL_MAXSIZE)
+        limits = httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize)
+        
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            transport=httpx.AsyncHTTPTransport(retries=self.retries, limits=limits),
+        )
+    
+    async def post(self, path, data, idempotent=False, base_url=None, form=False):
+        import httpx
+        
+        breaker = get_breaker(path)
+        breaker.before_call()
+        try:
+            response = await self._post(path, data, idempotent, base_url, form)
+        except httpx.HTTPError:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        self._record_outcome(breaker, response)
+        return response
+    
+    async def _post(self, path, data, idempotent, base_url, form):
+        import httpx
+        
+        url = f"{base_url or self.base_url}/{path}"
+        body = {'data': data} if form else {'json': data}
+        attempts = 1 + (self.retries if idempotent else 0)
+        deadline = time.monotonic() + self.total_timeout
+        
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            connect_timeout, read_timeout = self._attempt_timeouts(deadline)
+            try:
+                response = await self.client.post(
+                    url,
+                    params={'key': self.api_key},
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    **body,
+                )
+            except httpx.ReadTimeout:
+                retry = self._retry_delay(attempt, attempts, deadline) is not None
+                self._record(path, 'timeout', time.perf_counter() - started, error=True, retried=retry)
+                if not retry:
+                    raise
+                continue
+            except httpx.HTTPError:
+                self._record(path, 'error', time.perf_counter() - started, error=True)
+                raise
+            
+            delay = self._retry_delay(attempt, attempts, deadline) if response.status_code in RETRY_STATUS_CODES else None
+            self._record(
+                path, response.status_code, time.perf_counter() - started,
+                error=response.status_code >= 500, retried=delay is not None,
+            )
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+    
+    async def sign_in_with_password(self, email, password):
+        data = {'email': email, 'password': password, 'returnSecureToken': True}
+        return await self.post('accounts:signInWithPassword', data, idempotent=True)
+    
+    async def sign_up(self, email, password):
+        data = {'email': email, 'password': password, 'returnSecureToken': True}
+        return await self.post('accounts:signUp', data)
+    
+    async def refresh_id_token(self, refresh_token):
+        data = {'grant_type': 'refresh_token', 'refresh_token': refresh_token}
+        return await self.post('token', data, idempotent=True, base_url=self.secure_token_url, form=True)
+    
+    async def aclose(self):
+        await self.client.aclose()
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_identity_toolkit_client():
+    """Cliente compartilhado pelo processo; recriado após um fork (ex.: workers do gunicorn)"""
+    global _client, _client_pid
+    
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = IdentityToolkitClient()
+                _client_pid = os.getpid()
+    return _client
+
+# Conexões do httpx pertencem ao event loop (e ao processo) em que foram abertas: um cliente por loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_async_identity_toolkit_client():
+    """Cliente do event loop atual; recriado após um fork, que herda o loop mas não as conexões"""
+    loop = asyncio.get_running_loop()
+    pid, client = _async_clients.get(loop, (None, None))
+    if client is None or pid != os.getpid():
+        client = AsyncIdentityToolkitClient()
+        _async_clients[loop] = (os.getpid(), client)
+    return client
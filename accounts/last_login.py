@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.db import connections
+from django.utils import timezone
+from .cache import user_cache
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_FLUSH_BATCH_SIZE = 500
+
+class LastLoginBuffer:
+    """Acumula os last_login em memória e grava todos num bulk_update periódico.
+    
+    Tira o UPDATE do caminho do login (e a trava de escrita do SQLite). Uma
+    thread grava o buffer a cada `interval` segundos, ou antes se ele juntar
+    um lote cheio (`batch_size`), e o processo grava o que restar ao sair; se ele morrer sem sair normalmente, perde no máximo os
+    últimos `interval` segundos de last_login. O bulk_update não dispara
+    post_save, então nada disso chega à outbox do Firebase.
+    """
+    
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._flusher = None
+    
+    def record(self, user, when=None):
+        when = when or timezone.now()
+        user.last_login = when
+        with self._lock:
+            previous = self._pending.get(user.pk)
+            if previous is None or previous < when:
+                self._pending[user.pk] = when
+            if self._flusher is None:
+                self._start_flusher()
+            if len(self._pending) >= self._batch_size():
+                self._wake.set()
+    
+    def on_user_logged_in(self, sender, user, **kwargs):
+        self.record(user)
+    
+    @property
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+    
+    def _batch_size(self):
+        return self.batch_size or getattr(settings, 'FIREBASE_LAST_LOGIN_FLUSH_BATCH_SIZE', DEFAULT_FLUSH_BATCH_SIZE)
+    
+    def _start_flusher(self):
+        interval = self.interval
+        if interval is None:
+            interval = getattr(settings, 'FIREBASE_LAST_LOGIN_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        self._stop.clear()
+        self._wake.clear()
+        self._flusher = threading.Thread(
+            target=self._flush_loop,
+            args=(max(0.1, float(interval)),),
+            name='last-login-flusher',
+            daemon=True,
+        )
+        self._flusher.start()
+    
+    def _flush_loop(self, interval):
+        try:
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                self.flush()
+        finally:
+            connections.close_all()
+    
+    def flush(self):
+        """Grava o buffer com bulk_update; se falhar, as entradas voltam para a próxima rodada"""
+        from .models import CustomUser
+        
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        
+        users = [CustomUser(pk=pk, last_login=when) for pk, when in pending.items()]
+        try:
+            CustomUser.objects.bulk_update(users, ['last_login'], batch_size=self._batch_size())
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar {len(pending)} last_login: {e}")
+            with self._lock:
+                for pk, when in pending.items():
+                    newer = self._pending.get(pk)
+                    if newer is None or newer < when:
+                        self._pending[pk] = when
+            return 0
+        
+        # O usuário da sessão vem do cache: sem isso um save() posterior regravaria o last_login antigo
+        user_cache.invalidate_pks(list(pending))
+        return len(pending)
+    
+    def stop(self):
+        """Para a thread e grava o que restou"""
+        with self._lock:
+            flusher, self._flusher = self._flusher, None
+        self._stop.set()
+        self._wake.set()
+        if flusher is not None:
+            flusher.join()
+        self.flush()
+
+last_login_buffer = LastLoginBuffer()
+
+def install_last_login_buffer(buffer=last_login_buffer):
+    """Troca o update_last_login síncrono do Django pelo buffer (FIREBASE_LAST_LOGIN_WRITE_BEHIND)"""
+    user_logged_in.disconnect(dispatch_uid='update_last_login')
+    user_logged_in.connect(buffer.on_user_logged_in, dispatch_uid='buffered_last_login', weak=False)
+    atexit.register(buffer.stop)
+
+def uninstall_last_login_buffer(buffer=last_login_buffer):
+    user_logged_in.disconnect(dispatch_uid='buffered_last_login')
+    user_logged_in.connect(update_last_login, dispatch_uid='update_last_login')
+    atexit.unregister(buffer.stop)
+    buffer.stop()
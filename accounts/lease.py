@@ -0,0 +1,126 @@
+from .models import FirebaseSyncLease
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import os
+import socket
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SYNC_LEASE_NAME = 'firebase-sync'
+DEFAULT_LEASE_TTL = 60
+
+class SyncLeaseUnavailable(Exception):
+    """Outro processo detém o lease da sincronização"""
+
+class SyncLeaseLost(Exception):
+    """O lease expirou ou foi tomado por outro processo no meio da sincronização"""
+
+def get_lease_ttl(ttl=None):
+    if ttl is None:
+        ttl = getattr(settings, 'FIREBASE_SYNC_LEASE_TTL', DEFAULT_LEASE_TTL)
+    return max(1, int(ttl))
+
+def lease_owner_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+class SyncLease:
+    """Lease no banco que garante uma única sincronização por vez em todo o cluster.
+    
+    A aquisição é um UPDATE condicional (livre, expirado ou já nosso), então só
+    um processo vence mesmo com vários tentando ao mesmo tempo. Enquanto o lease
+    é mantido, uma thread renova a expiração a cada ttl/3; se o processo morrer,
+    o lease expira sozinho depois de `ttl` segundos. Relógios dos nós devem
+    estar sincronizados com folga bem menor que o ttl.
+    """
+    
+    def __init__(self, name=SYNC_LEASE_NAME, ttl=None, owner=None):
+        self.name = name
+        self.ttl = get_lease_ttl(ttl)
+        self.owner = owner or lease_owner_id()
+        self.held = False
+        self._lost = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat = None
+    
+    def _claim(self, now, takeover):
+        queryset = FirebaseSyncLease.objects.filter(name=self.name)
+        if takeover:
+            queryset = queryset.filter(Q(owner='') | Q(owner=self.owner) | Q(expires_at__lte=now))
+        else:
+            queryset = queryset.filter(owner=self.owner)
+        
+        changes = {'heartbeat_at': now, 'expires_at': now + timedelta(seconds=self.ttl)}
+        if takeover:
+            changes.update(owner=self.owner, acquired_at=now)
+        return queryset.update(**changes) == 1
+    
+    def acquire(self):
+        """Adquire o lease ou levanta SyncLeaseUnavailable"""
+        FirebaseSyncLease.objects.get_or_create(name=self.name)
+        if not self._claim(timezone.now(), takeover=True):
+            holder = FirebaseSyncLease.objects.filter(name=self.name).values_list('owner', flat=True).first()
+            raise SyncLeaseUnavailable(f'Sincronização já em andamento em {holder}')
+        
+        self.held = True
+        self._lost.clear()
+        self._stop.clear()
+        self._heartbeat = threading.Thread(
+            target=self._heartbeat_loop,
+            name=f'{self.name}-lease-heartbeat',
+            daemon=True,
+        )
+        self._heartbeat.start()
+        logger.debug(f"🔒 Lease {self.name} adquirido por {self.owner}")
+        return self
+    
+    def _heartbeat_loop(self):
+        try:
+            while not self._stop.wait(self.ttl / 3):
+                try:
+                    renewed = self._claim(timezone.now(), takeover=False)
+                except Exception as e:
+                    # Falha passageira no banco: tenta de novo até o lease expirar
+                    logger.warning(f"⚠️ Erro ao renovar o lease {self.name}: {e}")
+                    continue
+                if not renewed:
+                    logger.error(f"❌ Lease {self.name} perdido por {self.owner}")
+                    self._lost.set()
+                    return
+        finally:
+            connections.close_all()
+    
+    @property
+    def lost(self):
+        return self._lost.is_set()
+    
+    def check(self):
+        """Levanta SyncLeaseLost se o lease não é mais nosso; chame antes de cada etapa que grava"""
+        if self._lost.is_set():
+            raise SyncLeaseLost(f'Lease {self.name} perdido por {self.owner}')
+    
+    def release(self):
+        if not self.held:
+            return
+        self.held = False
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        FirebaseSyncLease.objects.filter(name=self.name, owner=self.owner).update(
+            owner='',
+            expires_at=timezone.now(),
+        )
+        logger.debug(f"🔓 Lease {self.name} liberado por {self.owner}")
+    
+    def __enter__(self):
+        return self.acquire()
+    
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
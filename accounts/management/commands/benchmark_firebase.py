@@ -0,0 +1,233 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from datetime import datetime, timezone
+import argparse
+import django
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+DEFAULT_OUTPUT = 'benchmark_results.jsonl'
+DEFAULT_SIZES = '10000,100000,1000000'
+
+class Command(BaseCommand):
+    help = 'Mede a sincronização e o login contra fakes locais do Firebase e grava os resultados em JSON Lines'
+    
+    def add_arguments(self, parser):
+        from accounts.benchmarks.runner import SCENARIOS
+        
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=sorted(SCENARIOS),
+            help='Cenário a rodar (pode repetir; padrão: todos)',
+        )
+        parser.add_argument(
+            '--sizes',
+            default=DEFAULT_SIZES,
+            help=f'Quantidades de usuários sintéticos (sync e memory), separadas por vírgula (padrão: {DEFAULT_SIZES})',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=None,
+            help='Usuários por página do list_users na sincronização',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Linhas por lote de bulk_create/bulk_update na sincronização',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Threads de escrita da sincronização (0 = sequencial; padrão: FIREBASE_SYNC_WORKERS)',
+        )
+        parser.add_argument(
+            '--queue-depth',
+            type=int,
+            default=None,
+            help='Lotes por fila de escrita na sincronização em pipeline',
+        )
+        parser.add_argument(
+            '--admin-latency',
+            type=float,
+            default=0.0,
+            help='Latência simulada (ms) em cada página do list_users do fake do Admin SDK',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Total de POSTs em /login/',
+        )
+        parser.add_argument(
+            '--login-users',
+            type=int,
+            default=500,
+            help='Emails distintos usados no login (os demais POSTs são logins repetidos)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Threads fazendo login ao mesmo tempo',
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Latência simulada (ms) em cada resposta do stub da Identity Toolkit',
+        )
+        parser.add_argument(
+            '--write-behind',
+            action='store_true',
+            help='No login, grava o last_login pelo buffer em lote (FIREBASE_LAST_LOGIN_WRITE_BEHIND)',
+        )
+        parser.add_argument(
+            '--startup-runs',
+            type=int,
+            default=5,
+            help='Processos novos por medição de partida a frio (manage.py check e boot do worker)',
+        )
+        parser.add_argument(
+            '--output',
+            default=DEFAULT_OUTPUT,
+            help=f'Arquivo JSON Lines onde os resultados são acrescentados (padrão: {DEFAULT_OUTPUT}; "-" para não gravar)',
+        )
+        parser.add_argument(
+            '--in-process',
+            action='store_true',
+            help='Roda tudo no próprio processo (o pico de memória passa a ser acumulado entre cenários)',
+        )
+        parser.add_argument('--run-job', help=argparse.SUPPRESS)
+        parser.add_argument('--job-result', help=argparse.SUPPRESS)
+    
+    def handle(self, *args, **options):
+        if options['run_job']:
+            return self.run_child(options)
+        
+        jobs = self.build_jobs(options)
+        results = []
+        for name, params in jobs:
+            self.stdout.write(f'⏱️  {name} {json.dumps(params)}')
+            if options['in_process']:
+                from accounts.benchmarks.runner import run_scenario
+                metrics = run_scenario(name, **params)
+            else:
+                metrics = self.run_in_subprocess(name, params)
+            
+            record = self.build_record(name, params, metrics)
+            results.append(record)
+            self.stdout.write(self.style.SUCCESS(f'✅ {name}: {self.summarize(metrics)}'))
+        
+        if options['output'] != '-':
+            with open(options['output'], 'a', encoding='utf-8') as output:
+                for record in results:
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.stdout.write(f'📊 {len(results)} resultados acrescentados em {options["output"]}')
+    
+    def build_jobs(self, options):
+        scenarios = options['scenario'] or ['startup', 'sync', 'memory', 'login']
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes deve ser uma lista de inteiros separados por vírgula')
+        
+        jobs = []
+        for name in scenarios:
+            if name == 'sync':
+                for size in sizes:
+                    jobs.append((name, {
+                        'users': size,
+                        'page_size': options['page_size'],
+                        'batch_size': options['batch_size'],
+                        'workers': options['workers'],
+                        'queue_depth': options['queue_depth'],
+                        'admin_latency': options['admin_latency'] / 1000,
+                    }))
+            elif name == 'memory':
+                for size in sizes:
+                    jobs.append((name, {'users': size, 'page_size': options['page_size']}))
+            elif name == 'login':
+                jobs.append((name, {
+                    'requests': options['requests'],
+                    'users': options['login_users'],
+                    'concurrency': options['concurrency'],
+                    'latency': options['latency'] / 1000,
+                    'write_behind': options['write_behind'],
+                }))
+            elif name == 'startup':
+                jobs.append((name, {'runs': options['startup_runs']}))
+            else:
+                jobs.append((name, {}))
+        return jobs
+    
+    def run_in_subprocess(self, name, params):
+        """Um processo por cenário, para que o pico de RSS seja só daquele cenário"""
+        fd, result_path = tempfile.mkstemp(prefix='firebase-bench-', suffix='.json')
+        os.close(fd)
+        try:
+            command = [
+                sys.executable, '-m', 'django', 'benchmark_firebase',
+                '--run-job', json.dumps({'scenario': name, 'params': params}),
+                '--job-result', result_path,
+            ]
+            completed = subprocess.run(command, cwd=settings.BASE_DIR, env=os.environ.copy())
+            if completed.returncode != 0:
+                raise CommandError(f'Cenário {name} falhou (código {completed.returncode})')
+            with open(result_path, encoding='utf-8') as result:
+                return json.load(result)
+        finally:
+            os.remove(result_path)
+    
+    def run_child(self, options):
+        from accounts.benchmarks.runner import run_scenario
+        
+        job = json.loads(options['run_job'])
+        metrics = run_scenario(job['scenario'], **job['params'])
+        with open(options['job_result'], 'w', encoding='utf-8') as result:
+            json.dump(metrics, result)
+    
+    def build_record(self, name, params, metrics):
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'scenario': name,
+            'params': params,
+            'metrics': metrics,
+            'environment': {
+                'git_commit': get_git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'platform': platform.platform(),
+            },
+        }
+    
+    def summarize(self, metrics):
+        keys = (
+            'initial_users_per_sec', 'resync_users_per_sec', 'incremental_seconds',
+            'requests_per_sec', 'p50_ms', 'p99_ms', 'errors',
+            'check_p50_ms', 'worker_boot_p50_ms', 'firebase_admin_loaded_at_boot',
+            'dict_bytes_per_user', 'record_bytes_per_user', 'memory_reduction', 'peak_rss_mb',
+        )
+        return ', '.join(f'{key}={metrics[key]}' for key in keys if key in metrics)
+
+def get_git_commit():
+    try:
+        completed = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() or None
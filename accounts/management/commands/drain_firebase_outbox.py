@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from accounts.lease import SyncLeaseUnavailable
+from accounts.outbox import drain_outbox
+import time
+
+class Command(BaseCommand):
+    help = 'Envia ao Firebase as alterações de usuários pendentes na outbox'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Quantidade máxima de usuários processados por rodada (padrão: 1000)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Continua rodando e verifica a outbox periodicamente',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Segundos de espera entre verificações quando a outbox está vazia (com --loop)',
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        while True:
+            total_sent = 0
+            total_failed = 0
+            
+            try:
+                while True:
+                    sent, failed = drain_outbox(limit=batch_size)
+                    total_sent += sent
+                    total_failed += failed
+                    if not sent and not failed:
+                        break
+            except SyncLeaseUnavailable as e:
+                self.stdout.write(self.style.WARNING(f'⏭️  {e}'))
+            
+            if total_sent or total_failed or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'✅ Outbox processada! Enviados: {total_sent}, Falhas: {total_failed}'
+                    )
+                )
+            
+            if not options['loop']:
+                return
+            
+            time.sleep(options['interval'])
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from accounts.events import process_events, purge_processed_events
+from accounts.lease import SyncLeaseUnavailable
+import time
+
+# Com --loop, eventos processados antigos são removidos a cada intervalo (s)
+PURGE_INTERVAL = 60 * 60
+
+class Command(BaseCommand):
+    help = 'Aplica no banco os eventos de usuário recebidos pelo webhook do Firebase'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Quantidade máxima de UIDs aplicados por rodada (padrão: FIREBASE_EVENTS_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Continua rodando e verifica a fila periodicamente',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Segundos de espera entre verificações quando a fila está vazia (com --loop)',
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_purge = 0.0
+        
+        while True:
+            total_processed = 0
+            total_failed = 0
+            
+            try:
+                while True:
+                    processed, failed = process_events(batch_size=batch_size)
+                    total_processed += processed
+                    total_failed += failed
+                    if not processed and not failed:
+                        break
+            except SyncLeaseUnavailable as e:
+                self.stdout.write(self.style.WARNING(f'⏭️  {e}'))
+            
+            if total_processed or total_failed or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'✅ Eventos processados! Aplicados: {total_processed}, Falhas: {total_failed}'
+                    )
+                )
+            
+            if time.monotonic() - last_purge >= PURGE_INTERVAL:
+                purged = purge_processed_events()
+                if purged:
+                    self.stdout.write(f'🗑️  {purged} eventos antigos removidos')
+                last_purge = time.monotonic()
+            
+            if not options['loop']:
+                return
+            
+            time.sleep(options['interval'])
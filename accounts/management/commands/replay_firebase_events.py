@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.events import SIGNATURE_HEADER, MAX_EVENTS_PER_REQUEST, get_webhook_secrets, sign_payload
+import json
+import requests
+import sys
+
+class Command(BaseCommand):
+    help = 'Reenvia eventos de usuário (JSON ou JSON Lines) ao webhook, assinados como o encaminhador faria'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            help='Arquivo com uma lista JSON de eventos ou um evento por linha; "-" lê da entrada padrão',
+        )
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000/firebase/events/',
+            help='Endereço do webhook (padrão: runserver local)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help=f'Eventos por requisição (máx. {MAX_EVENTS_PER_REQUEST})',
+        )
+        parser.add_argument(
+            '--secret',
+            default=None,
+            help='Segredo da assinatura (padrão: o primeiro de FIREBASE_WEBHOOK_SECRETS)',
+        )
+    
+    def _read_events(self, path):
+        if path == '-':
+            text = sys.stdin.read()
+        else:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+        
+        text = text.strip()
+        if text.startswith('['):
+            return json.loads(text)
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    
+    def handle(self, *args, **options):
+        secrets = [options['secret']] if options['secret'] else get_webhook_secrets()
+        if not secrets:
+            raise CommandError('Defina FIREBASE_WEBHOOK_SECRETS ou use --secret')
+        
+        try:
+            events = self._read_events(options['file'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f'❌ Não foi possível ler os eventos: {e}')
+        batch_size = max(1, min(options['batch_size'], MAX_EVENTS_PER_REQUEST))
+        accepted = duplicates = 0
+        
+        with requests.Session() as session:
+            for start in range(0, len(events), batch_size):
+                body = json.dumps({'events': events[start:start + batch_size]}).encode()
+                try:
+                    response = session.post(
+                        options['url'],
+                        data=body,
+                        headers={'Content-Type': 'application/json', SIGNATURE_HEADER: sign_payload(body, secrets[0])},
+                        timeout=(settings.FIREBASE_HTTP_CONNECT_TIMEOUT, settings.FIREBASE_HTTP_READ_TIMEOUT),
+                    )
+                except requests.RequestException as e:
+                    raise CommandError(f'❌ Erro de conexão com o webhook após {accepted + duplicates} eventos: {e}')
+                if response.status_code != 202:
+                    raise CommandError(f'❌ {response.status_code} do webhook: {response.text[:500]}')
+                result = response.json()
+                accepted += result['accepted']
+                duplicates += result['duplicates']
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {len(events)} eventos enviados! Aceitos: {accepted}, Duplicados: {duplicates}')
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from accounts.scheduler import SyncScheduler
+import signal
+
+class Command(BaseCommand):
+    help = 'Worker dedicado que sincroniza os usuários do Firebase periodicamente (um nó por rodada, via lease)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Segundos entre sincronizações (padrão: FIREBASE_SYNC_INTERVAL)',
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=None,
+            help='Variação aleatória do intervalo, como fração dele (padrão: FIREBASE_SYNC_JITTER)',
+        )
+        parser.add_argument(
+            '--now',
+            action='store_true',
+            help='Faz a primeira rodada imediatamente, sem o atraso inicial aleatório',
+        )
+    
+    def handle(self, *args, **options):
+        scheduler = SyncScheduler(
+            interval=options['interval'],
+            jitter=options['jitter'],
+            initial_delay=0 if options['now'] else None,
+        )
+        # SIGTERM (docker stop, systemd) termina a rodada atual e sai
+        signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+        
+        self.stdout.write(
+            f'⏰ Sincronização a cada {scheduler.interval:.0f}s (±{scheduler.jitter:.0%}); Ctrl+C para sair'
+        )
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('✅ Agendador encerrado'))
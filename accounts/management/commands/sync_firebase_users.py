@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from accounts.lease import SyncLeaseUnavailable
 from accounts.sync_utils import sync_firebase_users, update_existing_users, delete_orphaned_users
 
 class Command(BaseCommand):
@@ -20,11 +21,59 @@ class Command(BaseCommand):
             action='store_true',
             help='Deleta apenas usuários órfãos (que não existem no Firebase)',
         )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Força a varredura completa em vez da sincronização incremental',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=None,
+            help='Quantidade de usuários buscados por página no Firebase (máx. 1000)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Quantidade de linhas por lote de bulk_create/bulk_update (cada lote em sua própria transação)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Threads de escrita em paralelo com a busca das páginas (0 = sequencial)',
+        )
+        parser.add_argument(
+            '--queue-depth',
+            type=int,
+            default=None,
+            help='Máximo de lotes aguardando em cada fila de escrita antes de pausar a busca',
+        )
+        parser.add_argument(
+            '--delete-batch-size',
+            type=int,
+            default=None,
+            help='Quantidade máxima de usuários órfãos removidos por lote',
+        )
+        parser.add_argument(
+            '--max-orphan-ratio',
+            type=float,
+            default=None,
+            help='Cancela a remoção se a proporção de órfãos passar deste valor (ex.: 0.2)',
+        )
     
     def handle(self, *args, **options):
         force = options['force']
         update_existing_only = options['update_existing']
         delete_orphans_only = options['delete_orphans']
+        page_size = options['page_size']
+        batch_size = options['batch_size']
+        full = True if options['full'] else None
+        orphan_options = {
+            'delete_batch_size': options['delete_batch_size'],
+            'max_orphan_ratio': options['max_orphan_ratio'],
+        }
         
         from django.conf import settings
         if not force and not settings.DEBUG:
@@ -35,30 +84,40 @@ class Command(BaseCommand):
             )
             return
         
-        if delete_orphans_only:
-            self.stdout.write('🗑️  Deletando usuários órfãos...')
-            deleted = delete_orphaned_users()
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'✅ Deleção de órfãos concluída! '
-                    f'Usuários deletados: {deleted}'
+        try:
+            if delete_orphans_only:
+                self.stdout.write('🗑️  Deletando usuários órfãos...')
+                deleted = delete_orphaned_users(page_size=page_size, **orphan_options)
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'✅ Deleção de órfãos concluída! '
+                        f'Usuários deletados: {deleted}'
+                    )
                 )
-            )
-        elif update_existing_only:
-            self.stdout.write('🔄 Forçando atualização de dados antigos...')
-            updated = update_existing_users()
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'✅ Atualização de dados antigos concluída! '
-                    f'Usuários atualizados: {updated}'
+            elif update_existing_only:
+                self.stdout.write('🔄 Forçando atualização de dados antigos...')
+                updated = update_existing_users(page_size=page_size, batch_size=batch_size)
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'✅ Atualização de dados antigos concluída! '
+                        f'Usuários atualizados: {updated}'
+                    )
                 )
-            )
-        else:
-            self.stdout.write('🔄 Iniciando sincronização completa bidirecional...')
-            synced, created, updated, deleted = sync_firebase_users()
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'✅ Sincronização bidirecional concluída! '
-                    f'Total: {synced}, Criados: {created}, Atualizados: {updated}, Deletados: {deleted}'
+            else:
+                self.stdout.write('🔄 Iniciando sincronização bidirecional...')
+                synced, created, updated, deleted = sync_firebase_users(
+                    page_size=page_size,
+                    batch_size=batch_size,
+                    full=full,
+                    workers=options['workers'],
+                    queue_depth=options['queue_depth'],
+                    **orphan_options,
+                )
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'✅ Sincronização bidirecional concluída! '
+                        f'Total: {synced}, Criados: {created}, Atualizados: {updated}, Deletados: {deleted}'
+                    )
                 )
-            )
\ No newline at end of file
+        except SyncLeaseUnavailable as e:
+            self.stdout.write(self.style.WARNING(f'⏭️  {e}. Nada foi feito.'))
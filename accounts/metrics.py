@@ -0,0 +1,265 @@
+from django.conf import settings
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Segundos; cobre de uma chamada rápida à API até uma fase longa da sincronização
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class Metric:
+    type = None
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labelnames)
+    
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+    
+    def _samples(self):
+        raise NotImplementedError
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+class Counter(Metric):
+    type = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def _samples(self):
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in sorted(self._values.items())]
+
+class Gauge(Metric):
+    type = 'gauge'
+    
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def _samples(self):
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in sorted(self._values.items())]
+
+class Histogram(Metric):
+    type = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+    
+    def _samples(self):
+        lines = []
+        for key, (bucket_counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", str(bound))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{self._format_labels(key, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {total}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {count}')
+        return lines
+
+REGISTRY = []
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+ADMIN_CALLS = _register(Counter(
+    'firebase_admin_calls_total',
+    'Chamadas ao Firebase Admin SDK por operação e resultado',
+    ('operation', 'status'),
+))
+ADMIN_CALL_DURATION = _register(Histogram(
+    'firebase_admin_call_duration_seconds',
+    'Latência das chamadas ao Firebase Admin SDK',
+    ('operation',),
+))
+IDENTITY_TOOLKIT_REQUESTS = _register(Counter(
+    'firebase_identity_toolkit_requests_total',
+    'Requisições à API Identity Toolkit por endpoint e status HTTP (ou tipo de erro)',
+    ('endpoint', 'status'),
+))
+IDENTITY_TOOLKIT_DURATION = _register(Histogram(
+    'firebase_identity_toolkit_request_duration_seconds',
+    'Latência das requisições à API Identity Toolkit',
+    ('endpoint',),
+))
+RATELIMIT_REJECTIONS = _register(Counter(
+    'firebase_auth_rate_limited_total',
+    'Logins e cadastros recusados pelo limite de taxa antes de chegar à Identity Toolkit',
+    ('endpoint', 'scope'),
+))
+CIRCUIT_STATE = _register(Gauge(
+    'firebase_circuit_state',
+    'Estado do circuit breaker de cada endpoint do Firebase (0 = fechado, 1 = meio aberto, 2 = aberto)',
+    ('name',),
+))
+USER_EVENTS = _register(Counter(
+    'firebase_user_events_total',
+    'Eventos de usuário recebidos pelo webhook do Firebase, por resultado (received, duplicate, applied, stale, failed)',
+    ('result',),
+))
+SYNC_PHASE_DURATION = _register(Histogram(
+    'firebase_sync_phase_duration_seconds',
+    'Tempo gasto em cada fase da sincronização (fetch, diff, write, delete)',
+    ('phase',),
+))
+SYNC_RUNS = _register(Counter(
+    'firebase_sync_runs_total',
+    'Execuções da sincronização por modo e resultado',
+    ('mode', 'status'),
+))
+SYNC_USERS = _register(Counter(
+    'firebase_sync_users_total',
+    'Usuários criados, atualizados e removidos pela sincronização',
+    ('result',),
+))
+SYNC_LAST_SUCCESS = _register(Gauge(
+    'firebase_sync_last_success_timestamp_seconds',
+    'Horário (unix) da última sincronização concluída',
+    ('mode',),
+))
+
+_metrics_enabled = None
+_tracer = None
+
+def metrics_enabled():
+    global _metrics_enabled
+    if _metrics_enabled is None:
+        _metrics_enabled = bool(getattr(settings, 'FIREBASE_METRICS_ENABLED', False))
+    return _metrics_enabled
+
+def get_tracer():
+    """Tracer do OpenTelemetry, se FIREBASE_TRACING_ENABLED e o pacote estiver instalado; senão False"""
+    global _tracer
+    if _tracer is None:
+        _tracer = False
+        if getattr(settings, 'FIREBASE_TRACING_ENABLED', False):
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                logger.warning("⚠️ FIREBASE_TRACING_ENABLED ativo, mas o pacote opentelemetry-api não está instalado")
+            else:
+                _tracer = trace.get_tracer('accounts.firebase')
+    return _tracer
+
+class _NullTimer:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ('histogram', 'counter', 'labels', 'span_name', 'span', 'started')
+    
+    def __init__(self, histogram, counter, labels, span_name):
+        self.histogram = histogram
+        self.counter = counter
+        self.labels = labels
+        self.span_name = span_name
+        self.span = None
+    
+    def __enter__(self):
+        tracer = get_tracer()
+        if tracer:
+            self.span = tracer.start_as_current_span(self.span_name, attributes=self.labels)
+            self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.started
+        if metrics_enabled():
+            self.histogram.observe(elapsed, **self.labels)
+            if self.counter is not None:
+                self.counter.inc(status='error' if exc_type else 'ok', **self.labels)
+        if self.span is not None:
+            self.span.__exit__(exc_type, exc_value, traceback)
+        return False
+
+def _timer(histogram, counter, labels, span_name):
+    if not metrics_enabled() and not get_tracer():
+        return NULL_TIMER
+    return _Timer(histogram, counter, labels, span_name)
+
+def admin_call(operation):
+    """Mede uma chamada ao Admin SDK; exceções que atravessam o bloco contam como erro"""
+    return _timer(ADMIN_CALL_DURATION, ADMIN_CALLS, {'operation': operation}, f'firebase.admin.{operation}')
+
+def sync_phase(phase):
+    return _timer(SYNC_PHASE_DURATION, None, {'phase': phase}, f'firebase.sync.{phase}')
+
+def record_identity_toolkit_request(endpoint, status, latency):
+    if metrics_enabled():
+        IDENTITY_TOOLKIT_REQUESTS.inc(endpoint=endpoint, status=status)
+        IDENTITY_TOOLKIT_DURATION.observe(latency, endpoint=endpoint)
+
+def record_rate_limited(scope, endpoint):
+    if metrics_enabled():
+        RATELIMIT_REJECTIONS.inc(endpoint=endpoint, scope=scope)
+
+CIRCUIT_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+def record_circuit_state(name, state):
+    if metrics_enabled():
+        CIRCUIT_STATE.set(CIRCUIT_STATE_VALUES[state], name=name)
+
+def record_user_events(result, count=1):
+    if metrics_enabled() and count:
+        USER_EVENTS.inc(count, result=result)
+
+def record_sync_run(mode, status, created=0, updated=0, deleted=0):
+    if not metrics_enabled():
+        return
+    SYNC_RUNS.inc(mode=mode, status=status)
+    if status == 'ok':
+        SYNC_LAST_SUCCESS.set(time.time(), mode=mode)
+        SYNC_USERS.inc(created, result='created')
+        SYNC_USERS.inc(updated, result='updated')
+        SYNC_USERS.inc(deleted, result='deleted')
+
+def render_metrics():
+    """Todas as métricas do processo no formato de texto do Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
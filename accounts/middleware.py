@@ -0,0 +1,50 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from .backends import FirebaseTokenBackend
+
+class FirebaseTokenMiddleware:
+    """Autentica a requisição por um ID token do Firebase (header Authorization ou cookie).
+
+    Deve vir depois do AuthenticationMiddleware: quando o token é válido,
+    request.user é trocado antes que a sessão seja consultada.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.backend = FirebaseTokenBackend()
+        self.cookie_name = getattr(settings, 'FIREBASE_ID_TOKEN_COOKIE', 'firebase_id_token')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def get_token(self, request):
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            return header[len('Bearer '):].strip()
+        return request.COOKIES.get(self.cookie_name)
+    
+    def _set_user(self, request, user):
+        if user is not None:
+            request.user = user
+            request.firebase_claims = user.firebase_claims
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        token = self.get_token(request)
+        if token:
+            self._set_user(request, self.backend.authenticate(request, id_token=token))
+        return self.get_response(request)
+    
+    async def __acall__(self, request):
+        token = self.get_token(request)
+        if token:
+            user = await sync_to_async(self.backend.authenticate)(request, id_token=token)
+            self._set_user(request, user)
+            if user is not None:
+                async def auser():
+                    return user
+                request.auser = auser
+        return await self.get_response(request)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_customuser_options_customuser_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirebaseSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_id', models.CharField(max_length=128, unique=True, verbose_name='Projeto Firebase')),
+                ('watermark', models.BigIntegerField(blank=True, null=True, verbose_name="Marca d'água")),
+                ('last_sync_at', models.DateTimeField(blank=True, null=True, verbose_name='Última sincronização')),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True, verbose_name='Última sincronização completa')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Estado da sincronização',
+                'verbose_name_plural': 'Estados da sincronização',
+            },
+        ),
+    ]
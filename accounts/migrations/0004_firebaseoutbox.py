@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_firebasesyncstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirebaseOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firebase_uid', models.CharField(max_length=128, verbose_name='Firebase UID')),
+                ('operation', models.CharField(choices=[('create', 'Criar'), ('update', 'Atualizar'), ('delete', 'Deletar')], max_length=10, verbose_name='Operação')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='Email')),
+                ('display_name', models.CharField(blank=True, max_length=150, verbose_name='Nome de exibição')),
+                ('email_verified', models.BooleanField(default=False, verbose_name='Email verificado')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('failed', 'Falhou')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último erro')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Alteração pendente no Firebase',
+                'verbose_name_plural': 'Alterações pendentes no Firebase',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='accounts_fi_status_66bdee_idx'), models.Index(fields=['firebase_uid', 'id'], name='accounts_fi_firebas_2833dd_idx')],
+            },
+        ),
+    ]
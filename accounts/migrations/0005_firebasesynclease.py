@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_firebaseoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirebaseSyncLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='Nome')),
+                ('owner', models.CharField(blank=True, max_length=255, verbose_name='Dono')),
+                ('acquired_at', models.DateTimeField(blank=True, null=True, verbose_name='Adquirido em')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='Último heartbeat')),
+                ('expires_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Expira em')),
+            ],
+            options={
+                'verbose_name': 'Lease da sincronização',
+                'verbose_name_plural': 'Leases da sincronização',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_firebasesynclease'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='firebase_fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Fingerprint do Firebase'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['firebase_uid', 'firebase_fingerprint'], name='accounts_cu_firebas_ac1aaf_idx'),
+        ),
+    ]
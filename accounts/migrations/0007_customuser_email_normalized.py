@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:02
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Lower, Trim
+
+
+def fill_email_normalized(apps, schema_editor):
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    CustomUser.objects.using(schema_editor.connection.alias).update(
+        email_normalized=Lower(Trim(Coalesce('email', Value('')))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_customuser_firebase_fingerprint'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='email_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254, verbose_name='Email normalizado'),
+        ),
+        migrations.RunPython(fill_email_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['-created_at'], name='accounts_cu_created_158bd0_idx'),
+        ),
+    ]
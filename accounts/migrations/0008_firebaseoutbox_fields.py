@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_customuser_email_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='firebaseoutbox',
+            name='fields',
+            field=models.JSONField(blank=True, default=list, verbose_name='Campos'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_firebaseoutbox_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirebaseUserEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=128, unique=True, verbose_name='ID do evento')),
+                ('event_type', models.CharField(choices=[('created', 'Criado'), ('updated', 'Atualizado'), ('deleted', 'Deletado')], max_length=10, verbose_name='Tipo')),
+                ('firebase_uid', models.CharField(max_length=128, verbose_name='Firebase UID')),
+                ('event_time', models.BigIntegerField(verbose_name='Horário do evento')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Dados do usuário')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('processed', 'Processado'), ('failed', 'Falhou')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último erro')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Recebido em')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Processado em')),
+            ],
+            options={
+                'verbose_name': 'Evento de usuário do Firebase',
+                'verbose_name_plural': 'Eventos de usuários do Firebase',
+                'ordering': ['event_time', 'id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='accounts_fi_status_cdd6f0_idx'), models.Index(fields=['firebase_uid', 'status', 'event_time'], name='accounts_fi_firebas_796ba2_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,26 @@
-from django.db import models
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from django.utils.crypto import get_random_string
 from django.utils.translation import gettext_lazy as _
-from django.db.models.signals import post_save, post_delete, pre_delete
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from firebase_config import create_firebase_user, update_firebase_user, delete_firebase_user
+from .cache import user_cache
+
+# Mesmo formato dos UIDs gerados pelo Firebase
+FIREBASE_UID_LENGTH = 28
+
+def generate_firebase_uid():
+    return get_random_string(FIREBASE_UID_LENGTH)
+
+# Campos do CustomUser enviados ao Firebase, com o nome de cada um lá
+FIREBASE_FIELDS = {'email': 'email', 'username': 'display_name', 'email_verified': 'email_verified'}
+
+def normalize_email(email):
+    """Forma usada nas buscas por email: o Firebase não diferencia maiúsculas de minúsculas"""
+    return (email or '').strip().lower()
 
 class CustomUser(AbstractUser):
     firebase_uid = models.CharField(
@@ -17,6 +34,23 @@ class CustomUser(AbstractUser):
         default=False,
         verbose_name=_('Email verificado')
     )
+    # Preenchido no save() (e nos caminhos em lote da sincronização); todas as buscas por email usam este campo
+    email_normalized = models.CharField(
+        max_length=254,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name=_('Email normalizado')
+    )
+    # Hash dos dados do Firebase aplicados na última sincronização; vazio força a comparação completa
+    firebase_fingerprint = models.CharField(
+        max_length=32,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_('Fingerprint do Firebase')
+    )
     
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -48,47 +82,408 @@ class CustomUser(AbstractUser):
         verbose_name = _('Usuário')
         verbose_name_plural = _('Usuários')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['firebase_uid', 'firebase_fingerprint']),
+            # Ordenação padrão
+            models.Index(fields=['-created_at']),
+        ]
     
     def __str__(self):
         return self.email or self.username
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_firebase_fields()
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Só os campos relidos: carregar um campo adiado não pode esconder alterações ainda não salvas nos outros
+        self._snapshot_firebase_fields([field for field in FIREBASE_FIELDS if fields is None or field in fields])
+    
+    def _snapshot_firebase_fields(self, fields=FIREBASE_FIELDS):
+        # Só os campos carregados: os adiados (only/defer) não entram e não contam como alterados
+        loaded = {field: self.__dict__[field] for field in fields if field in self.__dict__}
+        self._firebase_snapshot = {**getattr(self, '_firebase_snapshot', {}), **loaded}
+    
+    def get_firebase_dirty_fields(self, update_fields=None):
+        """Nomes no Firebase dos campos alterados desde a leitura do banco (todos, se não veio do banco)"""
+        snapshot = getattr(self, '_firebase_snapshot', None)
+        dirty = set()
+        for field, attribute in FIREBASE_FIELDS.items():
+            if field not in self.__dict__ or (update_fields is not None and field not in update_fields):
+                continue
+            if snapshot is None or field not in snapshot or snapshot[field] != self.__dict__[field]:
+                dirty.add(attribute)
+        return dirty
+    
+    def get_session_auth_hash(self):
+        # Usuários vindos do UserCache não trazem a senha, só o hash da sessão calculado com ela
+        if 'password' not in self.__dict__ and getattr(self, '_cached_session_auth_hash', None):
+            return self._cached_session_auth_hash
+        return super().get_session_auth_hash()
+    
+    def save(self, *args, **kwargs):
+        self.email_normalized = normalize_email(self.email)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'email_normalized'}
+        
+        # Lido pelo post_save: só os campos alterados vão para a outbox
+        self._firebase_dirty = self.get_firebase_dirty_fields(update_fields)
+        if self._firebase_dirty and self.firebase_fingerprint and not self._state.adding:
+            # A linha mudou no Django: a próxima sincronização volta a comparar campo a campo
+            self.firebase_fingerprint = ''
+            if update_fields is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'firebase_fingerprint'}
+        
+        # O usuário e a entrada da outbox gravada no post_save vão na mesma transação
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+        self._snapshot_firebase_fields([field for field in FIREBASE_FIELDS if update_fields is None or field in update_fields])
+
+class FirebaseOutbox(models.Model):
+    OP_CREATE = 'create'
+    OP_UPDATE = 'update'
+    OP_DELETE = 'delete'
+    OPERATION_CHOICES = [
+        (OP_CREATE, _('Criar')),
+        (OP_UPDATE, _('Atualizar')),
+        (OP_DELETE, _('Deletar')),
+    ]
+    
+    STATUS_PENDING = 'pending'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pendente')),
+        (STATUS_FAILED, _('Falhou')),
+    ]
+    
+    firebase_uid = models.CharField(
+        max_length=128,
+        verbose_name=_('Firebase UID')
+    )
+    operation = models.CharField(
+        max_length=10,
+        choices=OPERATION_CHOICES,
+        verbose_name=_('Operação')
+    )
+    email = models.EmailField(
+        blank=True,
+        verbose_name=_('Email')
+    )
+    display_name = models.CharField(
+        max_length=150,
+        blank=True,
+        verbose_name=_('Nome de exibição')
+    )
+    email_verified = models.BooleanField(
+        default=False,
+        verbose_name=_('Email verificado')
+    )
+    # Campos alterados (nomes do Firebase) numa atualização; vazio envia todos
+    fields = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name=_('Campos')
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name=_('Status')
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Tentativas')
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_('Próxima tentativa')
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name=_('Último erro')
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Criado em')
+    )
+    
+    class Meta:
+        verbose_name = _('Alteração pendente no Firebase')
+        verbose_name_plural = _('Alterações pendentes no Firebase')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['firebase_uid', 'id']),
+        ]
+    
+    def __str__(self):
+        return f'{self.operation} {self.firebase_uid}'
+    
+    @classmethod
+    def enqueue(cls, operation, user, fields=(), using=None):
+        """Grava a alteração na transação atual, fundindo-a com a entrada do mesmo UID já gravada nela"""
+        using = using or router.db_for_write(cls)
+        entries = _transaction_outbox_entries(using)
+        uid = user.firebase_uid
+        data = {
+            'email': user.email or '',
+            'display_name': user.username or '',
+            'email_verified': user.email_verified,
+        }
+        
+        if operation != cls.OP_DELETE and uid in entries:
+            entry_id, created_at, entry_fields = entries[uid]
+            merged = sorted(entry_fields.union(fields))
+            # Só os campos alterados neste save: outra instância do mesmo usuário pode estar desatualizada nos demais
+            changed = {field: value for field, value in data.items() if field in fields}
+            # Zero linhas: a entrada foi desfeita num rollback (o created_at distingue um id reaproveitado depois dele)
+            merged_rows = cls.objects.using(using).filter(
+                id=entry_id,
+                firebase_uid=uid,
+                created_at=created_at,
+            ).update(fields=merged, **changed)
+            if merged_rows:
+                entries[uid] = (entry_id, created_at, set(merged))
+                return None
+        
+        entry = cls.objects.using(using).create(firebase_uid=uid, operation=operation, fields=sorted(fields), **data)
+        if operation == cls.OP_DELETE:
+            entries.pop(uid, None)
+        else:
+            entries[uid] = (entry.id, entry.created_at, set(fields))
+            # Sai do registro quando a transação confirma; num rollback o callback é descartado junto com a linha
+            transaction.on_commit(entries.clear, using=using, robust=True)
+        return entry
+
+def _transaction_outbox_entries(using):
+    """{firebase_uid: (id, created_at, campos)} das entradas da outbox gravadas na transação aberta em `using`.
+    
+    Cada entrada criada agenda a limpeza do registro no on_commit. Depois de
+    um rollback o registro pode guardar entradas desfeitas; o enqueue confere
+    id, UID e created_at antes de fundir, então elas só viram uma entrada nova.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return {}
+    
+    entries = getattr(connection, 'firebase_outbox_entries', None)
+    if entries is None:
+        entries = connection.firebase_outbox_entries = {}
+    return entries
+
+class FirebaseSyncState(models.Model):
+    project_id = models.CharField(
+        max_length=128,
+        unique=True,
+        verbose_name=_('Projeto Firebase')
+    )
+    # Início (ms desde epoch) da última sincronização concluída com sucesso
+    watermark = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('Marca d\'água')
+    )
+    last_sync_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Última sincronização')
+    )
+    last_full_sync_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Última sincronização completa')
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Atualizado em')
+    )
+    
+    class Meta:
+        verbose_name = _('Estado da sincronização')
+        verbose_name_plural = _('Estados da sincronização')
+    
+    def __str__(self):
+        return self.project_id
+    
+    def is_full_sync_due(self, interval):
+        if self.watermark is None or self.last_full_sync_at is None:
+            return True
+        return (timezone.now() - self.last_full_sync_at).total_seconds() >= interval
+
+class FirebaseSyncLease(models.Model):
+    name = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name=_('Nome')
+    )
+    # Vazio quando ninguém detém o lease
+    owner = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name=_('Dono')
+    )
+    acquired_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Adquirido em')
+    )
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Último heartbeat')
+    )
+    expires_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_('Expira em')
+    )
+    
+    class Meta:
+        verbose_name = _('Lease da sincronização')
+        verbose_name_plural = _('Leases da sincronização')
+    
+    def __str__(self):
+        return f'{self.name} ({self.owner or "livre"})'
+
+class FirebaseUserEvent(models.Model):
+    TYPE_CREATED = 'created'
+    TYPE_UPDATED = 'updated'
+    TYPE_DELETED = 'deleted'
+    TYPE_CHOICES = [
+        (TYPE_CREATED, _('Criado')),
+        (TYPE_UPDATED, _('Atualizado')),
+        (TYPE_DELETED, _('Deletado')),
+    ]
+    
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSED = 'processed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pendente')),
+        (STATUS_PROCESSED, _('Processado')),
+        (STATUS_FAILED, _('Falhou')),
+    ]
+    
+    # Chave de idempotência: o mesmo evento reenviado é ignorado
+    event_id = models.CharField(
+        max_length=128,
+        unique=True,
+        verbose_name=_('ID do evento')
+    )
+    event_type = models.CharField(
+        max_length=10,
+        choices=TYPE_CHOICES,
+        verbose_name=_('Tipo')
+    )
+    firebase_uid = models.CharField(
+        max_length=128,
+        verbose_name=_('Firebase UID')
+    )
+    # Quando o evento aconteceu no Firebase (ms desde epoch): define a ordem dos eventos de cada UID
+    event_time = models.BigIntegerField(
+        verbose_name=_('Horário do evento')
+    )
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name=_('Dados do usuário')
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name=_('Status')
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Tentativas')
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_('Próxima tentativa')
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name=_('Último erro')
+    )
+    received_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Recebido em')
+    )
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Processado em')
+    )
+    
+    class Meta:
+        verbose_name = _('Evento de usuário do Firebase')
+        verbose_name_plural = _('Eventos de usuários do Firebase')
+        ordering = ['event_time', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['firebase_uid', 'status', 'event_time']),
+        ]
+    
+    def __str__(self):
+        return f'{self.event_type} {self.firebase_uid} ({self.event_id})'
+
+_firebase_sync_suppressed = ContextVar('firebase_sync_suppressed', default=False)
+
+@contextmanager
+def suppress_firebase_sync():
+    """Escopo em que os saves e deletes de CustomUser não geram entradas na outbox do Firebase.
+    
+    Vale só para a thread ou task assíncrona atual (ContextVar): requisições
+    rodando ao mesmo tempo no processo continuam propagando as alterações, e
+    threads novas começam fora do escopo. Serve como context manager ou como
+    decorador de funções síncronas; numa corrotina, use o `with` dentro dela.
+    """
+    token = _firebase_sync_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _firebase_sync_suppressed.reset(token)
+
+def firebase_sync_suppressed():
+    return _firebase_sync_suppressed.get()
+
+@receiver(pre_save, sender=CustomUser)
+def assign_firebase_uid(sender, instance, **kwargs):
+    # Usuários criados no Django recebem o UID já no INSERT e são criados no Firebase pela outbox
+    if kwargs.get('raw', False) or firebase_sync_suppressed() or not instance._state.adding or instance.firebase_uid:
+        return
+    
+    instance.firebase_uid = generate_firebase_uid()
+    instance._firebase_uid_generated = True
 
 @receiver(post_save, sender=CustomUser)
-def sync_user_to_firebase(sender, instance, created, **kwargs):
-    if kwargs.get('raw', False) or kwargs.get('update_fields') == ['last_login']:
+def sync_user_to_firebase(sender, instance, created, using=None, **kwargs):
+    if kwargs.get('raw', False) or firebase_sync_suppressed():
         return
     
-    try:
-        if created and not instance.firebase_uid:
-            firebase_uid = create_firebase_user(
-                email=instance.email,
-                display_name=instance.username
-            )
-            if firebase_uid:
-                CustomUser.objects.filter(pk=instance.pk).update(firebase_uid=firebase_uid)
-        
-        elif instance.firebase_uid and not created:
-            update_firebase_user(
-                uid=instance.firebase_uid,
-                email=instance.email,
-                display_name=instance.username,
-                email_verified=instance.email_verified
-            )
-            
-    except Exception as e:
-        print(f"❌ Erro ao sincronizar usuário para Firebase: {e}")
+    if created:
+        if getattr(instance, '_firebase_uid_generated', False):
+            FirebaseOutbox.enqueue(FirebaseOutbox.OP_CREATE, instance, using=using)
+            instance._firebase_uid_generated = False
+    
+    elif instance.firebase_uid:
+        # Saves que não mexem em email, username ou email_verified (ex.: last_login) não geram entrada
+        fields = getattr(instance, '_firebase_dirty', None)
+        if fields is None:
+            fields = set(FIREBASE_FIELDS.values())
+        if fields:
+            FirebaseOutbox.enqueue(FirebaseOutbox.OP_UPDATE, instance, fields, using=using)
 
 @receiver(pre_delete, sender=CustomUser)
 def delete_user_from_firebase(sender, instance, **kwargs):
-    try:
-        if instance.firebase_uid:
-            delete_firebase_user(instance.firebase_uid)
-    except Exception as e:
-        print(f"❌ Erro ao deletar usuário do Firebase: {e}")
-
-def disable_firebase_sync():
-    post_save.disconnect(sync_user_to_firebase, sender=CustomUser)
-    pre_delete.disconnect(delete_user_from_firebase, sender=CustomUser)
-
-def enable_firebase_sync():
-    post_save.connect(sync_user_to_firebase, sender=CustomUser)
-    pre_delete.connect(delete_user_from_firebase, sender=CustomUser)
\ No newline at end of file
+    if instance.firebase_uid and not firebase_sync_suppressed():
+        FirebaseOutbox.enqueue(FirebaseOutbox.OP_DELETE, instance, using=kwargs.get('using'))
+
+@receiver(post_save, sender=CustomUser, dispatch_uid='invalidate_user_cache_on_save')
+@receiver(post_delete, sender=CustomUser, dispatch_uid='invalidate_user_cache_on_delete')
+def invalidate_user_cache(sender, instance, **kwargs):
+    user_cache.invalidate(instance)
@@ -0,0 +1,197 @@
+from firebase_config import (
+    import_firebase_users,
+    delete_firebase_users,
+    update_firebase_user,
+    MAX_BATCH_WRITE_SIZE,
+)
+from .circuit import get_breaker
+from .lease import SyncLease
+from .models import FIREBASE_FIELDS, FirebaseOutbox
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_LEASE_NAME = 'firebase-outbox'
+
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BACKOFF_BASE = 5
+DEFAULT_BACKOFF_MAX = 60 * 60
+
+class PendingChange:
+    """Resultado da fusão de todas as entradas pendentes de um mesmo UID"""
+    
+    def __init__(self, uid):
+        self.uid = uid
+        self.operation = None
+        self.entry = None
+        self.entry_ids = []
+        self.attempts = 0
+        self.fields = set()
+    
+    def add(self, entry):
+        self.entry_ids.append(entry.id)
+        self.attempts = max(self.attempts, entry.attempts)
+        # Entradas sem a lista de campos (anteriores a ela) atualizam todos
+        self.fields.update(entry.fields or FIREBASE_FIELDS.values())
+        
+        if entry.operation == FirebaseOutbox.OP_DELETE:
+            # Criado e removido antes de chegar ao Firebase: não há nada a enviar
+            self.operation = None if self.operation == FirebaseOutbox.OP_CREATE else FirebaseOutbox.OP_DELETE
+        elif entry.operation == FirebaseOutbox.OP_CREATE or self.operation != FirebaseOutbox.OP_CREATE:
+            self.operation = entry.operation
+        self.entry = entry
+    
+    def as_user_data(self):
+        return {
+            'uid': self.uid,
+            'email': self.entry.email,
+            'display_name': self.entry.display_name,
+            'email_verified': self.entry.email_verified,
+        }
+    
+    def update_data(self):
+        """Só os campos alterados, no formato de update_firebase_user; email e nome vazios não são enviados"""
+        data = {field: value for field, value in self.as_user_data().items() if field in self.fields}
+        return {field: value for field, value in data.items() if value or field == 'email_verified'}
+
+def coalesce_entries(entries):
+    """Agrupa as entradas por UID (em ordem de criação) e mantém só o estado final de cada usuário"""
+    changes = {}
+    for entry in entries:
+        change = changes.get(entry.firebase_uid)
+        if change is None:
+            change = changes[entry.firebase_uid] = PendingChange(entry.firebase_uid)
+        change.add(entry)
+    return list(changes.values())
+
+def get_backoff_delay(attempts):
+    base = getattr(settings, 'FIREBASE_OUTBOX_BACKOFF_BASE', DEFAULT_BACKOFF_BASE)
+    maximum = getattr(settings, 'FIREBASE_OUTBOX_BACKOFF_MAX', DEFAULT_BACKOFF_MAX)
+    delay = min(base * 2 ** max(attempts - 1, 0), maximum)
+    return delay + random.uniform(0, delay / 10)
+
+def _mark_failed(change, reason):
+    max_attempts = getattr(settings, 'FIREBASE_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    attempts = change.attempts + 1
+    status = FirebaseOutbox.STATUS_FAILED if attempts >= max_attempts else FirebaseOutbox.STATUS_PENDING
+    
+    FirebaseOutbox.objects.filter(id__in=change.entry_ids).update(
+        attempts=attempts,
+        status=status,
+        next_attempt_at=timezone.now() + timedelta(seconds=get_backoff_delay(attempts)),
+        last_error=str(reason)[:2000],
+    )
+    
+    if status == FirebaseOutbox.STATUS_FAILED:
+        logger.error(f"❌ Desistindo de sincronizar {change.uid} após {attempts} tentativas: {reason}")
+    else:
+        logger.warning(f"⚠️ Falha ao sincronizar {change.uid} (tentativa {attempts}): {reason}")
+
+def _defer(changes, breaker):
+    """Com o circuito aberto as alterações esperam ele fechar, sem gastar tentativas"""
+    delay = max(breaker.retry_after(), 1)
+    FirebaseOutbox.objects.filter(
+        id__in=[entry_id for change in changes for entry_id in change.entry_ids]
+    ).update(next_attempt_at=timezone.now() + timedelta(seconds=delay))
+    logger.warning(f"⏸️ {len(changes)} alterações adiadas por {delay:.0f}s: circuito {breaker.name} aberto")
+    return len(changes)
+
+def _send_batch(changes, send, breaker):
+    sent = deferred = 0
+    for start in range(0, len(changes), MAX_BATCH_WRITE_SIZE):
+        if breaker.is_open:
+            deferred = _defer(changes[start:], breaker)
+            break
+        chunk = changes[start:start + MAX_BATCH_WRITE_SIZE]
+        errors = send(chunk)
+        done_ids = []
+        for index, change in enumerate(chunk):
+            if index in errors:
+                _mark_failed(change, errors[index])
+            else:
+                done_ids.extend(change.entry_ids)
+                sent += 1
+        FirebaseOutbox.objects.filter(id__in=done_ids).delete()
+    return sent, deferred
+
+def _send_updates(changes):
+    breaker = get_breaker('admin:update_user')
+    sent = deferred = 0
+    for index, change in enumerate(changes):
+        if breaker.is_open:
+            deferred = _defer(changes[index:], breaker)
+            break
+        data = change.update_data()
+        if not data:
+            FirebaseOutbox.objects.filter(id__in=change.entry_ids).delete()
+            sent += 1
+            continue
+        try:
+            ok = update_firebase_user(uid=change.uid, **data)
+        except Exception as e:
+            ok = False
+            logger.error(f"❌ Erro ao atualizar {change.uid} no Firebase: {e}")
+        
+        if ok:
+            FirebaseOutbox.objects.filter(id__in=change.entry_ids).delete()
+            sent += 1
+        else:
+            _mark_failed(change, 'Falha ao atualizar usuário no Firebase')
+    return sent, deferred
+
+def drain_outbox(limit=None):
+    """Envia ao Firebase as alterações pendentes cuja próxima tentativa já venceu.
+    
+    Todas as entradas pendentes de cada UID são fundidas numa única operação;
+    criações vão por auth.import_users() e remoções por auth.delete_users(),
+    em lotes de até 1000. Enquanto o circuito de uma operação estiver aberto
+    as alterações dela são adiadas, sem contar como falha. Só um processo
+    envia por vez (lease 'firebase-outbox'), para que duas réplicas do worker
+    não leiam e enviem as mesmas entradas; se outro já estiver enviando,
+    levanta SyncLeaseUnavailable. Retorna (enviadas, falhas).
+    """
+    limit = limit or MAX_BATCH_WRITE_SIZE
+    
+    with SyncLease(name=OUTBOX_LEASE_NAME) as lease:
+        pending = FirebaseOutbox.objects.filter(status=FirebaseOutbox.STATUS_PENDING)
+        
+        due_uids = list(
+            pending.filter(next_attempt_at__lte=timezone.now())
+            .order_by('firebase_uid')
+            .values_list('firebase_uid', flat=True)
+            .distinct()[:limit]
+        )
+        if not due_uids:
+            return 0, 0
+        
+        # Carrega também as entradas ainda em espera do mesmo UID para não enviar fora de ordem
+        entries = list(pending.filter(firebase_uid__in=due_uids).order_by('id'))
+        changes = coalesce_entries(entries)
+        
+        noop_ids = [entry_id for change in changes if change.operation is None for entry_id in change.entry_ids]
+        FirebaseOutbox.objects.filter(id__in=noop_ids).delete()
+        
+        creates = [change for change in changes if change.operation == FirebaseOutbox.OP_CREATE]
+        updates = [change for change in changes if change.operation == FirebaseOutbox.OP_UPDATE]
+        deletes = [change for change in changes if change.operation == FirebaseOutbox.OP_DELETE]
+        
+        lease.check()
+        sent = deferred = 0
+        for batch_sent, batch_deferred in (
+            _send_batch(
+                creates,
+                lambda chunk: import_firebase_users([c.as_user_data() for c in chunk]),
+                get_breaker('admin:import_users'),
+            ),
+            _send_updates(updates),
+            _send_batch(deletes, lambda chunk: delete_firebase_users([c.uid for c in chunk]), get_breaker('admin:delete_users')),
+        ):
+            sent += batch_sent
+            deferred += batch_deferred
+    
+    failed = len(creates) + len(updates) + len(deletes) - sent - deferred
+    return sent, failed
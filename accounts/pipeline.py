@@ -0,0 +1,84 @@
+from django.db import connections
+import contextvars
+import queue
+import threading
+import zlib
+
+_DONE = object()
+
+def partition(items, workers, key):
+    """Divide os itens entre os workers por hash estável da chave (o mesmo UID sempre cai no mesmo worker)"""
+    buckets = [[] for _ in range(workers)]
+    for item in items:
+        buckets[zlib.crc32(key(item).encode()) % workers].append(item)
+    return buckets
+
+def run_pipeline(pages, handle, workers, queue_depth, key):
+    """Consome `pages` na thread atual e aplica `handle` em `workers` threads de escrita.
+    
+    Cada página é particionada por `key` e cada parte vai para a fila do seu
+    worker. As filas têm no máximo `queue_depth` partes: quando os workers
+    ficam para trás, a busca da próxima página espera (backpressure), então a
+    memória fica limitada a algumas páginas. Enquanto os workers gravam, a
+    thread atual já está buscando a página seguinte.
+    
+    Retorna a lista de resultados de `handle`; se algum worker falhar, os
+    demais param de aplicar, a busca é interrompida e a primeira exceção é relançada.
+    """
+    queues = [queue.Queue(maxsize=max(1, queue_depth)) for _ in range(workers)]
+    results = []
+    errors = []
+    failed = threading.Event()
+    lock = threading.Lock()
+    
+    def writer(work_queue):
+        try:
+            while True:
+                part = work_queue.get()
+                if part is _DONE:
+                    return
+                if failed.is_set():
+                    # Continua esvaziando a fila para não travar quem está produzindo
+                    continue
+                try:
+                    result = handle(part)
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    failed.set()
+                    continue
+                with lock:
+                    results.append(result)
+        finally:
+            # Cada thread abre a própria conexão com o banco
+            connections.close_all()
+    
+    # Cada writer roda numa cópia do contexto atual (ex.: dentro de suppress_firebase_sync)
+    threads = [
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(writer, work_queue),
+            name=f'firebase-sync-writer-{index}',
+            daemon=True,
+        )
+        for index, work_queue in enumerate(queues)
+    ]
+    for thread in threads:
+        thread.start()
+    
+    try:
+        for page in pages:
+            if failed.is_set():
+                break
+            for work_queue, part in zip(queues, partition(page, workers, key)):
+                if part:
+                    work_queue.put(part)
+    finally:
+        for work_queue in queues:
+            work_queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+    
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.core.cache import caches
+from .metrics import record_rate_limited
+from .models import normalize_email
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'accounts:ratelimit'
+DEFAULT_LOCAL_MAX_KEYS = 10000
+
+# Durante um ataque o log recebe um resumo a cada intervalo (s), não uma linha por requisição recusada
+REPORT_INTERVAL = 60
+
+# Ordem das verificações: as mais baratas de estourar primeiro, o limite global por último
+SCOPES = ('ip', 'email', 'global')
+
+def parse_rate(rate):
+    """'10/60' → (10, 60.0): no máximo 10 requisições a cada 60 segundos; vazio desliga o limite"""
+    if not rate:
+        return None
+    count, _, period = str(rate).partition('/')
+    return int(count), float(period or 1)
+
+class LocalRateLimiter:
+    """Token bucket em memória, por processo: cada chave recebe `limit` fichas a cada `period` segundos.
+    
+    Guarda no máximo `max_keys` chaves; as usadas há mais tempo são descartadas
+    primeiro (uma chave descartada volta com o balde cheio).
+    """
+    
+    def __init__(self, max_keys=DEFAULT_LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def hit(self, key, limit, period):
+        """Consome uma ficha; retorna 0 se a requisição passa ou os segundos até a próxima ficha"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * limit / period)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) * period / limit
+            # Reinserir move a chave para o fim: a primeira do dict é a menos usada
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                del self._buckets[next(iter(self._buckets))]
+        return retry_after
+    
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+class CacheRateLimiter:
+    """Janela deslizante aproximada no cache do Django, compartilhada entre workers e máquinas.
+    
+    Um contador por janela fixa (cache.incr, atômico no Redis/memcached) e a
+    contagem da janela anterior pesada pelo quanto dela ainda cabe na janela
+    deslizante. Requisições recusadas também contam, então um ataque contínuo
+    continua bloqueado.
+    """
+    
+    def __init__(self, alias=None):
+        self.alias = alias
+    
+    @property
+    def cache(self):
+        return caches[self.alias or getattr(settings, 'FIREBASE_RATELIMIT_CACHE_ALIAS', 'default')]
+    
+    def hit(self, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        current_key = f'{KEY_PREFIX}:{key}:{window}'
+        timeout = int(period * 2) + 1
+        
+        self.cache.add(current_key, 0, timeout)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Expirou entre o add e o incr
+            self.cache.set(current_key, 1, timeout)
+            current = 1
+        previous = self.cache.get(f'{KEY_PREFIX}:{key}:{window - 1}', 0)
+        
+        elapsed = now - window * period
+        estimate = previous * (1 - elapsed / period) + current
+        if estimate <= limit:
+            return 0
+        if previous:
+            return min(period - elapsed, (estimate - limit) * period / previous)
+        return period - elapsed
+    
+    def reset(self):
+        pass
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Limitador do processo conforme FIREBASE_RATELIMIT_BACKEND ('local' ou 'cache')"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                backend = getattr(settings, 'FIREBASE_RATELIMIT_BACKEND', 'local')
+                _limiter = CacheRateLimiter() if backend == 'cache' else LocalRateLimiter()
+    return _limiter
+
+def get_client_ip(request):
+    """IP do cliente para o limite por IP.
+    
+    No X-Forwarded-For cada proxy acrescenta à direita o endereço de quem o
+    chamou, e o que vem à esquerda é escrito pelo próprio cliente. Com
+    FIREBASE_RATELIMIT_TRUSTED_PROXIES proxies na frente da aplicação, o
+    cliente é o N-ésimo endereço a partir da direita.
+    """
+    header = getattr(settings, 'FIREBASE_RATELIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        addresses = [address.strip() for address in request.META[header].split(',') if address.strip()]
+        if addresses:
+            hops = max(getattr(settings, 'FIREBASE_RATELIMIT_TRUSTED_PROXIES', 1), 1)
+            return addresses[max(len(addresses) - hops, 0)]
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+_rejections = {}
+_rejections_lock = threading.Lock()
+_last_report = 0.0
+
+def _report_rejection(scope, endpoint):
+    global _last_report
+    record_rate_limited(scope, endpoint)
+    
+    now = time.monotonic()
+    with _rejections_lock:
+        _rejections[(endpoint, scope)] = _rejections.get((endpoint, scope), 0) + 1
+        if now - _last_report < REPORT_INTERVAL:
+            return
+        summary, _last_report = dict(_rejections), now
+        _rejections.clear()
+    
+    details = ', '.join(f'{endpoint}/{scope}: {count}' for (endpoint, scope), count in sorted(summary.items()))
+    logger.warning(f"⚠️ Requisições recusadas pelo limite de taxa ({details})")
+
+def _scope_key(scope, request, email):
+    if scope == 'ip':
+        return f'ip:{get_client_ip(request)}'
+    if scope == 'email':
+        # Hash: emails podem ter caracteres não aceitos como chave pelo memcached
+        return 'email:' + hashlib.sha256(normalize_email(email).encode()).hexdigest()[:32]
+    return 'global'
+
+def check_auth_rate_limit(request, email, endpoint):
+    """Confere os limites por IP, por email e global antes de chamar a Identity Toolkit.
+    
+    Retorna None se a requisição pode seguir, ou (escopo, segundos para tentar
+    de novo) se algum limite estourou. Com o backend 'local' os limites valem
+    por processo.
+    """
+    if not getattr(settings, 'FIREBASE_RATELIMIT_ENABLED', False):
+        return None
+    
+    limiter = get_rate_limiter()
+    for scope in SCOPES:
+        rate = parse_rate(getattr(settings, f'FIREBASE_RATELIMIT_{scope.upper()}', None))
+        if rate is None or (scope == 'email' and not email):
+            continue
+        retry_after = limiter.hit(_scope_key(scope, request, email), *rate)
+        if retry_after:
+            _report_rejection(scope, endpoint)
+            return scope, retry_after
+    return None
@@ -0,0 +1,343 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction, IntegrityError
+from django.utils import timezone
+from .cache import user_cache
+from .metrics import sync_phase
+from .models import CustomUser, FirebaseOutbox, normalize_email
+from .usernames import allocate_usernames, is_username_variant, save_with_unique_username, username_base
+import hashlib
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_ORPHAN_MAX_RATIO = 0.2
+
+# Abaixo disso a trava de proporção não se aplica (bancos pequenos, ambiente de dev)
+ORPHAN_SAFETY_FLOOR = 10
+
+LIVE_UIDS_TABLE = 'accounts_firebase_live_uid'
+
+# Campos gravados pelo bulk_update; updated_at é auto_now e não é preenchido pelo bulk_update
+SYNCED_FIELDS = ['firebase_uid', 'email', 'email_normalized', 'email_verified', 'username', 'date_joined', 'firebase_fingerprint', 'updated_at']
+
+# Muda quando os campos do fingerprint mudarem, para que todas as linhas voltem a ser comparadas
+FINGERPRINT_VERSION = '1'
+
+def get_sync_batch_size(batch_size=None):
+    if batch_size is None:
+        batch_size = getattr(settings, 'FIREBASE_SYNC_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    return max(1, int(batch_size))
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def convert_firebase_timestamp(timestamp):
+    try:
+        if timestamp is None:
+            return timezone.now()
+        
+        if isinstance(timestamp, (int, float)):
+            if timestamp > 1e12:
+                timestamp = timestamp / 1000
+            return timezone.make_aware(datetime.fromtimestamp(timestamp))
+        elif hasattr(timestamp, 'utcoffset'):
+            return timestamp
+        else:
+            return timezone.now()
+    except (ValueError, TypeError, OSError) as e:
+        logger.warning(f"⚠️ Erro ao converter timestamp: {e}")
+        return timezone.now()
+
+def apply_firebase_data(user, firebase_user, created=False):
+    """Copia os dados do Firebase para o usuário em memória. Retorna True se algo mudou.
+    
+    O username é tratado à parte (ver firebase_username_base), pois precisa ser único.
+    """
+    email = firebase_user.email
+    uid = firebase_user.uid
+    needs_update = False
+    
+    if not user.firebase_uid or user.firebase_uid != uid:
+        user.firebase_uid = uid
+        needs_update = True
+    
+    if user.email != email:
+        user.email = email
+        needs_update = True
+    # bulk_create/bulk_update não passam pelo save()
+    user.email_normalized = normalize_email(email)
+    
+    email_verified = firebase_user.email_verified
+    if user.email_verified != email_verified:
+        user.email_verified = email_verified
+        needs_update = True
+    
+    if created or not user.date_joined:
+        user.date_joined = convert_firebase_timestamp(firebase_user.created_at)
+        needs_update = True
+    
+    return needs_update
+
+def firebase_username_base(firebase_user):
+    return username_base(firebase_user.display_name or firebase_user.local_part)
+
+def firebase_fingerprint(firebase_user):
+    """Hash estável dos atributos do Firebase que a sincronização copia para o CustomUser"""
+    parts = (
+        FINGERPRINT_VERSION,
+        firebase_user.uid,
+        firebase_user.email,
+        '1' if firebase_user.email_verified else '0',
+        firebase_user.display_name,
+        str(firebase_user.created_at or ''),
+    )
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=16).hexdigest()
+
+def _unchanged_uids(fingerprints, batch_size):
+    """UIDs cuja linha já tem o fingerprint atual; lê só (firebase_uid, firebase_fingerprint) pelo índice"""
+    unchanged = set()
+    for chunk in chunked(list(fingerprints), batch_size):
+        pairs = CustomUser.objects.filter(firebase_uid__in=chunk).values_list('firebase_uid', 'firebase_fingerprint')
+        unchanged.update(uid for uid, fingerprint in pairs if fingerprint and fingerprint == fingerprints[uid])
+    return unchanged
+
+def _prefetch(field, values, batch_size):
+    found = {}
+    for chunk in chunked(values, batch_size):
+        for user in CustomUser.objects.filter(**{f'{field}__in': chunk}):
+            found[getattr(user, field)] = user
+    return found
+
+def _save_individually(users, errors=None):
+    """Fallback para um lote que falhou: grava linha a linha e retorna quantas falharam"""
+    failed = 0
+    for user in users:
+        try:
+            base = getattr(user, '_username_base', None)
+            if base:
+                # Username alocado nesta página pode ter sido tomado por outra gravação
+                save_with_unique_username(user, base)
+            else:
+                with transaction.atomic():
+                    user.save()
+        except Exception as e:
+            logger.error(f"❌ Erro ao processar {user.email}: {e}")
+            failed += 1
+            if errors is not None:
+                errors[user.firebase_uid] = e
+    return failed
+
+def _write_created(users, batch_size, errors=None):
+    failed = 0
+    for chunk in chunked(users, batch_size):
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(chunk)
+        except IntegrityError as e:
+            logger.warning(f"⚠️ Lote de criação com conflito, gravando individualmente: {e}")
+            failed += _save_individually(chunk, errors)
+    return failed
+
+def _write_updated(users, batch_size, errors=None):
+    failed = 0
+    now = timezone.now()
+    for user in users:
+        user.updated_at = now
+    
+    for chunk in chunked(users, batch_size):
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_update(chunk, SYNCED_FIELDS)
+            # bulk_update não dispara post_save; as chaves de UID/email são conferidas na leitura
+            user_cache.invalidate_pks([user.pk for user in chunk])
+        except IntegrityError as e:
+            logger.warning(f"⚠️ Lote de atualização com conflito, gravando individualmente: {e}")
+            failed += _save_individually(chunk, errors)
+    return failed
+
+def _diff_page(firebase_users, create_missing, match_by_uid, batch_size):
+    """Carrega as linhas da página e calcula em memória o que criar e o que atualizar.
+    
+    Usuários cujo fingerprint não mudou desde a última sincronização não têm
+    a linha carregada; só contam como sincronizados.
+    """
+    fingerprints = {fu.uid: firebase_fingerprint(fu) for fu in firebase_users}
+    unchanged = set()
+    by_uid = {}
+    if match_by_uid:
+        unchanged = _unchanged_uids(fingerprints, batch_size)
+        if unchanged:
+            firebase_users = [fu for fu in firebase_users if fu.uid not in unchanged]
+        by_uid = _prefetch('firebase_uid', [fu.uid for fu in firebase_users], batch_size)
+    
+    missing_emails = [normalize_email(fu.email) for fu in firebase_users if fu.uid not in by_uid]
+    by_email = _prefetch('email_normalized', missing_emails, batch_size) if missing_emails else {}
+    
+    changed = []
+    renames = []
+    seen = set()
+    unusable_password = make_password(None)
+    
+    for firebase_user in firebase_users:
+        user = by_uid.get(firebase_user.uid) or by_email.get(normalize_email(firebase_user.email))
+        created = False
+        
+        if user is None:
+            if not create_missing:
+                continue
+            user = CustomUser(password=unusable_password)
+            created = True
+        elif id(user) in seen:
+            # Dois registros do Firebase apontando para a mesma linha: mantém o primeiro
+            logger.warning(f"⚠️ Usuário duplicado na página, ignorando: {firebase_user.email}")
+            continue
+        
+        seen.add(id(user))
+        
+        needs_update = apply_firebase_data(user, firebase_user, created)
+        fingerprint = fingerprints[firebase_user.uid]
+        if user.firebase_fingerprint != fingerprint:
+            user.firebase_fingerprint = fingerprint
+            needs_update = True
+        base = firebase_username_base(firebase_user)
+        if created or not is_username_variant(user.username, base):
+            renames.append((user, base))
+            needs_update = True
+        
+        if needs_update:
+            changed.append((user, created))
+    
+    # Um único lote de consultas por prefixo para todos os usernames novos da página
+    for (user, base), username in zip(renames, allocate_usernames([base for _, base in renames])):
+        user.username = username
+        user._username_base = base
+    
+    to_create = [user for user, created in changed if created]
+    to_update = [user for user, created in changed if not created]
+    return to_create, to_update, len(seen) + len(unchanged)
+
+def reconcile_firebase_users(firebase_users, create_missing=True, match_by_uid=True, batch_size=None, errors=None):
+    """Reconcilia uma página de usuários do Firebase (FirebaseUserRecord) com o banco do Django.
+    
+    Carrega as linhas existentes com uma consulta por firebase_uid e outra por
+    email, calcula as diferenças em memória e grava com bulk_create/bulk_update
+    em lotes, cada lote na sua própria transação. Se `errors` (dict) for
+    passado, recebe {firebase_uid: exceção} dos usuários que não foram gravados.
+    Retorna (sincronizados, criados, atualizados).
+    """
+    batch_size = get_sync_batch_size(batch_size)
+    
+    firebase_users = [
+        firebase_user for firebase_user in firebase_users
+        if firebase_user.email and firebase_user.uid
+    ]
+    if not firebase_users:
+        return 0, 0, 0
+    
+    with sync_phase('diff'):
+        to_create, to_update, seen_count = _diff_page(firebase_users, create_missing, match_by_uid, batch_size)
+    
+    with sync_phase('write'):
+        create_failed = _write_created(to_create, batch_size, errors)
+        update_failed = _write_updated(to_update, batch_size, errors)
+    
+    synced_count = seen_count - create_failed - update_failed
+    return synced_count, len(to_create) - create_failed, len(to_update) - update_failed
+
+def _linked_users():
+    return CustomUser.objects.exclude(firebase_uid__isnull=True).exclude(firebase_uid='')
+
+def find_orphaned_user_ids(live_uids, batch_size=None, started_at=None):
+    """Carrega os UIDs vivos numa tabela temporária e acha os órfãos com um único anti-join.
+    
+    Usuários criados no Django que ainda têm um `create` na outbox (pendente ou
+    falho) não existem no Firebase ainda e não contam como órfãos. Com started_at
+    (início da listagem), usuários criados depois dele também ficam de fora: a
+    listagem pode ter passado pela posição deles antes de existirem.
+    """
+    batch_size = get_sync_batch_size(batch_size)
+    qn = connection.ops.quote_name
+    live_table = qn(LIVE_UIDS_TABLE)
+    user_table = qn(CustomUser._meta.db_table)
+    pk_column = qn(CustomUser._meta.pk.column)
+    uid_column = qn(CustomUser._meta.get_field('firebase_uid').column)
+    outbox_table = qn(FirebaseOutbox._meta.db_table)
+    outbox_uid_column = qn(FirebaseOutbox._meta.get_field('firebase_uid').column)
+    outbox_operation_column = qn(FirebaseOutbox._meta.get_field('operation').column)
+    created_at_column = qn(CustomUser._meta.get_field('created_at').column)
+    
+    created_filter = ''
+    params = ['', FirebaseOutbox.OP_CREATE]
+    if started_at is not None:
+        created_filter = f'AND u.{created_at_column} < %s '
+        params.append(connection.ops.adapt_datetimefield_value(started_at))
+    
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {live_table}')
+        cursor.execute(f'CREATE TEMPORARY TABLE {live_table} (uid VARCHAR(128) PRIMARY KEY)')
+        try:
+            for chunk in chunked(list(live_uids), batch_size):
+                cursor.executemany(
+                    f'INSERT INTO {live_table} (uid) VALUES (%s)',
+                    [(uid,) for uid in chunk],
+                )
+            
+            cursor.execute(
+                f'SELECT u.{pk_column} FROM {user_table} u '
+                f'WHERE u.{uid_column} IS NOT NULL AND u.{uid_column} <> %s '
+                f'AND NOT EXISTS (SELECT 1 FROM {live_table} l WHERE l.uid = u.{uid_column}) '
+                f'AND NOT EXISTS (SELECT 1 FROM {outbox_table} o '
+                f'WHERE o.{outbox_uid_column} = u.{uid_column} AND o.{outbox_operation_column} = %s) '
+                f'{created_filter}',
+                params,
+            )
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.execute(f'DROP TABLE IF EXISTS {live_table}')
+
+def purge_orphaned_users(live_uids, batch_size=None, max_ratio=None, started_at=None):
+    """Remove os usuários ligados a UIDs que não existem mais no Firebase.
+    
+    started_at é o momento em que a listagem de live_uids começou; usuários
+    criados no Django depois dele nunca são tratados como órfãos. Aborta sem apagar nada se a proporção de órfãos passar de max_ratio
+    (FIREBASE_ORPHAN_MAX_RATIO), o que normalmente indica uma listagem truncada.
+    Retorna quantos usuários foram removidos.
+    """
+    if not live_uids:
+        logger.error("❌ Lista de UIDs do Firebase vazia, remoção de órfãos cancelada")
+        return 0
+    
+    if batch_size is None:
+        batch_size = getattr(settings, 'FIREBASE_ORPHAN_DELETE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    batch_size = max(1, int(batch_size))
+    if max_ratio is None:
+        max_ratio = getattr(settings, 'FIREBASE_ORPHAN_MAX_RATIO', DEFAULT_ORPHAN_MAX_RATIO)
+    
+    orphan_ids = find_orphaned_user_ids(live_uids, started_at=started_at)
+    if not orphan_ids:
+        return 0
+    
+    linked_count = _linked_users().count()
+    ratio = len(orphan_ids) / linked_count if linked_count else 1
+    if len(orphan_ids) > ORPHAN_SAFETY_FLOOR and ratio > max_ratio:
+        logger.error(
+            f"❌ {len(orphan_ids)} de {linked_count} usuários seriam removidos ({ratio:.0%}), "
+            f"acima do limite de {max_ratio:.0%}. Remoção de órfãos cancelada."
+        )
+        return 0
+    
+    deleted_count = 0
+    for chunk in chunked(orphan_ids, batch_size):
+        try:
+            with transaction.atomic():
+                _, deleted_per_model = CustomUser.objects.filter(pk__in=chunk).delete()
+            deleted_count += deleted_per_model.get(CustomUser._meta.label, 0)
+            logger.info(f"🗑️  {deleted_count}/{len(orphan_ids)} usuários órfãos removidos")
+        except Exception as e:
+            logger.error(f"❌ Erro ao remover lote de usuários órfãos: {e}")
+    
+    return deleted_count
@@ -0,0 +1,80 @@
+from .lease import SyncLeaseUnavailable
+from django.conf import settings
+from django.db import connections
+import logging
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_INTERVAL = 5 * 60
+DEFAULT_SYNC_JITTER = 0.1
+
+def get_sync_interval(interval=None):
+    if interval is None:
+        interval = getattr(settings, 'FIREBASE_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL)
+    return max(1.0, float(interval))
+
+def get_sync_jitter(jitter=None):
+    if jitter is None:
+        jitter = getattr(settings, 'FIREBASE_SYNC_JITTER', DEFAULT_SYNC_JITTER)
+    return min(max(0.0, float(jitter)), 1.0)
+
+def run_scheduled_sync():
+    """Uma rodada da sincronização; retorna None se outro nó estiver com o lease"""
+    from .sync_utils import sync_firebase_users
+    
+    try:
+        logger.info("🔄 Iniciando sincronização agendada de usuários do Firebase...")
+        result = sync_firebase_users()
+    except SyncLeaseUnavailable as e:
+        logger.info(f"⏭️  {e}; rodada ignorada")
+        return None
+    finally:
+        # Threads de longa duração não passam pelo ciclo de requisição que fecha as conexões
+        connections.close_all()
+    
+    synced, created, updated, deleted = result
+    logger.info(f"✅ Sincronização concluída: {synced} sincronizados, {created} criados, {updated} atualizados, {deleted} deletados")
+    return result
+
+class SyncScheduler:
+    """Roda a sincronização a cada `interval` segundos, com ±`jitter` (fração do intervalo) de variação.
+    
+    Pode rodar dentro do processo web (FIREBASE_SYNC_SCHEDULER_ENABLED) ou num
+    worker dedicado (manage.py run_sync_scheduler). Vários nós podem agendar ao
+    mesmo tempo: o jitter espalha as tentativas e o lease garante que só um
+    sincroniza em cada rodada; se a sincronização atrasar, a próxima rodada
+    simplesmente começa depois dela.
+    """
+    
+    def __init__(self, interval=None, jitter=None, initial_delay=None):
+        self.interval = get_sync_interval(interval)
+        self.jitter = get_sync_jitter(jitter)
+        # Por padrão a primeira rodada também é espalhada, para nós que sobem juntos não colidirem
+        self.initial_delay = random.uniform(0, self.interval * self.jitter) if initial_delay is None else initial_delay
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def next_delay(self):
+        spread = self.interval * self.jitter
+        return self.interval + random.uniform(-spread, spread)
+    
+    def run(self):
+        delay = self.initial_delay
+        while not self._stop.wait(delay):
+            try:
+                run_scheduled_sync()
+            except Exception as e:
+                logger.error(f"❌ Erro na sincronização agendada: {e}")
+            delay = self.next_delay()
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='firebase-sync-scheduler', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,195 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from .http_client import get_identity_toolkit_client
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = '_firebase_tokens'
+CACHE_KEY_PREFIX = 'accounts:firebase_tokens'
+
+# Renova o ID token quando faltar menos que isso (s) para expirar
+DEFAULT_REFRESH_MARGIN = 5 * 60
+DEFAULT_EXPIRES_IN = 60 * 60
+
+# Erros do securetoken em que o refresh token não serve mais: só um novo login resolve
+REVOKED_ERRORS = ('TOKEN_EXPIRED', 'USER_DISABLED', 'USER_NOT_FOUND', 'INVALID_REFRESH_TOKEN', 'INVALID_GRANT_TYPE')
+
+class TokenRefreshError(Exception):
+    def __init__(self, message, revoked=False):
+        super().__init__(message)
+        self.revoked = revoked
+
+_fernet = None
+_fernet_lock = threading.Lock()
+
+def _derived_key():
+    # Sem chave própria, deriva uma do SECRET_KEY (trocar o SECRET_KEY invalida os tokens guardados)
+    digest = hashlib.sha256(f'accounts.session_tokens:{settings.SECRET_KEY}'.encode()).digest()
+    return base64.urlsafe_b64encode(digest)
+
+def get_fernet():
+    """MultiFernet com as chaves de FIREBASE_TOKEN_ENCRYPTION_KEYS (a primeira cifra, todas decifram)"""
+    global _fernet
+    if _fernet is None:
+        with _fernet_lock:
+            if _fernet is None:
+                from cryptography.fernet import Fernet, MultiFernet
+                
+                keys = getattr(settings, 'FIREBASE_TOKEN_ENCRYPTION_KEYS', None) or [_derived_key()]
+                _fernet = MultiFernet([Fernet(key) for key in keys])
+    return _fernet
+
+def encrypt_tokens(tokens):
+    return get_fernet().encrypt(json.dumps(tokens).encode()).decode()
+
+def decrypt_tokens(value):
+    from cryptography.fernet import InvalidToken
+    
+    try:
+        return json.loads(get_fernet().decrypt(value.encode()))
+    except (InvalidToken, ValueError):
+        return None
+
+def get_refresh_margin(margin=None):
+    if margin is None:
+        margin = getattr(settings, 'FIREBASE_TOKEN_REFRESH_MARGIN', DEFAULT_REFRESH_MARGIN)
+    return max(0, int(margin))
+
+def _tokens(uid, id_token, refresh_token, expires_in):
+    return {
+        'uid': uid,
+        'id_token': id_token,
+        'refresh_token': refresh_token,
+        'expires_at': time.time() + int(expires_in or DEFAULT_EXPIRES_IN),
+    }
+
+def store_session_tokens(request, result):
+    """Guarda na sessão, cifrados, os tokens da resposta do signInWithPassword/signUp"""
+    if not result.get('idToken') or not result.get('refreshToken'):
+        return
+    request.session[SESSION_KEY] = encrypt_tokens(
+        _tokens(result['localId'], result['idToken'], result['refreshToken'], result.get('expiresIn'))
+    )
+
+def load_session_tokens(request):
+    value = request.session.get(SESSION_KEY)
+    return decrypt_tokens(value) if value else None
+
+def clear_session_tokens(request):
+    request.session.pop(SESSION_KEY, None)
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class TokenRefresher:
+    """Troca refresh tokens por ID tokens novos, com uma única chamada por usuário de cada vez.
+    
+    Requisições simultâneas do mesmo usuário (várias abas, chamadas em
+    paralelo) esperam a chamada que já está em andamento no processo. O
+    resultado também fica, cifrado, no cache do Django até perto de expirar,
+    para que os outros processos o reaproveitem em vez de renovar de novo.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+    
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'FIREBASE_USER_CACHE_ALIAS', 'default')]
+    
+    def _cache_key(self, uid):
+        return f'{CACHE_KEY_PREFIX}:{uid}'
+    
+    def refresh(self, tokens, margin):
+        uid = tokens['uid']
+        with self._lock:
+            flight = self._flights.get(uid)
+            leader = flight is None
+            if leader:
+                flight = self._flights[uid] = _Flight()
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = self._refresh(tokens, margin)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[uid]
+            flight.done.set()
+        return flight.result
+    
+    def _refresh(self, tokens, margin):
+        key = self._cache_key(tokens['uid'])
+        cached = self.cache.get(key)
+        if cached:
+            refreshed = decrypt_tokens(cached)
+            if refreshed and refreshed['expires_at'] - time.time() > margin:
+                return refreshed
+        
+        response = get_identity_toolkit_client().refresh_id_token(tokens['refresh_token'])
+        result = response.json()
+        if response.status_code != 200:
+            message = result.get('error', {}).get('message', 'Erro ao renovar o token')
+            raise TokenRefreshError(message, revoked=message.startswith(REVOKED_ERRORS))
+        
+        refreshed = _tokens(
+            result.get('user_id') or tokens['uid'],
+            result['id_token'],
+            result.get('refresh_token') or tokens['refresh_token'],
+            result.get('expires_in'),
+        )
+        self.cache.set(key, encrypt_tokens(refreshed), max(1, int(refreshed['expires_at'] - time.time()) - margin))
+        return refreshed
+
+token_refresher = TokenRefresher()
+
+def get_id_token(request, margin=None):
+    """ID token do Firebase do usuário da sessão, renovado só quando está perto de expirar.
+    
+    Retorna None se a sessão não tem tokens ou se a renovação falhou; se o
+    refresh token foi revogado os tokens saem da sessão e só um novo login
+    devolve um ID token.
+    """
+    tokens = load_session_tokens(request)
+    if tokens is None:
+        return None
+    
+    margin = get_refresh_margin(margin)
+    if tokens['expires_at'] - time.time() > margin:
+        return tokens['id_token']
+    
+    try:
+        tokens = token_refresher.refresh(tokens, margin)
+    except TokenRefreshError as e:
+        logger.warning(f"⚠️ Não foi possível renovar o token do Firebase: {e}")
+        if e.revoked:
+            clear_session_tokens(request)
+        return None
+    except Exception as e:
+        logger.error(f"❌ Erro de conexão ao renovar o token do Firebase: {e}")
+        return None
+    
+    request.session[SESSION_KEY] = encrypt_tokens(tokens)
+    return tokens['id_token']
+
+aget_id_token = sync_to_async(get_id_token)
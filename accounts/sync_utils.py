@@ -1,225 +1,242 @@
-from firebase_config import get_firebase_users, get_firebase_user_uids
-from .models import CustomUser, disable_firebase_sync, enable_firebase_sync
+from firebase_config import (
+    iter_firebase_user_pages,
+    get_firebase_user_changed_at,
+    get_firebase_project_id,
+)
+from .metrics import sync_phase, record_sync_run
+from .lease import SyncLease, SyncLeaseUnavailable
+from .pipeline import run_pipeline
+from .models import FirebaseSyncState, suppress_firebase_sync
+from .reconcile import reconcile_firebase_users, purge_orphaned_users, convert_firebase_timestamp
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
 import logging
-from datetime import datetime
+import time
 
 logger = logging.getLogger(__name__)
 
-def convert_firebase_timestamp(timestamp):
-    try:
-        if timestamp is None:
-            return timezone.now()
-            
-        if isinstance(timestamp, (int, float)):
-            if timestamp > 1e12:
-                timestamp = timestamp / 1000
-            return timezone.make_aware(datetime.fromtimestamp(timestamp))
-        elif hasattr(timestamp, 'utcoffset'):
-            return timestamp
-        else:
-            return timezone.now()
-    except (ValueError, TypeError, OSError) as e:
-        logger.warning(f"⚠️ Erro ao converter timestamp: {e}")
-        return timezone.now()
+DEFAULT_FULL_SYNC_INTERVAL = 24 * 60 * 60
+DEFAULT_WATERMARK_OVERLAP = 5 * 60
+
+# 0 = busca e gravação em sequência, na thread atual
+DEFAULT_SYNC_WORKERS = 0
+DEFAULT_SYNC_QUEUE_DEPTH = 2
+
+def get_sync_state():
+    state, _ = FirebaseSyncState.objects.get_or_create(project_id=get_firebase_project_id())
+    return state
 
-def sync_firebase_users():
+def _timed_pages(pages):
+    """Repassa as páginas do Firebase medindo o tempo de cada busca (fase fetch)"""
+    pages = iter(pages)
+    while True:
+        with sync_phase('fetch'):
+            page = next(pages, None)
+        if page is None:
+            return
+        yield page
+
+def get_sync_workers(workers=None):
+    if workers is None:
+        workers = getattr(settings, 'FIREBASE_SYNC_WORKERS', DEFAULT_SYNC_WORKERS)
+    return max(0, int(workers))
+
+def get_sync_queue_depth(queue_depth=None):
+    if queue_depth is None:
+        queue_depth = getattr(settings, 'FIREBASE_SYNC_QUEUE_DEPTH', DEFAULT_SYNC_QUEUE_DEPTH)
+    return max(1, int(queue_depth))
+
+@suppress_firebase_sync()
+def sync_firebase_users(page_size=None, batch_size=None, full=None, delete_batch_size=None, max_orphan_ratio=None,
+                        workers=None, queue_depth=None):
+    """Sincroniza os usuários do Firebase com o Django.
+    
+    full=None decide pelo estado salvo: faz uma varredura completa se nunca
+    houve uma ou se FIREBASE_FULL_SYNC_INTERVAL já passou; caso contrário
+    aplica só os usuários alterados desde a última marca d'água. full=False
+    sem marca d'água salva (banco novo) também vira uma varredura completa.
+    
+    Com workers > 0 (FIREBASE_SYNC_WORKERS) a busca das páginas e a gravação
+    rodam em paralelo: as páginas são divididas por UID entre os workers de
+    escrita, com no máximo queue_depth partes esperando em cada fila.
+    
+    Só um processo sincroniza por vez (SyncLease); se outro já estiver
+    sincronizando, levanta SyncLeaseUnavailable sem tocar no Firebase.
+    """
+    mode = 'full' if full else 'incremental'
+    lease = SyncLease()
     try:
-        disable_firebase_sync()
-        
-        firebase_uids = get_firebase_user_uids()
-        logger.info(f"✅ {len(firebase_uids)} UIDs encontrados no Firebase")
-        
-        firebase_users = get_firebase_users()
-        
-        if not firebase_users:
-            logger.info("✅ Nenhum usuário encontrado no Firebase para sincronizar")
-            return 0, 0, 0, 0
+        lease.acquire()
+        
+        state = get_sync_state()
+        started_at = int(time.time() * 1000)
+        
+        if full is None:
+            full = state.is_full_sync_due(
+                getattr(settings, 'FIREBASE_FULL_SYNC_INTERVAL', DEFAULT_FULL_SYNC_INTERVAL)
+            )
+        elif not full and state.watermark is None:
+            # Banco sem sincronização anterior: não há desde quando buscar
+            logger.info("🔄 Nenhuma marca d'água salva: a sincronização incremental vira completa")
+            full = True
+        mode = 'full' if full else 'incremental'
+        
+        since = None
+        if not full:
+            # Margem para relógios diferentes e usuários alterados durante a última execução
+            overlap = getattr(settings, 'FIREBASE_SYNC_WATERMARK_OVERLAP', DEFAULT_WATERMARK_OVERLAP)
+            since = state.watermark - overlap * 1000
+            logger.info(f"🔄 Sincronização incremental desde {convert_firebase_timestamp(since)}")
+        else:
+            logger.info("🔄 Sincronização completa")
         
-        logger.info(f"✅ {len(firebase_users)} usuários encontrados no Firebase")
+        # UIDs vivos no Firebase, montados na mesma passada da sincronização
+        firebase_uids = set()
         
         synced_count = 0
         created_count = 0
         updated_count = 0
         deleted_count = 0
         
-        with transaction.atomic():
-            for firebase_user in firebase_users:
-                try:
-                    if not firebase_user.get('email'):
-                        continue
-                    
-                    email = firebase_user['email']
-                    uid = firebase_user['uid']
-                    
-                    user = None
-                    created = False
-                    
-                    if uid:
-                        try:
-                            user = CustomUser.objects.get(firebase_uid=uid)
-                        except CustomUser.DoesNotExist:
-                            pass
-                    
-                    if not user:
-                        try:
-                            user = CustomUser.objects.get(email=email)
-                        except CustomUser.DoesNotExist:
-                            pass
-                    
-                    if not user:
-                        user = CustomUser()
-                        created = True
-                        created_count += 1
-                    
-                    needs_update = False
-                    
-                    if not user.firebase_uid or user.firebase_uid != uid:
-                        user.firebase_uid = uid
-                        needs_update = True
-                    
-                    if user.email != email:
-                        user.email = email
-                        needs_update = True
-                    
-                    email_verified = firebase_user.get('email_verified', False)
-                    if user.email_verified != email_verified:
-                        user.email_verified = email_verified
-                        needs_update = True
-                    
-                    display_name = firebase_user.get('display_name', '')
-                    new_username = display_name or email.split('@')[0]
-                    if user.username != new_username:
-                        user.username = new_username[:150]
-                        needs_update = True
-                    
-                    created_at = firebase_user.get('created_at')
-                    if created or not user.date_joined:
-                        user.date_joined = convert_firebase_timestamp(created_at)
-                        needs_update = True
-                    
-                    if created or needs_update:
-                        if not created:
-                            updated_count += 1
-                        
-                        user.set_unusable_password()
-                        user.save()
-                    
-                    synced_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"❌ Erro ao processar {firebase_user.get('email', 'unknown')}: {e}")
-                    continue
-            
-            django_users_with_firebase = CustomUser.objects.exclude(firebase_uid__isnull=True).exclude(firebase_uid='')
-            
-            for django_user in django_users_with_firebase:
-                if django_user.firebase_uid not in firebase_uids:
-                    try:
-                        logger.info(f"🗑️  Deletando usuário órfão: {django_user.email} (UID: {django_user.firebase_uid})")
-                        django_user.delete()
-                        deleted_count += 1
-                    except Exception as e:
-                        logger.error(f"❌ Erro ao deletar usuário órfão {django_user.email}: {e}")
-        
-        logger.info(f"📊 Sincronização completa concluída!")
+        def pages_to_apply():
+            for page in _timed_pages(iter_firebase_user_pages(page_size)):
+                lease.check()
+                firebase_uids.update(firebase_user.uid for firebase_user in page)
+                
+                if since is not None:
+                    page = [
+                        firebase_user for firebase_user in page
+                        if get_firebase_user_changed_at(firebase_user) >= since
+                    ]
+                yield page
+        
+        def apply_page(page):
+            return reconcile_firebase_users(page, batch_size=batch_size)
+        
+        workers = get_sync_workers(workers)
+        if workers:
+            results = run_pipeline(
+                pages_to_apply(),
+                apply_page,
+                workers=workers,
+                queue_depth=get_sync_queue_depth(queue_depth),
+                key=lambda firebase_user: firebase_user.uid,
+            )
+        else:
+            results = map(apply_page, pages_to_apply())
+        
+        for synced, created, updated in results:
+            synced_count += synced
+            created_count += created
+            updated_count += updated
+        
+        if not firebase_uids:
+            logger.info("✅ Nenhum usuário encontrado no Firebase para sincronizar")
+            record_sync_run(mode, 'ok')
+            return 0, 0, 0, 0
+        
+        logger.info(f"✅ {len(firebase_uids)} usuários encontrados no Firebase")
+        
+        # Exclusões no Firebase não deixam timestamp: órfãos só na varredura completa
+        if full:
+            lease.check()
+            with sync_phase('delete'):
+                deleted_count = purge_orphaned_users(
+                    firebase_uids,
+                    batch_size=delete_batch_size,
+                    max_ratio=max_orphan_ratio,
+                    started_at=convert_firebase_timestamp(started_at),
+                )
+        
+        lease.check()
+        state.watermark = started_at
+        state.last_sync_at = timezone.now()
+        if full:
+            state.last_full_sync_at = state.last_sync_at
+        state.save()
+        
+        logger.info(f"📊 Sincronização {'completa' if full else 'incremental'} concluída!")
         logger.info(f"✅ Total sincronizado: {synced_count}")
         logger.info(f"🎉 Novos usuários: {created_count}")
         logger.info(f"🔄 Usuários atualizados: {updated_count}")
         logger.info(f"🗑️  Usuários deletados (órfãos): {deleted_count}")
         
+        record_sync_run(mode, 'ok', created_count, updated_count, deleted_count)
         return synced_count, created_count, updated_count, deleted_count
-        
+    
+    except SyncLeaseUnavailable:
+        record_sync_run(mode, 'skipped')
+        raise
     except Exception as e:
         logger.error(f"❌ Erro durante a sincronização: {e}")
+        record_sync_run(mode, 'error')
         return 0, 0, 0, 0
     finally:
-        enable_firebase_sync()
+        lease.release()
 
-def delete_orphaned_users():
+@suppress_firebase_sync()
+def delete_orphaned_users(page_size=None, delete_batch_size=None, max_orphan_ratio=None):
+    lease = SyncLease()
     try:
-        disable_firebase_sync()
-        
-        firebase_uids = get_firebase_user_uids()
-        deleted_count = 0
-        
-        django_users_with_firebase = CustomUser.objects.exclude(firebase_uid__isnull=True).exclude(firebase_uid='')
-        
-        for django_user in django_users_with_firebase:
-            if django_user.firebase_uid not in firebase_uids:
-                try:
-                    logger.info(f"🗑️  Deletando usuário órfão: {django_user.email}")
-                    django_user.delete()
-                    deleted_count += 1
-                except Exception as e:
-                    logger.error(f"❌ Erro ao deletar usuário órfão {django_user.email}: {e}")
+        lease.acquire()
+        
+        started_at = timezone.now()
+        firebase_uids = {
+            firebase_user.uid
+            for page in _timed_pages(iter_firebase_user_pages(page_size))
+            for firebase_user in page
+        }
+        lease.check()
+        with sync_phase('delete'):
+            deleted_count = purge_orphaned_users(
+                firebase_uids,
+                batch_size=delete_batch_size,
+                max_ratio=max_orphan_ratio,
+                started_at=started_at,
+            )
         
         logger.info(f"✅ {deleted_count} usuários órfãos deletados")
         return deleted_count
-        
+    
+    except SyncLeaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao deletar usuários órfãos: {e}")
         return 0
     finally:
-        enable_firebase_sync()
+        lease.release()
 
-def update_existing_users():
+@suppress_firebase_sync()
+def update_existing_users(page_size=None, batch_size=None):
+    lease = SyncLease()
     try:
-        disable_firebase_sync()
-        
-        firebase_users = get_firebase_users()
-        if not firebase_users:
-            logger.info("✅ Nenhum usuário encontrado no Firebase para atualizar")
-            return 0
+        lease.acquire()
         
+        seen_count = 0
         updated_count = 0
         
-        with transaction.atomic():
-            for firebase_user in firebase_users:
-                try:
-                    if not firebase_user.get('email') or not firebase_user.get('uid'):
-                        continue
-                    
-                    email = firebase_user['email']
-                    uid = firebase_user['uid']
-                    
-                    try:
-                        user = CustomUser.objects.get(email=email)
-                    except CustomUser.DoesNotExist:
-                        continue
-                    
-                    needs_update = False
-                    
-                    if user.firebase_uid != uid:
-                        user.firebase_uid = uid
-                        needs_update = True
-                    
-                    email_verified = firebase_user.get('email_verified', False)
-                    if user.email_verified != email_verified:
-                        user.email_verified = email_verified
-                        needs_update = True
-                    
-                    display_name = firebase_user.get('display_name', '')
-                    new_username = display_name or email.split('@')[0]
-                    if user.username != new_username:
-                        user.username = new_username[:150]
-                        needs_update = True
-                    
-                    if needs_update:
-                        user.save()
-                        updated_count += 1
-                        logger.info(f"🔄 Usuário atualizado: {email}")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Erro ao atualizar {firebase_user.get('email', 'unknown')}: {e}")
-                    continue
+        for page in _timed_pages(iter_firebase_user_pages(page_size)):
+            lease.check()
+            seen_count += len(page)
+            _, _, updated = reconcile_firebase_users(
+                page,
+                create_missing=False,
+                match_by_uid=False,
+                batch_size=batch_size,
+            )
+            updated_count += updated
+        
+        if not seen_count:
+            logger.info("✅ Nenhum usuário encontrado no Firebase para atualizar")
+            return 0
         
         logger.info(f"✅ {updated_count} usuários atualizados")
         return updated_count
-        
+    
+    except SyncLeaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro durante a atualização: {e}")
         return 0
     finally:
-        enable_firebase_sync()
\ No newline at end of file
+        lease.release()
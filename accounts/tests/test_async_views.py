@@ -0,0 +1,156 @@
+from django.test import TestCase, override_settings
+from django.urls import path
+from unittest import mock
+from accounts import ratelimit
+from accounts.circuit import get_breaker, reset_breakers
+from accounts.http_client import AsyncIdentityToolkitClient
+from accounts.models import CustomUser
+from accounts.ratelimit import LocalRateLimiter
+from accounts.session_tokens import SESSION_KEY
+from accounts.views import alogin_view, aregister_view, home
+import httpx
+import json
+
+# As views assíncronas só entram nas URLs do projeto com ASYNC_AUTH_VIEWS (decidido no import)
+urlpatterns = [
+    path('', home, name='home'),
+    path('login/', alogin_view, name='login'),
+    path('register/', aregister_view, name='register'),
+]
+
+class FakeIdentityToolkit:
+    """Identity Toolkit local para o httpx.MockTransport: responde com o status e o corpo configurados"""
+    
+    def __init__(self):
+        self.status_code = 200
+        self.error = None
+        self.requests = []
+    
+    def __call__(self, request):
+        self.requests.append(request)
+        if self.error:
+            return httpx.Response(self.status_code, json={'error': {'message': self.error}})
+        email = json.loads(request.content)['email']
+        return httpx.Response(200, json={
+            'localId': f'uid-{email.split("@")[0]}',
+            'email': email,
+            'idToken': 'id-token',
+            'refreshToken': 'refresh-token',
+            'expiresIn': '3600',
+        })
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    FIREBASE_RATELIMIT_ENABLED=True,
+    FIREBASE_RATELIMIT_IP='',
+    FIREBASE_RATELIMIT_EMAIL='2/60',
+    FIREBASE_RATELIMIT_GLOBAL='',
+    FIREBASE_CIRCUIT_FAILURE_THRESHOLD=1,
+    FIREBASE_CIRCUIT_RECOVERY_TIMEOUT=30,
+)
+class AsyncAuthViewTests(TestCase):
+    def setUp(self):
+        reset_breakers()
+        self.addCleanup(reset_breakers)
+        patcher = mock.patch.object(ratelimit, '_limiter', LocalRateLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.toolkit = FakeIdentityToolkit()
+        client = AsyncIdentityToolkitClient(base_url='https://toolkit.test', api_key='key', retries=0)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(self.toolkit))
+        patcher = mock.patch('accounts.utils.get_async_identity_toolkit_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def open_circuit(self, name):
+        breaker = get_breaker(name)
+        breaker.before_call()
+        breaker.record_failure()
+    
+    async def login(self, email='ada@example.com', password='secret1'):
+        return await self.async_client.post('/login/', {'email': email, 'password': password})
+    
+    async def register(self, email='ada@example.com', password='secret1'):
+        return await self.async_client.post(
+            '/register/', {'email': email, 'password': password, 'confirm_password': password}
+        )
+    
+    async def test_login_success(self):
+        response = await self.login()
+        
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        user = await CustomUser.objects.aget(firebase_uid='uid-ada')
+        self.assertEqual(user.email, 'ada@example.com')
+        session = await self.async_client.asession()
+        self.assertEqual(await session.aget('_auth_user_id'), str(user.pk))
+        self.assertIsNotNone(await session.aget(SESSION_KEY))
+        self.assertEqual(len(self.toolkit.requests), 1)
+        
+        # Já autenticado: volta para a home sem chamar o Firebase
+        response = await self.async_client.get('/login/')
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        self.assertEqual(len(self.toolkit.requests), 1)
+    
+    async def test_login_with_invalid_credentials(self):
+        self.toolkit.status_code, self.toolkit.error = 400, 'INVALID_LOGIN_CREDENTIALS'
+        response = await self.login(password='wrong password')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'INVALID_LOGIN_CREDENTIALS')
+        session = await self.async_client.asession()
+        self.assertIsNone(await session.aget('_auth_user_id'))
+        self.assertFalse(await CustomUser.objects.aexists())
+    
+    async def test_login_returns_429_without_calling_firebase(self):
+        self.toolkit.status_code, self.toolkit.error = 400, 'INVALID_LOGIN_CREDENTIALS'
+        for _ in range(2):
+            self.assertEqual((await self.login(password='wrong password')).status_code, 200)
+        
+        response = await self.login(password='wrong password')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(len(self.toolkit.requests), 2)
+    
+    async def test_login_returns_503_while_the_circuit_is_open(self):
+        self.open_circuit('accounts:signInWithPassword')
+        response = await self.login()
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.toolkit.requests, [])
+    
+    async def test_register_success(self):
+        response = await self.register()
+        
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        user = await CustomUser.objects.aget(firebase_uid='uid-ada')
+        session = await self.async_client.asession()
+        self.assertEqual(await session.aget('_auth_user_id'), str(user.pk))
+        self.assertEqual(json.loads(self.toolkit.requests[0].content)['email'], 'ada@example.com')
+    
+    async def test_register_with_existing_email(self):
+        self.toolkit.status_code, self.toolkit.error = 400, 'EMAIL_EXISTS'
+        response = await self.register()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'EMAIL_EXISTS')
+        self.assertFalse(await CustomUser.objects.aexists())
+    
+    async def test_register_returns_429(self):
+        self.toolkit.status_code, self.toolkit.error = 400, 'EMAIL_EXISTS'
+        for _ in range(2):
+            await self.register()
+        
+        response = await self.register()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(len(self.toolkit.requests), 2)
+    
+    async def test_register_returns_503_while_the_circuit_is_open(self):
+        self.open_circuit('accounts:signUp')
+        response = await self.register()
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.toolkit.requests, [])
@@ -0,0 +1,170 @@
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from accounts.cache import UserCache, user_cache
+from accounts.models import CustomUser, suppress_firebase_sync
+import pickle
+import shutil
+import tempfile
+
+class SharedCacheMixin:
+    """Troca o LocMemCache dos testes por um cache em arquivos, compartilhado como o Redis/memcached da produção"""
+    
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        shared = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+
+class UserCacheTests(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        user_cache.local.clear()
+        with suppress_firebase_sync():
+            self.user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'correct horse battery')
+    
+    def test_entry_does_not_hold_the_password_hash(self):
+        user_cache.get_by_pk(self.user.pk)
+        
+        entry = cache.get(user_cache._key('pk', self.user.pk))
+        self.assertNotIn(self.user.password.encode(), pickle.dumps(entry))
+        self.assertNotIn('password', entry[1])
+    
+    def test_cached_user_defers_the_password(self):
+        user_cache.get_by_pk(self.user.pk)
+        user = user_cache.get_by_pk(self.user.pk)
+        
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertEqual(user.email, 'admin@example.com')
+        self.assertTrue(user.is_superuser)
+        self.assertEqual(user.get_session_auth_hash(), self.user.get_session_auth_hash())
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('correct horse battery'))
+    
+    def test_each_read_returns_a_new_instance(self):
+        first = user_cache.get_by_firebase_uid(self.user.firebase_uid)
+        first.email = 'changed@example.com'
+        self.assertEqual(user_cache.get_by_firebase_uid(self.user.firebase_uid).email, 'admin@example.com')
+    
+    def test_saving_a_cached_user_keeps_the_password(self):
+        user_cache.get_by_email('ADMIN@example.com')
+        user = user_cache.get_by_email('admin@example.com')
+        user.first_name = 'Ada'
+        with suppress_firebase_sync():
+            user.save()
+        
+        stored = CustomUser.objects.get(pk=self.user.pk)
+        self.assertEqual(stored.first_name, 'Ada')
+        self.assertEqual(stored.password, self.user.password)
+    
+    def test_session_uses_the_cached_hash(self):
+        self.client.force_login(self.user, backend='accounts.backends.CachedModelBackend')
+        self.client.get('/login/')
+        
+        with self.assertNumQueries(1):
+            # Só a leitura da sessão: o usuário e o hash da sessão vêm do cache
+            response = self.client.get('/login/')
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+    
+    def test_password_change_invalidates_the_session(self):
+        self.client.force_login(self.user, backend='accounts.backends.CachedModelBackend')
+        self.client.get('/login/')
+        
+        self.user.set_password('another password')
+        with suppress_firebase_sync():
+            self.user.save()
+        self.assertEqual(self.client.get('/login/').status_code, 200)
+    
+    def test_session_from_the_previous_backend_stays_valid(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'django.contrib.auth.backends.ModelBackend')
+        self.assertRedirects(self.client.get('/login/'), '/', fetch_redirect_response=False)
+
+class CrossWorkerInvalidationTests(SharedCacheMixin, TestCase):
+    """Cada UserCache faz o papel de um worker; sem LRU local, só o cache compartilhado liga os dois"""
+    
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.worker_a = UserCache()
+        self.worker_b = UserCache()
+        for worker in (self.worker_a, self.worker_b):
+            worker.local.ttl = 0
+        with suppress_firebase_sync():
+            self.user = CustomUser.objects.create_user('ada', 'ada@example.com', 'x', firebase_uid='uid-ada')
+    
+    def test_invalidation_is_seen_by_another_instance(self):
+        self.worker_a.get_by_pk(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.worker_b.get_by_pk(self.user.pk).is_active)
+        
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.worker_a.invalidate(self.user)
+        self.assertFalse(self.worker_b.get_by_pk(self.user.pk).is_active)
+    
+    def test_password_change_is_seen_by_another_instance(self):
+        old_hash = self.worker_b.get_by_pk(self.user.pk).get_session_auth_hash()
+        
+        self.user.set_password('another password')
+        with suppress_firebase_sync():
+            self.user.save()
+        self.assertNotEqual(self.worker_b.get_by_pk(self.user.pk).get_session_auth_hash(), old_hash)
+
+class ProcessLocalCacheTests(TestCase):
+    def setUp(self):
+        self.user_cache = UserCache()
+        with suppress_firebase_sync():
+            self.user = CustomUser.objects.create_user('ada', 'ada@example.com', 'x', firebase_uid='uid-ada')
+    
+    def test_locmem_is_not_used_as_the_shared_tier(self):
+        self.assertIsNone(self.user_cache.backend)
+        self.user_cache.get_by_pk(self.user.pk)
+        self.assertIsNone(cache.get(self.user_cache._key('pk', self.user.pk)))
+        
+        # Só o LRU local, de TTL curto
+        with self.assertNumQueries(0):
+            self.user_cache.get_by_pk(self.user.pk)
+    
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_dummy_cache(self):
+        self.assertIsNone(self.user_cache.backend)
+        self.assertEqual(self.user_cache.get_by_pk(self.user.pk).pk, self.user.pk)
+
+class EmailLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.local.clear()
+        with suppress_firebase_sync():
+            # Tabelas anteriores ao email_normalized podem ter variações de caixa do mesmo email
+            self.upper = CustomUser.objects.create_user('foo-upper', 'Foo@x.com', firebase_uid='uid-upper')
+            self.lower = CustomUser.objects.create_user('foo-lower', 'foo@x.com', firebase_uid='uid-lower')
+    
+    def test_prefers_the_exact_email(self):
+        self.assertEqual(user_cache.get_by_email('Foo@x.com').pk, self.upper.pk)
+        self.assertEqual(user_cache.get_by_email('foo@x.com').pk, self.lower.pk)
+        self.assertEqual(user_cache.get_by_email('Foo@x.com').pk, self.upper.pk)
+    
+    def test_falls_back_to_the_oldest_row(self):
+        self.assertEqual(user_cache.get_by_email('FOO@X.COM').pk, self.upper.pk)
+    
+    def test_unique_email_is_cached(self):
+        with suppress_firebase_sync():
+            user = CustomUser.objects.create_user('bar', 'Bar@x.com')
+        user_cache.get_by_email('bar@x.com')
+        with self.assertNumQueries(0):
+            self.assertEqual(user_cache.get_by_email('BAR@x.com').pk, user.pk)
+    
+    def test_missing_email(self):
+        with self.assertRaises(CustomUser.DoesNotExist):
+            user_cache.get_by_email('nobody@x.com')
+    
+    def test_login_with_case_variants_does_not_fail(self):
+        from accounts.utils import get_or_create_user
+        
+        user = get_or_create_user('foo', 'foo@x.com', 'new-uid')
+        self.assertEqual(user.pk, self.lower.pk)
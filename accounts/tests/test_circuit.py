@@ -0,0 +1,184 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from unittest import mock
+from accounts import circuit
+from accounts.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, get_breaker, reset_breakers
+from accounts.http_client import get_identity_toolkit_client
+from accounts.ratelimit import LocalRateLimiter
+import requests
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(circuit.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=3, recovery_timeout=30)
+    
+    def fail(self, times=1):
+        for _ in range(times):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+    
+    def test_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertTrue(self.breaker.is_open)
+        
+        self.now += 10
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 20)
+    
+    def test_success_resets_the_failure_count(self):
+        self.fail(2)
+        self.breaker.before_call()
+        self.breaker.record_success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+    
+    def test_half_open_lets_a_single_probe_through(self):
+        self.fail(3)
+        self.now += 30
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.is_open)
+        
+        self.breaker.before_call()
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+    
+    def test_successful_probe_closes(self):
+        self.fail(3)
+        self.now += 30
+        self.breaker.before_call()
+        self.breaker.record_success()
+        
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.before_call()
+        self.breaker.before_call()
+    
+    def test_failed_probe_reopens_for_the_full_timeout(self):
+        self.fail(3)
+        self.now += 30
+        self.fail()
+        
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.retry_after(), 30)
+    
+    def test_release_frees_the_probe(self):
+        self.fail(3)
+        self.now += 30
+        self.breaker.before_call()
+        # Erro que não diz nada sobre o serviço: outra chamada pode testar
+        self.breaker.release()
+        
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.before_call()
+    
+    def test_guard_counts_only_service_failures(self):
+        with self.assertRaises(ValueError):
+            with self.breaker.guard(is_failure=lambda e: isinstance(e, ConnectionError)):
+                raise ValueError('usuário inexistente')
+        self.assertEqual(self.breaker.snapshot()['failures'], 0)
+        
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                with self.breaker.guard(is_failure=lambda e: isinstance(e, ConnectionError)):
+                    raise ConnectionError()
+        self.assertEqual(self.breaker.state, OPEN)
+    
+    def test_snapshot(self):
+        self.fail(3)
+        self.now += 12
+        self.assertEqual(self.breaker.snapshot(), {'state': OPEN, 'failures': 3, 'retry_after': 18.0})
+    
+    @override_settings(FIREBASE_CIRCUIT_BREAKERS={'test': {'failure_threshold': 1, 'recovery_timeout': 5}})
+    def test_per_endpoint_settings(self):
+        breaker = CircuitBreaker('test')
+        self.assertEqual((breaker.failure_threshold, breaker.recovery_timeout), (1, 5.0))
+
+class IdentityToolkitCircuitTests(SimpleTestCase):
+    def setUp(self):
+        reset_breakers()
+        self.addCleanup(reset_breakers)
+        self.toolkit = get_identity_toolkit_client()
+    
+    def response(self, status_code):
+        response = requests.Response()
+        response.status_code = status_code
+        return response
+    
+    @override_settings(FIREBASE_CIRCUIT_FAILURE_THRESHOLD=2)
+    def test_network_errors_and_5xx_open_the_circuit(self):
+        with mock.patch.object(self.toolkit, '_post', side_effect=requests.ConnectionError('offline')):
+            with self.assertRaises(requests.ConnectionError):
+                self.toolkit.sign_in_with_password('user@example.com', 'secret')
+        with mock.patch.object(self.toolkit, '_post', return_value=self.response(503)):
+            self.toolkit.sign_in_with_password('user@example.com', 'secret')
+        
+        with mock.patch.object(self.toolkit, '_post') as post:
+            with self.assertRaises(CircuitOpenError):
+                self.toolkit.sign_in_with_password('user@example.com', 'secret')
+            post.assert_not_called()
+        # Cada endpoint tem o seu circuito
+        self.assertFalse(get_breaker('accounts:signUp').is_open)
+    
+    @override_settings(FIREBASE_CIRCUIT_FAILURE_THRESHOLD=1)
+    def test_4xx_and_local_errors_do_not_count(self):
+        with mock.patch.object(self.toolkit, '_post', return_value=self.response(400)):
+            self.toolkit.sign_in_with_password('user@example.com', 'wrong')
+        with mock.patch.object(self.toolkit, '_post', side_effect=ValueError('bug local')):
+            with self.assertRaises(ValueError):
+                self.toolkit.sign_in_with_password('user@example.com', 'secret')
+        
+        self.assertEqual(get_breaker('accounts:signInWithPassword').state, CLOSED)
+    
+    @override_settings(FIREBASE_CIRCUIT_BREAKER_ENABLED=False, FIREBASE_CIRCUIT_FAILURE_THRESHOLD=1)
+    def test_disabled(self):
+        with mock.patch.object(self.toolkit, '_post', return_value=self.response(503)):
+            for _ in range(3):
+                self.toolkit.sign_in_with_password('user@example.com', 'secret')
+
+@override_settings(FIREBASE_CIRCUIT_FAILURE_THRESHOLD=1, FIREBASE_CIRCUIT_RECOVERY_TIMEOUT=30)
+class CircuitOpenViewTests(TestCase):
+    def setUp(self):
+        reset_breakers()
+        self.addCleanup(reset_breakers)
+        patcher = mock.patch('accounts.ratelimit._limiter', LocalRateLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def open_circuit(self, name):
+        breaker = get_breaker(name)
+        breaker.before_call()
+        breaker.record_failure()
+    
+    def test_login_returns_503_with_retry_after(self):
+        self.open_circuit('accounts:signInWithPassword')
+        with mock.patch('accounts.http_client.IdentityToolkitClient._post') as post:
+            response = self.client.post('/login/', {'email': 'user@example.com', 'password': 'secret'})
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        post.assert_not_called()
+    
+    def test_register_returns_503(self):
+        self.open_circuit('accounts:signUp')
+        response = self.client.post(
+            '/register/',
+            {'email': 'user@example.com', 'password': 'secret1', 'confirm_password': 'secret1'},
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+    
+    def test_health(self):
+        get_breaker('accounts:signUp')
+        self.assertEqual(self.client.get('/health/').json()['status'], 'ok')
+        
+        self.open_circuit('accounts:signInWithPassword')
+        health = self.client.get('/health/').json()
+        self.assertEqual(health['status'], 'degraded')
+        self.assertEqual(health['circuits']['accounts:signInWithPassword']['state'], OPEN)
+        self.assertEqual(health['circuits']['accounts:signUp']['state'], CLOSED)
@@ -0,0 +1,258 @@
+from datetime import timedelta
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from unittest import mock
+from accounts import events
+from accounts.events import (
+    InvalidEvent,
+    SIGNATURE_HEADER,
+    parse_events,
+    process_events,
+    purge_processed_events,
+    sign_payload,
+    verify_signature,
+)
+from accounts.models import CustomUser, FirebaseOutbox, FirebaseUserEvent
+import json
+import time
+
+def make_event(event_id, event_type, uid, event_time, email=None, **data):
+    return {'id': event_id, 'type': event_type, 'time': event_time, 'data': {'uid': uid, 'email': email, **data}}
+
+class SignatureTests(SimpleTestCase):
+    body = b'{"events": []}'
+    
+    def test_valid_signature(self):
+        self.assertTrue(verify_signature(self.body, sign_payload(self.body, 's1'), ['s1'], 300))
+    
+    def test_any_configured_secret_is_accepted(self):
+        self.assertTrue(verify_signature(self.body, sign_payload(self.body, 'old'), ['new', 'old'], 300))
+    
+    def test_wrong_secret_or_tampered_body(self):
+        self.assertFalse(verify_signature(self.body, sign_payload(self.body, 'other'), ['s1'], 300))
+        self.assertFalse(verify_signature(b'{"events": [1]}', sign_payload(self.body, 's1'), ['s1'], 300))
+    
+    def test_timestamp_outside_tolerance(self):
+        self.assertFalse(verify_signature(self.body, sign_payload(self.body, 's1', time.time() - 301), ['s1'], 300))
+        self.assertFalse(verify_signature(self.body, sign_payload(self.body, 's1', time.time() + 301), ['s1'], 300))
+        self.assertTrue(verify_signature(self.body, sign_payload(self.body, 's1', time.time() - 290), ['s1'], 300))
+    
+    def test_malformed_header(self):
+        for header in (None, '', 'v1=abc', 't=abc,v1=abc', f't={int(time.time())}'):
+            self.assertFalse(verify_signature(self.body, header, ['s1'], 300))
+
+class ParseEventsTests(SimpleTestCase):
+    def parse(self, *raw):
+        return parse_events(json.dumps({'events': list(raw)}).encode())
+    
+    def test_rfc3339_times(self):
+        for value in ('2024-01-01T00:00:00Z', '2024-01-01T00:00:00.000Z', '2024-01-01T00:00:00.000000000Z'):
+            self.assertEqual(self.parse(make_event('e1', 'user.updated', 'u1', value))[0]['event_time'], 1704067200000)
+        self.assertEqual(
+            self.parse(make_event('e1', 'user.updated', 'u1', '2024-01-01T02:00:00.5+02:00'))[0]['event_time'],
+            1704067200500,
+        )
+    
+    def test_epoch_and_user_record_times(self):
+        event = make_event('e1', 'user.created', 'u1', 1704067200, metadata={'creationTime': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+        parsed = self.parse(event)[0]
+        self.assertEqual(parsed['event_time'], 1704067200000)
+        self.assertEqual(parsed['payload']['created_at'], 1704067200000)
+    
+    def test_single_event_body(self):
+        body = json.dumps(make_event('e1', 'providers/firebase.auth/eventTypes/user.delete', 'u1', 1)).encode()
+        self.assertEqual(parse_events(body)[0]['event_type'], FirebaseUserEvent.TYPE_DELETED)
+    
+    def test_invalid_events(self):
+        for raw in (
+            {'type': 'user.created', 'data': {'uid': 'u1'}},
+            {'id': 'e1', 'type': 'user.renamed', 'data': {'uid': 'u1'}},
+            {'id': 'e1', 'type': 'user.created', 'data': {}},
+            make_event('e1', 'user.created', 'u1', 'yesterday'),
+        ):
+            with self.assertRaises(InvalidEvent):
+                self.parse(raw)
+        with self.assertRaises(InvalidEvent):
+            parse_events(b'not json')
+
+@override_settings(FIREBASE_WEBHOOK_SECRETS=['current', 'previous'], FIREBASE_WEBHOOK_TOLERANCE=300)
+class FirebaseEventsViewTests(TestCase):
+    def post(self, events, secret='current', timestamp=None, body=None):
+        body = body if body is not None else json.dumps({'events': events}).encode()
+        return self.client.post(
+            '/firebase/events/',
+            body,
+            content_type='application/json',
+            headers={SIGNATURE_HEADER: sign_payload(body, secret, timestamp)},
+        )
+    
+    def test_valid_signature_is_accepted(self):
+        response = self.post([
+            make_event('e1', 'user.created', 'u1', '2024-01-01T00:00:00.000Z', 'a@example.com'),
+            make_event('e2', 'user.created', 'u2', '2024-01-01T00:00:00.000Z', 'b@example.com'),
+        ])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'accepted': 2, 'duplicates': 0})
+        self.assertEqual(FirebaseUserEvent.objects.filter(status=FirebaseUserEvent.STATUS_PENDING).count(), 2)
+    
+    def test_previous_secret_is_accepted(self):
+        self.assertEqual(self.post([make_event('e1', 'user.created', 'u1', 1, 'a@example.com')], secret='previous').status_code, 202)
+    
+    def test_bad_signature_is_rejected(self):
+        response = self.post([make_event('e1', 'user.created', 'u1', 1, 'a@example.com')], secret='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(FirebaseUserEvent.objects.exists())
+    
+    def test_expired_signature_is_rejected(self):
+        response = self.post([make_event('e1', 'user.created', 'u1', 1, 'a@example.com')], timestamp=time.time() - 600)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(FirebaseUserEvent.objects.exists())
+    
+    def test_missing_signature_is_rejected(self):
+        response = self.client.post('/firebase/events/', b'{}', content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+    
+    def test_invalid_event_is_rejected(self):
+        response = self.post([{'id': 'e1', 'type': 'user.renamed', 'data': {'uid': 'u1'}}])
+        self.assertEqual(response.status_code, 400)
+    
+    def test_duplicate_id_is_counted_as_duplicate(self):
+        event = make_event('e1', 'user.created', 'u1', 1, 'a@example.com')
+        self.post([event])
+        
+        response = self.post([event, make_event('e2', 'user.updated', 'u1', 2, 'a@example.com')])
+        self.assertEqual(response.json(), {'accepted': 1, 'duplicates': 1})
+        self.assertEqual(self.post([event, event]).json(), {'accepted': 0, 'duplicates': 2})
+        self.assertEqual(FirebaseUserEvent.objects.count(), 2)
+    
+    def test_only_post(self):
+        self.assertEqual(self.client.get('/firebase/events/').status_code, 405)
+    
+    @override_settings(FIREBASE_WEBHOOK_SECRETS=[])
+    def test_disabled_without_secrets(self):
+        self.assertEqual(self.post([make_event('e1', 'user.created', 'u1', 1, 'a@example.com')]).status_code, 404)
+    
+    def test_out_of_order_events_are_dropped(self):
+        self.post([make_event('e2', 'user.updated', 'u1', 2000, 'new@example.com')])
+        self.post([make_event('e1', 'user.created', 'u1', 1000, 'old@example.com')])
+        self.assertEqual(process_events(), (2, 0))
+        self.assertEqual(CustomUser.objects.get(firebase_uid='u1').email, 'new@example.com')
+        
+        # Chegou depois de um evento mais novo já aplicado
+        self.post([make_event('e0', 'user.updated', 'u1', 1500, 'stale@example.com')])
+        self.assertEqual(process_events(), (1, 0))
+        self.assertEqual(CustomUser.objects.get(firebase_uid='u1').email, 'new@example.com')
+        self.assertEqual(FirebaseUserEvent.objects.get(event_id='e0').status, FirebaseUserEvent.STATUS_PROCESSED)
+
+class ProcessEventsTests(TestCase):
+    def store(self, *raw):
+        events.store_events(parse_events(json.dumps({'events': list(raw)}).encode()))
+    
+    def status(self, event_id):
+        return FirebaseUserEvent.objects.get(event_id=event_id).status
+    
+    def test_create_update_delete(self):
+        self.store(
+            make_event('e1', 'user.created', 'u1', 1000, 'ada@example.com', displayName='Ada'),
+            make_event('e2', 'user.created', 'u2', 1000, 'bob@example.com'),
+        )
+        self.assertEqual(process_events(), (2, 0))
+        self.assertEqual(CustomUser.objects.get(firebase_uid='u1').username, 'Ada')
+        
+        self.store(
+            make_event('e3', 'user.updated', 'u1', 2000, 'ada@example.com', emailVerified=True),
+            make_event('e4', 'user.deleted', 'u2', 2000),
+        )
+        self.assertEqual(process_events(), (2, 0))
+        self.assertTrue(CustomUser.objects.get(firebase_uid='u1').email_verified)
+        self.assertFalse(CustomUser.objects.filter(firebase_uid='u2').exists())
+        # Gravações vindas do Firebase não voltam para ele
+        self.assertFalse(FirebaseOutbox.objects.exists())
+    
+    def test_nothing_pending(self):
+        self.assertEqual(process_events(), (0, 0))
+    
+    def failing_reconcile(self, bad_uid):
+        reconcile = events.reconcile_firebase_users
+        
+        def fake(firebase_users, errors=None, **kwargs):
+            reconcile([user for user in firebase_users if user.uid != bad_uid], errors=errors, **kwargs)
+            if any(user.uid == bad_uid for user in firebase_users):
+                errors[bad_uid] = ValueError('falha ao gravar')
+        
+        return mock.patch.object(events, 'reconcile_firebase_users', side_effect=fake)
+    
+    def test_failed_user_write_is_retried(self):
+        self.store(
+            make_event('e1', 'user.created', 'good', 1000, 'good@example.com'),
+            make_event('e2', 'user.created', 'bad', 1000, 'bad@example.com'),
+        )
+        with self.failing_reconcile('bad'):
+            self.assertEqual(process_events(), (1, 1))
+        
+        self.assertEqual(self.status('e1'), FirebaseUserEvent.STATUS_PROCESSED)
+        failed = FirebaseUserEvent.objects.get(event_id='e2')
+        self.assertEqual((failed.status, failed.attempts), (FirebaseUserEvent.STATUS_PENDING, 1))
+        self.assertIn('falha ao gravar', failed.last_error)
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+        
+        # Ainda em backoff
+        self.assertEqual(process_events(), (0, 0))
+        FirebaseUserEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_events(), (1, 0))
+        self.assertTrue(CustomUser.objects.filter(firebase_uid='bad').exists())
+    
+    @override_settings(FIREBASE_EVENTS_MAX_ATTEMPTS=2)
+    def test_gives_up_only_on_the_failing_uid(self):
+        self.store(make_event('e1', 'user.created', 'bad', 1000, 'bad@example.com'))
+        with self.failing_reconcile('bad'):
+            for _ in range(2):
+                FirebaseUserEvent.objects.update(next_attempt_at=timezone.now())
+                self.store(make_event(f'good-{time.monotonic_ns()}', 'user.created', 'good', 1000, 'good@example.com'))
+                process_events()
+        
+        self.assertEqual(self.status('e1'), FirebaseUserEvent.STATUS_FAILED)
+        self.assertFalse(
+            FirebaseUserEvent.objects.filter(firebase_uid='good').exclude(status=FirebaseUserEvent.STATUS_PROCESSED).exists()
+        )
+    
+    def test_batch_exception_is_isolated_per_uid(self):
+        self.store(
+            make_event('e1', 'user.created', 'u1', 1000, 'a@example.com'),
+            make_event('e2', 'user.created', 'u2', 1000, 'b@example.com'),
+            make_event('e3', 'user.deleted', 'u3', 1000),
+        )
+        reconcile = events.reconcile_firebase_users
+        
+        def fake(firebase_users, **kwargs):
+            if any(user.uid == 'u2' for user in firebase_users):
+                raise RuntimeError('banco indisponível')
+            return reconcile(firebase_users, **kwargs)
+        
+        with mock.patch.object(events, 'reconcile_firebase_users', side_effect=fake):
+            self.assertEqual(process_events(), (2, 1))
+        
+        self.assertEqual(self.status('e1'), FirebaseUserEvent.STATUS_PROCESSED)
+        self.assertEqual(self.status('e2'), FirebaseUserEvent.STATUS_PENDING)
+        self.assertEqual(self.status('e3'), FirebaseUserEvent.STATUS_PROCESSED)
+        self.assertTrue(CustomUser.objects.filter(firebase_uid='u1').exists())
+    
+    def test_events_of_one_uid_are_applied_in_order(self):
+        self.store(
+            make_event('e3', 'user.updated', 'u1', 3000, 'third@example.com'),
+            make_event('e1', 'user.created', 'u1', 1000, 'first@example.com'),
+            make_event('e2', 'user.updated', 'u1', 2000, 'second@example.com'),
+        )
+        self.assertEqual(process_events(), (3, 0))
+        self.assertEqual(CustomUser.objects.get(firebase_uid='u1').email, 'third@example.com')
+    
+    def test_purge_keeps_recent_events(self):
+        self.store(
+            make_event('old', 'user.created', 'u1', 1000, 'a@example.com'),
+            make_event('new', 'user.created', 'u2', 1000, 'b@example.com'),
+        )
+        process_events()
+        FirebaseUserEvent.objects.filter(event_id='old').update(processed_at=timezone.now() - timedelta(days=8))
+        
+        self.assertEqual(purge_processed_events(7), 1)
+        self.assertEqual(list(FirebaseUserEvent.objects.values_list('event_id', flat=True)), ['new'])
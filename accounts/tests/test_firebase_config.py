@@ -0,0 +1,59 @@
+from django.test import SimpleTestCase
+from pathlib import Path
+from unittest import mock
+from accounts.benchmarks.fakes import FakeAuth, fake_firebase_auth
+import contextlib
+import firebase_config
+import io
+
+class InitializeFirebaseTests(SimpleTestCase):
+    def setUp(self):
+        for name, value in (('_firebase_initialized', False), ('_firebase_init_failed', False), ('auth', None)):
+            patcher = mock.patch.object(firebase_config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('firebase_admin._apps', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def initialize(self, times):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            results = [firebase_config.initialize_firebase() for _ in range(times)]
+        return results, output.getvalue()
+    
+    def test_missing_credentials_are_reported_once(self):
+        with mock.patch.object(firebase_config, 'get_service_account_info', return_value=None) as service_account:
+            with mock.patch.object(firebase_config, 'SERVICE_ACCOUNT_FILE', Path('/nonexistent/service-account.json')):
+                results, output = self.initialize(3)
+        
+        self.assertEqual(results, [False] * 3)
+        self.assertEqual(output.count('Credenciais do Firebase não configuradas'), 1)
+        service_account.assert_called_once()
+    
+    def test_initialization_error_is_not_retried(self):
+        with mock.patch.object(firebase_config, '_initialize_firebase_app', side_effect=ValueError('chave inválida')) as init:
+            results, output = self.initialize(2)
+        
+        self.assertEqual(results, [False, False])
+        self.assertEqual(output.count('chave inválida'), 1)
+        init.assert_called_once()
+
+
+class GetFirebaseUsersTests(SimpleTestCase):
+    def test_returns_dicts(self):
+        with fake_firebase_auth(FakeAuth(3)) as fake_auth:
+            users = firebase_config.get_firebase_users()
+        
+        self.assertEqual(len(users), 3)
+        self.assertEqual(users[0]['uid'], fake_auth.uid_for(0))
+        self.assertEqual(
+            set(users[0]),
+            {'uid', 'email', 'email_verified', 'display_name', 'created_at', 'last_refresh_at', 'last_sign_in_at'},
+        )
+        self.assertEqual(users[0]['display_name'], users[0]['email'].split('@')[0])
+    
+    def test_sync_path_keeps_the_compact_records(self):
+        with fake_firebase_auth(FakeAuth(3)):
+            pages = list(firebase_config.iter_firebase_user_pages())
+        self.assertTrue(all(isinstance(user, firebase_config.FirebaseUserRecord) for page in pages for user in page))
@@ -0,0 +1,214 @@
+from django.test import SimpleTestCase
+from unittest import mock
+from urllib3.util.retry import Retry
+from accounts import http_client
+from accounts.circuit import reset_breakers
+from accounts.http_client import (
+    AsyncIdentityToolkitClient,
+    IdentityToolkitClient,
+    get_async_identity_toolkit_client,
+    get_identity_toolkit_client,
+)
+import asyncio
+import httpx
+import requests
+import socket
+
+def response(status_code):
+    result = requests.Response()
+    result.status_code = status_code
+    return result
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class FakeClock:
+    """time.monotonic controlado pelo teste"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+class HttpClientTestMixin:
+    def setUp(self):
+        super().setUp()
+        reset_breakers()
+        self.addCleanup(reset_breakers)
+        patcher = mock.patch.object(http_client.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+class IdentityToolkitClientTests(HttpClientTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = IdentityToolkitClient(base_url='https://toolkit.test', api_key='key', retries=2)
+        self.addCleanup(self.client.close)
+    
+    def post_returns(self, *results):
+        patcher = mock.patch.object(self.client.session, 'post', side_effect=results)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+    
+    def test_idempotent_call_retries_on_5xx(self):
+        post = self.post_returns(response(502), response(503), response(200))
+        self.assertEqual(self.client.sign_in_with_password('ada@example.com', 'secret').status_code, 200)
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], [0.1, 0.2])
+    
+    def test_retries_are_bounded(self):
+        post = self.post_returns(*[response(504)] * 5)
+        self.assertEqual(self.client.sign_in_with_password('ada@example.com', 'secret').status_code, 504)
+        self.assertEqual(post.call_count, 3)
+    
+    def test_4xx_is_not_retried(self):
+        post = self.post_returns(response(400))
+        self.assertEqual(self.client.sign_in_with_password('ada@example.com', 'wrong').status_code, 400)
+        self.assertEqual(post.call_count, 1)
+    
+    def test_idempotent_call_retries_on_read_timeout(self):
+        post = self.post_returns(requests.exceptions.ReadTimeout(), response(200))
+        self.assertEqual(self.client.sign_in_with_password('ada@example.com', 'secret').status_code, 200)
+        self.assertEqual(post.call_count, 2)
+    
+    def test_non_idempotent_call_is_not_retried(self):
+        post = self.post_returns(response(503))
+        self.assertEqual(self.client.sign_up('ada@example.com', 'secret').status_code, 503)
+        self.assertEqual(post.call_count, 1)
+        
+        # O servidor pode ter criado a conta antes do timeout
+        post = self.post_returns(requests.exceptions.ReadTimeout())
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client.sign_up('ada@example.com', 'secret')
+        self.assertEqual(post.call_count, 1)
+    
+    def test_connect_errors_are_retried_for_any_call(self):
+        client = IdentityToolkitClient(base_url=f'http://127.0.0.1:{closed_port()}', api_key='key', retries=2)
+        self.addCleanup(client.close)
+        
+        for call in (client.sign_in_with_password, client.sign_up):
+            with mock.patch.object(Retry, 'increment', autospec=True, side_effect=Retry.increment) as increment:
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    call('ada@example.com', 'secret')
+            # A requisição nunca chegou ao servidor: 1 tentativa + 2 novas
+            self.assertEqual(increment.call_count, 3)
+    
+    def test_stats(self):
+        self.post_returns(response(503), requests.exceptions.ReadTimeout(), response(200))
+        self.client.sign_in_with_password('ada@example.com', 'secret')
+        self.post_returns(requests.exceptions.ConnectionError())
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.sign_up('ada@example.com', 'secret')
+        
+        stats = self.client.stats()
+        self.assertEqual((stats['requests'], stats['errors'], stats['retries']), (4, 3, 2))
+        self.assertGreaterEqual(stats['latency_avg'], 0)
+    
+    def test_total_timeout_caps_the_attempts(self):
+        client = IdentityToolkitClient(base_url='https://toolkit.test', api_key='key', retries=5, total_timeout=12)
+        clock = FakeClock()
+        timeouts = []
+        
+        def slow_post(*args, timeout=None, **kwargs):
+            timeouts.append(timeout)
+            clock.now += timeout[1]
+            raise requests.exceptions.ReadTimeout()
+        
+        with mock.patch.object(http_client.time, 'monotonic', clock):
+            with mock.patch.object(client.session, 'post', side_effect=slow_post):
+                with self.assertRaises(requests.exceptions.ReadTimeout):
+                    client.sign_in_with_password('ada@example.com', 'secret')
+        
+        # 10s na primeira tentativa, só os 2s restantes na segunda e nenhuma depois do prazo
+        self.assertEqual(timeouts, [(3.05, 10), (2, 2)])
+        self.assertEqual(client.stats()['retries'], 1)
+    
+    def test_no_retry_when_the_backoff_passes_the_deadline(self):
+        client = IdentityToolkitClient(base_url='https://toolkit.test', api_key='key', retries=2, total_timeout=1)
+        clock = FakeClock()
+        
+        def slow_503(*args, **kwargs):
+            clock.now += 0.95
+            return response(503)
+        
+        with mock.patch.object(http_client.time, 'monotonic', clock):
+            with mock.patch.object(client.session, 'post', side_effect=slow_503) as post:
+                self.assertEqual(client.sign_in_with_password('ada@example.com', 'secret').status_code, 503)
+        self.assertEqual(post.call_count, 1)
+        self.sleep.assert_not_called()
+
+class AsyncIdentityToolkitClientTests(HttpClientTestMixin, SimpleTestCase):
+    def run_with(self, handler, call, **kwargs):
+        requests_seen = []
+        
+        def record(request):
+            requests_seen.append(request)
+            return handler(len(requests_seen))
+        
+        async def main():
+            client = AsyncIdentityToolkitClient(base_url='https://toolkit.test', api_key='key', retries=2, **kwargs)
+            await client.aclose()
+            client.client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+            try:
+                with mock.patch.object(http_client.asyncio, 'sleep', mock.AsyncMock()):
+                    return await getattr(client, call)('ada@example.com', 'secret'), client
+            finally:
+                await client.aclose()
+        
+        result, client = asyncio.run(main())
+        return result, requests_seen, client
+    
+    def test_idempotent_call_retries_on_5xx(self):
+        result, seen, client = self.run_with(
+            lambda count: httpx.Response(503 if count < 3 else 200), 'sign_in_with_password'
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(client.stats()['retries'], 2)
+    
+    def test_non_idempotent_call_is_not_retried(self):
+        result, seen, _ = self.run_with(lambda count: httpx.Response(503), 'sign_up')
+        self.assertEqual(result.status_code, 503)
+        self.assertEqual(len(seen), 1)
+    
+    def test_attempt_timeout_comes_from_the_deadline(self):
+        _, seen, _ = self.run_with(lambda count: httpx.Response(200), 'sign_in_with_password', total_timeout=4)
+        timeout = seen[0].extensions['timeout']
+        self.assertEqual(timeout['connect'], 3.05)
+        # O que resta dos 4s de prazo, e não os 10s do FIREBASE_HTTP_READ_TIMEOUT
+        self.assertTrue(3.5 < timeout['read'] <= 4)
+
+class SharedClientTests(SimpleTestCase):
+    def test_sync_client_is_recreated_after_fork(self):
+        with mock.patch.object(http_client, '_client', None):
+            first = get_identity_toolkit_client()
+            self.assertIs(get_identity_toolkit_client(), first)
+            with mock.patch.object(http_client.os, 'getpid', return_value=-1):
+                second = get_identity_toolkit_client()
+            self.assertIsNot(second, first)
+        first.close()
+        second.close()
+    
+    def test_async_client_per_event_loop(self):
+        async def clients():
+            return get_async_identity_toolkit_client(), get_async_identity_toolkit_client()
+        
+        first, same = asyncio.run(clients())
+        other, _ = asyncio.run(clients())
+        self.assertIs(first, same)
+        self.assertIsNot(first, other)
+    
+    def test_async_client_is_recreated_after_fork(self):
+        async def main():
+            first = get_async_identity_toolkit_client()
+            # O filho do fork herda o loop, mas não pode usar as conexões do pai
+            with mock.patch.object(http_client.os, 'getpid', return_value=-1):
+                after_fork = get_async_identity_toolkit_client()
+                self.assertIs(get_async_identity_toolkit_client(), after_fork)
+            return first, after_fork
+        
+        first, after_fork = asyncio.run(main())
+        self.assertIsNot(first, after_fork)
@@ -0,0 +1,180 @@
+from datetime import timedelta
+from django.contrib.auth.signals import user_logged_in
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock
+from accounts import last_login
+from accounts.last_login import LastLoginBuffer, install_last_login_buffer, uninstall_last_login_buffer
+from accounts.models import CustomUser, FirebaseOutbox, suppress_firebase_sync
+import time
+
+def make_users(count):
+    with suppress_firebase_sync():
+        return [CustomUser.objects.create_user(f'user{index}', f'user{index}@example.com') for index in range(count)]
+
+def stored_last_login(user):
+    return CustomUser.objects.values_list('last_login', flat=True).get(pk=user.pk)
+
+class LastLoginBufferTests(TestCase):
+    def setUp(self):
+        self.buffer = LastLoginBuffer(interval=3600, batch_size=100)
+        self.addCleanup(self.buffer.stop)
+        self.users = make_users(3)
+        self.now = timezone.now()
+    
+    def test_logins_are_coalesced_per_user(self):
+        user = self.users[0]
+        self.buffer.record(user, self.now)
+        self.buffer.record(user, self.now + timedelta(seconds=2))
+        # Um login mais antigo que chega atrasado não sobrescreve o mais novo
+        self.buffer.record(user, self.now + timedelta(seconds=1))
+        self.buffer.record(self.users[1], self.now)
+        
+        self.assertEqual(self.buffer.pending_count, 2)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(stored_last_login(user), self.now + timedelta(seconds=2))
+        self.assertEqual(stored_last_login(self.users[1]), self.now)
+        self.assertIsNone(stored_last_login(self.users[2]))
+    
+    def test_record_does_not_write(self):
+        with self.assertNumQueries(0):
+            self.buffer.record(self.users[0], self.now)
+        self.assertEqual(self.users[0].last_login, self.now)
+        self.assertIsNone(stored_last_login(self.users[0]))
+    
+    def test_flush_uses_bulk_update_in_batches(self):
+        self.buffer.batch_size = 2
+        for user in self.users:
+            self.buffer.record(user, self.now)
+        
+        with mock.patch.object(CustomUser.objects, 'bulk_update', wraps=CustomUser.objects.bulk_update) as bulk_update:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.buffer.flush(), 3)
+        bulk_update.assert_called_once_with(mock.ANY, ['last_login'], batch_size=2)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(self.buffer.pending_count, 0)
+        self.assertEqual(self.buffer.flush(), 0)
+    
+    def test_database_error_requeues_the_entries(self):
+        user = self.users[0]
+        self.buffer.record(user, self.now)
+        with mock.patch.object(CustomUser.objects, 'bulk_update', side_effect=DatabaseError('database is locked')):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending_count, 1)
+        
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(stored_last_login(user), self.now)
+    
+    def test_requeue_keeps_a_newer_login(self):
+        user = self.users[0]
+        self.buffer.record(user, self.now)
+        newer = self.now + timedelta(seconds=5)
+        
+        def fail(*args, **kwargs):
+            # Login do mesmo usuário enquanto o lote estava sendo gravado
+            self.buffer.record(user, newer)
+            raise DatabaseError('database is locked')
+        
+        with mock.patch.object(CustomUser.objects, 'bulk_update', side_effect=fail):
+            self.buffer.flush()
+        self.buffer.flush()
+        self.assertEqual(stored_last_login(user), newer)
+    
+    def test_flush_invalidates_the_cached_users(self):
+        for user in self.users[:2]:
+            self.buffer.record(user, self.now)
+        with mock.patch.object(last_login.user_cache, 'invalidate_pks') as invalidate_pks:
+            self.buffer.flush()
+        invalidate_pks.assert_called_once()
+        self.assertCountEqual(invalidate_pks.call_args.args[0], [self.users[0].pk, self.users[1].pk])
+    
+    def test_failed_flush_does_not_invalidate(self):
+        self.buffer.record(self.users[0], self.now)
+        with mock.patch.object(last_login.user_cache, 'invalidate_pks') as invalidate_pks:
+            with mock.patch.object(CustomUser.objects, 'bulk_update', side_effect=DatabaseError()):
+                self.buffer.flush()
+        invalidate_pks.assert_not_called()
+    
+    def test_no_outbox_entries_or_save_signals(self):
+        receiver = mock.Mock()
+        post_save.connect(receiver, sender=CustomUser)
+        self.addCleanup(post_save.disconnect, receiver, sender=CustomUser)
+        
+        for user in self.users:
+            self.buffer.record(user, self.now)
+        self.buffer.flush()
+        
+        receiver.assert_not_called()
+        self.assertFalse(FirebaseOutbox.objects.exists())
+
+class InstallLastLoginBufferTests(TestCase):
+    def setUp(self):
+        self.buffer = LastLoginBuffer(interval=3600)
+        self.user = make_users(1)[0]
+        patcher = mock.patch.object(last_login, 'atexit')
+        self.atexit = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_login_is_buffered_and_flushed_at_exit(self):
+        install_last_login_buffer(self.buffer)
+        self.addCleanup(uninstall_last_login_buffer, self.buffer)
+        self.atexit.register.assert_called_once_with(self.buffer.stop)
+        
+        user_logged_in.send(sender=CustomUser, request=None, user=self.user)
+        self.assertEqual(self.buffer.pending_count, 1)
+        self.assertIsNone(stored_last_login(self.user))
+        
+        # O que o atexit chama ao encerrar o processo
+        self.atexit.register.call_args.args[0]()
+        self.assertEqual(self.buffer.pending_count, 0)
+        self.assertEqual(stored_last_login(self.user), self.user.last_login)
+        self.assertFalse(FirebaseOutbox.objects.exists())
+    
+    def test_uninstall_restores_the_synchronous_update(self):
+        install_last_login_buffer(self.buffer)
+        uninstall_last_login_buffer(self.buffer)
+        self.atexit.unregister.assert_called_once_with(self.buffer.stop)
+        
+        user_logged_in.send(sender=CustomUser, request=None, user=self.user)
+        self.assertEqual(self.buffer.pending_count, 0)
+        self.assertIsNotNone(stored_last_login(self.user))
+
+class FlusherThreadTests(TransactionTestCase):
+    def setUp(self):
+        self.users = make_users(2)
+    
+    def wait_until_stored(self, user, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if stored_last_login(user) is not None:
+                return True
+            time.sleep(0.02)
+        return False
+    
+    def test_flush_every_interval(self):
+        buffer = LastLoginBuffer(interval=0.1)
+        self.addCleanup(buffer.stop)
+        buffer.record(self.users[0])
+        self.assertTrue(self.wait_until_stored(self.users[0]))
+    
+    def test_full_batch_flushes_before_the_interval(self):
+        buffer = LastLoginBuffer(interval=3600, batch_size=2)
+        self.addCleanup(buffer.stop)
+        buffer.record(self.users[0])
+        self.assertEqual(buffer.pending_count, 1)
+        
+        buffer.record(self.users[1])
+        self.assertTrue(self.wait_until_stored(self.users[1]))
+        self.assertIsNotNone(stored_last_login(self.users[0]))
+    
+    def test_stop_flushes_and_ends_the_thread(self):
+        buffer = LastLoginBuffer(interval=3600)
+        buffer.record(self.users[0])
+        flusher = buffer._flusher
+        buffer.stop()
+        
+        self.assertFalse(flusher.is_alive())
+        self.assertIsNotNone(stored_last_login(self.users[0]))
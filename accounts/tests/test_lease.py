@@ -0,0 +1,131 @@
+from datetime import timedelta
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from unittest import mock
+from accounts import scheduler, sync_utils
+from accounts.lease import SyncLease, SyncLeaseLost, SyncLeaseUnavailable
+from accounts.models import FirebaseSyncLease
+from accounts.scheduler import SyncScheduler, run_scheduled_sync
+import threading
+import time
+
+def hold_lease(owner, expires_in, name='firebase-sync'):
+    now = timezone.now()
+    FirebaseSyncLease.objects.update_or_create(
+        name=name,
+        defaults={'owner': owner, 'acquired_at': now, 'heartbeat_at': now, 'expires_at': now + timedelta(seconds=expires_in)},
+    )
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+class SyncLeaseTests(TestCase):
+    def lease(self, owner):
+        lease = SyncLease(ttl=60, owner=owner)
+        self.addCleanup(lease.release)
+        return lease
+    
+    def test_acquire_when_free(self):
+        lease = self.lease('host-a').acquire()
+        self.assertTrue(lease.held)
+        row = FirebaseSyncLease.objects.get(name='firebase-sync')
+        self.assertEqual(row.owner, 'host-a')
+        self.assertGreater(row.expires_at, timezone.now() + timedelta(seconds=50))
+        lease.check()
+    
+    def test_unavailable_while_another_holder_is_live(self):
+        hold_lease('host-a', 30)
+        with self.assertRaisesMessage(SyncLeaseUnavailable, 'host-a'):
+            self.lease('host-b').acquire()
+        self.assertEqual(FirebaseSyncLease.objects.get().owner, 'host-a')
+    
+    def test_only_one_of_two_contenders_wins(self):
+        self.lease('host-a').acquire()
+        with self.assertRaises(SyncLeaseUnavailable):
+            self.lease('host-b').acquire()
+    
+    def test_takeover_after_expiry(self):
+        # O dono morreu sem liberar: o lease expira sozinho
+        hold_lease('dead-host', -1)
+        self.lease('host-b').acquire()
+        self.assertEqual(FirebaseSyncLease.objects.get().owner, 'host-b')
+    
+    def test_release_frees_the_lease(self):
+        lease = self.lease('host-a').acquire()
+        lease.release()
+        self.assertFalse(lease.held)
+        self.assertEqual(FirebaseSyncLease.objects.get().owner, '')
+        self.lease('host-b').acquire()
+    
+    def test_release_does_not_free_a_lease_taken_over(self):
+        lease = self.lease('host-a').acquire()
+        hold_lease('host-b', 30)
+        lease.release()
+        self.assertEqual(FirebaseSyncLease.objects.get().owner, 'host-b')
+    
+    def test_context_manager(self):
+        with self.lease('host-a') as lease:
+            self.assertTrue(lease.held)
+        self.assertEqual(FirebaseSyncLease.objects.get().owner, '')
+
+class LeaseHeartbeatTests(TransactionTestCase):
+    """A renovação roda numa thread com conexão própria: precisa ver as linhas já gravadas"""
+    
+    def setUp(self):
+        self.lease = SyncLease(ttl=1, owner='host-a')
+        self.addCleanup(self.lease.release)
+    
+    def test_heartbeat_extends_the_expiry(self):
+        self.lease.acquire()
+        first = FirebaseSyncLease.objects.get().expires_at
+        self.assertTrue(wait_for(lambda: FirebaseSyncLease.objects.get().expires_at > first))
+        self.assertFalse(self.lease.lost)
+        self.lease.check()
+    
+    def test_check_raises_once_the_lease_is_lost(self):
+        self.lease.acquire()
+        hold_lease('host-b', 30)
+        
+        self.assertTrue(wait_for(lambda: self.lease.lost))
+        with self.assertRaises(SyncLeaseLost):
+            self.lease.check()
+        self.assertEqual(FirebaseSyncLease.objects.get().owner, 'host-b')
+
+class SchedulerTests(TestCase):
+    def test_round_is_skipped_while_the_lease_is_held(self):
+        hold_lease('other-node', 30)
+        with mock.patch.object(sync_utils, 'iter_firebase_user_pages') as pages:
+            self.assertIsNone(run_scheduled_sync())
+        pages.assert_not_called()
+        self.assertEqual(FirebaseSyncLease.objects.get().owner, 'other-node')
+    
+    def test_round_runs_the_sync(self):
+        with mock.patch('accounts.sync_utils.sync_firebase_users', return_value=(3, 1, 2, 0)) as sync:
+            self.assertEqual(run_scheduled_sync(), (3, 1, 2, 0))
+        sync.assert_called_once_with()
+    
+    def test_next_delay_stays_within_the_jitter(self):
+        schedule = SyncScheduler(interval=100, jitter=0.1, initial_delay=0)
+        for _ in range(50):
+            self.assertTrue(90 <= schedule.next_delay() <= 110)
+    
+    def test_errors_do_not_stop_the_scheduler(self):
+        rounds = threading.Semaphore(0)
+        
+        def fail():
+            rounds.release()
+            raise RuntimeError('banco indisponível')
+        
+        schedule = SyncScheduler(interval=1, jitter=0, initial_delay=0)
+        with mock.patch.object(schedule, 'next_delay', return_value=0.01):
+            with mock.patch.object(scheduler, 'run_scheduled_sync', side_effect=fail):
+                schedule.start()
+                for _ in range(2):
+                    self.assertTrue(rounds.acquire(timeout=5))
+                schedule.stop(timeout=5)
+        self.assertFalse(schedule._thread.is_alive())
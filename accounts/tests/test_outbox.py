@@ -0,0 +1,218 @@
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from unittest import mock
+from accounts import outbox
+from accounts.lease import SyncLeaseUnavailable
+from accounts.models import CustomUser, FirebaseOutbox, FirebaseSyncLease, suppress_firebase_sync
+from accounts.outbox import OUTBOX_LEASE_NAME, drain_outbox
+from datetime import timedelta
+import threading
+
+def outbox_rows():
+    return list(FirebaseOutbox.objects.order_by('id').values_list('operation', 'fields', 'email', 'display_name'))
+
+class DirtyFieldTests(TestCase):
+    def setUp(self):
+        with suppress_firebase_sync():
+            CustomUser.objects.create_user('ada', 'ada@example.com', 'x', firebase_uid='uid-ada')
+        self.user = CustomUser.objects.get(firebase_uid='uid-ada')
+    
+    def test_last_login_only_save_has_no_outbox_entry(self):
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.user.save()
+        self.assertEqual(outbox_rows(), [])
+    
+    def test_non_firebase_field_has_no_outbox_entry(self):
+        self.user.first_name = 'Ada'
+        self.user.save()
+        self.assertEqual(outbox_rows(), [])
+    
+    def test_only_changed_fields_are_queued(self):
+        self.user.email = 'lovelace@example.com'
+        self.user.save()
+        self.assertEqual(outbox_rows(), [('update', ['email'], 'lovelace@example.com', 'ada')])
+    
+    def test_update_fields_limit_the_dirty_fields(self):
+        self.user.email = 'lovelace@example.com'
+        self.user.username = 'lovelace'
+        self.user.save(update_fields=['username'])
+        self.assertEqual(outbox_rows(), [('update', ['display_name'], 'lovelace@example.com', 'lovelace')])
+    
+    def test_deferred_fields_are_not_dirty(self):
+        user = CustomUser.objects.only('id', 'firebase_uid', 'username').get(pk=self.user.pk)
+        user.username = 'lovelace'
+        user.save()
+        self.assertEqual([row[1] for row in outbox_rows()], [['display_name']])
+    
+    def test_saved_values_become_the_new_snapshot(self):
+        self.user.email = 'lovelace@example.com'
+        self.user.save()
+        FirebaseOutbox.objects.all().delete()
+        
+        self.user.save()
+        self.assertEqual(outbox_rows(), [])
+    
+    def test_change_clears_the_fingerprint(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(firebase_fingerprint='abc')
+        self.user.refresh_from_db()
+        self.user.email = 'lovelace@example.com'
+        self.user.save(update_fields=['email'])
+        self.assertEqual(CustomUser.objects.get(pk=self.user.pk).firebase_fingerprint, '')
+
+class TransactionCoalescingTests(TestCase):
+    def test_create_and_update_in_one_atomic_block(self):
+        with transaction.atomic():
+            user = CustomUser.objects.create_user('ada', 'ada@example.com', 'x')
+            user.email = 'lovelace@example.com'
+            user.save()
+            user.username = 'lovelace'
+            user.save()
+        
+        self.assertEqual(outbox_rows(), [('create', ['display_name', 'email'], 'lovelace@example.com', 'lovelace')])
+    
+    def test_inner_savepoint_rollback_keeps_the_outer_entry(self):
+        with suppress_firebase_sync():
+            user = CustomUser.objects.create_user('ada', 'ada@example.com', 'x', firebase_uid='uid-ada')
+        
+        with transaction.atomic():
+            user.email = 'lovelace@example.com'
+            user.save()
+            try:
+                with transaction.atomic():
+                    user.username = 'rolled-back'
+                    user.save()
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+            self.assertEqual(outbox_rows(), [('update', ['email'], 'lovelace@example.com', 'ada')])
+            
+            user.username = 'lovelace'
+            user.save(update_fields=['username'])
+        
+        self.assertEqual(outbox_rows(), [('update', ['display_name', 'email'], 'lovelace@example.com', 'lovelace')])
+    
+    def test_entry_created_in_a_rolled_back_savepoint_is_recreated(self):
+        with suppress_firebase_sync():
+            user = CustomUser.objects.create_user('ada', 'ada@example.com', 'x', firebase_uid='uid-ada')
+        
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    user.email = 'rolled-back@example.com'
+                    user.save()
+                    raise RuntimeError()
+            except RuntimeError:
+                user.refresh_from_db()
+            
+            user.username = 'lovelace'
+            user.save()
+        
+        self.assertEqual(outbox_rows(), [('update', ['display_name'], 'ada@example.com', 'lovelace')])
+    
+    def test_delete_is_never_merged(self):
+        with transaction.atomic():
+            user = CustomUser.objects.create_user('ada', 'ada@example.com', 'x')
+            user.delete()
+        self.assertEqual([row[0] for row in outbox_rows()], ['create', 'delete'])
+
+class CommittedTransactionTests(TransactionTestCase):
+    def setUp(self):
+        with suppress_firebase_sync():
+            self.user = CustomUser.objects.create_user('ada', 'ada@example.com', 'x', firebase_uid='uid-ada')
+    
+    def test_next_transaction_gets_its_own_entry(self):
+        with transaction.atomic():
+            self.user.email = 'first@example.com'
+            self.user.save()
+        with transaction.atomic():
+            self.user.email = 'second@example.com'
+            self.user.save()
+        
+        self.assertEqual([row[2] for row in outbox_rows()], ['first@example.com', 'second@example.com'])
+    
+    def test_rolled_back_entry_is_not_confused_with_a_reused_id(self):
+        try:
+            with transaction.atomic():
+                self.user.email = 'rolled-back@example.com'
+                self.user.save()
+                rolled_back_id = FirebaseOutbox.objects.get().id
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        
+        # Outro processo grava uma entrada do mesmo UID, que pode receber o id da entrada desfeita
+        committed = FirebaseOutbox.objects.create(
+            id=rolled_back_id,
+            firebase_uid='uid-ada',
+            operation=FirebaseOutbox.OP_UPDATE,
+            email='other@example.com',
+            fields=['email'],
+        )
+        self.assertIn('uid-ada', connection.firebase_outbox_entries)
+        
+        with transaction.atomic():
+            self.user.username = 'lovelace'
+            self.user.save(update_fields=['username'])
+        
+        committed.refresh_from_db()
+        self.assertEqual((committed.fields, committed.display_name), (['email'], ''))
+        self.assertEqual(FirebaseOutbox.objects.count(), 2)
+
+def queue_creates(*usernames):
+    for username in usernames:
+        CustomUser.objects.create_user(username, f'{username}@example.com')
+
+class DrainOutboxTests(TestCase):
+    def test_sends_and_removes_due_entries(self):
+        queue_creates('ada', 'bob')
+        with mock.patch.object(outbox, 'import_firebase_users', return_value={}) as import_users:
+            self.assertEqual(drain_outbox(), (2, 0))
+        self.assertCountEqual([user['display_name'] for user in import_users.call_args.args[0]], ['ada', 'bob'])
+        self.assertFalse(FirebaseOutbox.objects.exists())
+        # O lease fica livre para a próxima rodada
+        self.assertEqual(FirebaseSyncLease.objects.get(name=OUTBOX_LEASE_NAME).owner, '')
+    
+    def test_skips_while_another_worker_holds_the_lease(self):
+        queue_creates('ada')
+        now = timezone.now()
+        FirebaseSyncLease.objects.create(
+            name=OUTBOX_LEASE_NAME, owner='other-worker', acquired_at=now, heartbeat_at=now,
+            expires_at=now + timedelta(seconds=30),
+        )
+        with mock.patch.object(outbox, 'import_firebase_users') as import_users:
+            with self.assertRaises(SyncLeaseUnavailable):
+                drain_outbox()
+        import_users.assert_not_called()
+        self.assertEqual(FirebaseOutbox.objects.get().attempts, 0)
+
+class ConcurrentDrainTests(TransactionTestCase):
+    def test_two_workers_do_not_send_the_same_entries(self):
+        queue_creates('ada', 'bob')
+        sending = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def import_users(users):
+            calls.append([user['uid'] for user in users])
+            sending.set()
+            release.wait(5)
+            return {}
+        
+        results = []
+        with mock.patch.object(outbox, 'import_firebase_users', side_effect=import_users):
+            first = threading.Thread(target=lambda: results.append(drain_outbox()))
+            first.start()
+            self.assertTrue(sending.wait(5))
+            
+            # Segunda réplica do worker enquanto a primeira ainda está enviando
+            with self.assertRaises(SyncLeaseUnavailable):
+                drain_outbox()
+            
+            release.set()
+            first.join(5)
+        
+        self.assertEqual(results, [(2, 0)])
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(FirebaseOutbox.objects.exists())
@@ -0,0 +1,172 @@
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from unittest import mock
+from accounts import sync_utils
+from accounts.models import CustomUser, FirebaseSyncState
+from accounts.pipeline import partition, run_pipeline
+from accounts.reconcile import reconcile_firebase_users
+from firebase_config import FirebaseUserRecord
+import threading
+import time
+import zlib
+
+def keys_for(worker, workers, count):
+    """Chaves que partition() manda para `worker`"""
+    keys = (f'uid-{index}' for index in range(10000))
+    return [key for key in keys if zlib.crc32(key.encode()) % workers == worker][:count]
+
+def run_in_thread(target):
+    outcome = {}
+    
+    def run():
+        try:
+            outcome['result'] = target()
+        except Exception as e:
+            outcome['error'] = e
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+def wait_until_stable(read, settle=0.2, timeout=5):
+    """Espera o valor parar de mudar (ex.: o produtor bloqueado numa fila cheia)"""
+    deadline = time.monotonic() + timeout
+    value = read()
+    while time.monotonic() < deadline:
+        time.sleep(settle)
+        current = read()
+        if current == value:
+            return value
+        value = current
+    return value
+
+class PartitionTests(SimpleTestCase):
+    def test_same_key_always_goes_to_the_same_worker(self):
+        items = [f'uid-{index}' for index in range(200)]
+        first = partition(items, 4, key=str)
+        self.assertEqual(partition(list(reversed(items)), 4, key=str), [list(reversed(bucket)) for bucket in first])
+        self.assertCountEqual([item for bucket in first for item in bucket], items)
+
+class RunPipelineTests(SimpleTestCase):
+    def test_results_match_the_sequential_path(self):
+        pages = [[f'uid-{page}-{index}' for index in range(25)] for page in range(8)]
+        handle = sorted
+        
+        sequential = [item for page in map(handle, pages) for item in page]
+        parallel = run_pipeline(iter(pages), handle, workers=3, queue_depth=2, key=str)
+        
+        self.assertCountEqual([item for result in parallel for item in result], sequential)
+        self.assertTrue(all(result == sorted(result) for result in parallel))
+    
+    def test_same_uid_is_always_handled_by_the_same_writer(self):
+        seen = {}
+        lock = threading.Lock()
+        
+        def handle(part):
+            with lock:
+                for uid in part:
+                    seen.setdefault(uid, set()).add(threading.current_thread().name)
+            return len(part)
+        
+        # Os mesmos UIDs aparecem em várias páginas (ex.: alterados durante a listagem)
+        pages = [[f'uid-{index}' for index in range(30)] for _ in range(5)]
+        results = run_pipeline(iter(pages), handle, workers=4, queue_depth=1, key=str)
+        
+        self.assertEqual(sum(results), 150)
+        self.assertTrue(all(len(threads) == 1 for threads in seen.values()))
+        self.assertGreater(len(set.union(*seen.values())), 1)
+    
+    def test_writer_error_propagates_and_stops_the_producer(self):
+        pulled = []
+        
+        def pages():
+            for index in range(1000):
+                pulled.append(index)
+                yield [f'uid-{index}']
+        
+        def handle(part):
+            raise ValueError('falha ao gravar')
+        
+        with self.assertRaisesMessage(ValueError, 'falha ao gravar'):
+            run_pipeline(pages(), handle, workers=2, queue_depth=1, key=str)
+        self.assertLess(len(pulled), 50)
+    
+    def test_bounded_queue_applies_backpressure(self):
+        release = threading.Event()
+        pulled = []
+        
+        def pages():
+            for index in range(20):
+                pulled.append(index)
+                yield [f'uid-{index}']
+        
+        def handle(part):
+            release.wait(5)
+            return part
+        
+        thread, outcome = run_in_thread(lambda: run_pipeline(pages(), handle, workers=1, queue_depth=2, key=str))
+        # Uma parte no writer, duas na fila e o produtor esperando com a quarta
+        self.assertEqual(wait_until_stable(lambda: len(pulled)), 4)
+        
+        release.set()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(outcome['result']), 20)
+    
+    def test_error_does_not_deadlock_a_producer_blocked_on_a_full_queue(self):
+        slow_keys, failing_keys = keys_for(0, 2, 10), keys_for(1, 2, 1)
+        release = threading.Event()
+        
+        def pages():
+            # O writer 1 falha enquanto o produtor está bloqueado na fila cheia do writer 0
+            yield [slow_keys[0], failing_keys[0]]
+            for key in slow_keys[1:]:
+                yield [key]
+        
+        def handle(part):
+            if part[0] in failing_keys:
+                raise ValueError('falha ao gravar')
+            release.wait(5)
+            return part
+        
+        thread, outcome = run_in_thread(lambda: run_pipeline(pages(), handle, workers=2, queue_depth=1, key=str))
+        time.sleep(0.2)
+        release.set()
+        thread.join(5)
+        
+        self.assertFalse(thread.is_alive())
+        self.assertIsInstance(outcome.get('error'), ValueError)
+
+@override_settings(FIREBASE_ORPHAN_MAX_RATIO=1)
+class PipelineSyncTests(TransactionTestCase):
+    def setUp(self):
+        now = int(time.time() * 1000)
+        self.pages = [
+            [FirebaseUserRecord(f'uid-{page}-{index}', f'user{page}x{index}@example.com', created_at=now) for index in range(20)]
+            for page in range(5)
+        ]
+        # UID alterado durante a listagem: as duas versões vão para o mesmo writer, em ordem
+        self.pages[3].append(FirebaseUserRecord('uid-0-0', 'renamed@example.com', created_at=now))
+    
+    def sync(self, workers):
+        # SQLite em memória não espera pelo lock de escrita: os writers gravam um de cada vez
+        write_lock = threading.Lock()
+        
+        def reconcile(*args, **kwargs):
+            with write_lock:
+                return reconcile_firebase_users(*args, **kwargs)
+        
+        with mock.patch.object(sync_utils, 'iter_firebase_user_pages', lambda page_size=None: iter(self.pages)):
+            with mock.patch.object(sync_utils, 'reconcile_firebase_users', reconcile):
+                result = sync_utils.sync_firebase_users(full=True, workers=workers, queue_depth=1)
+        rows = sorted(CustomUser.objects.values_list('firebase_uid', 'email', 'email_verified'))
+        return result, rows
+    
+    def test_parallel_sync_matches_the_sequential_path(self):
+        sequential = self.sync(workers=0)
+        CustomUser.objects.all().delete()
+        FirebaseSyncState.objects.all().delete()
+        
+        parallel = self.sync(workers=3)
+        self.assertEqual(parallel, sequential)
+        self.assertEqual(sequential[0], (101, 100, 1, 0))
+        self.assertIn(('uid-0-0', 'renamed@example.com', False), parallel[1])
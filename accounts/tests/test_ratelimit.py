@@ -0,0 +1,187 @@
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from unittest import mock
+from accounts import ratelimit
+from accounts.ratelimit import CacheRateLimiter, LocalRateLimiter, check_auth_rate_limit, get_client_ip, parse_rate
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+class ParseRateTests(SimpleTestCase):
+    def test_parse(self):
+        self.assertEqual(parse_rate('10/60'), (10, 60.0))
+        self.assertEqual(parse_rate('5'), (5, 1.0))
+        self.assertIsNone(parse_rate(''))
+        self.assertIsNone(parse_rate(None))
+
+class LocalRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(ratelimit.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = LocalRateLimiter()
+    
+    def test_bucket_allows_burst_then_rejects(self):
+        self.assertEqual(self.limiter.hit('k', 2, 10), 0)
+        self.assertEqual(self.limiter.hit('k', 2, 10), 0)
+        # Uma ficha a cada 5s: a próxima sai em 5s
+        self.assertAlmostEqual(self.limiter.hit('k', 2, 10), 5.0)
+    
+    def test_tokens_refill_over_time(self):
+        for _ in range(2):
+            self.limiter.hit('k', 2, 10)
+        
+        self.clock.now += 2.5
+        self.assertAlmostEqual(self.limiter.hit('k', 2, 10), 2.5)
+        self.clock.now += 2.5
+        self.assertEqual(self.limiter.hit('k', 2, 10), 0)
+        self.assertGreater(self.limiter.hit('k', 2, 10), 0)
+    
+    def test_refill_is_capped_at_the_limit(self):
+        self.limiter.hit('k', 2, 10)
+        self.clock.now += 1000
+        for _ in range(2):
+            self.assertEqual(self.limiter.hit('k', 2, 10), 0)
+        self.assertGreater(self.limiter.hit('k', 2, 10), 0)
+    
+    def test_keys_are_independent(self):
+        self.limiter.hit('a', 1, 10)
+        self.assertGreater(self.limiter.hit('a', 1, 10), 0)
+        self.assertEqual(self.limiter.hit('b', 1, 10), 0)
+    
+    def test_least_recently_used_key_is_evicted(self):
+        limiter = LocalRateLimiter(max_keys=2)
+        limiter.hit('a', 1, 10)
+        limiter.hit('b', 1, 10)
+        limiter.hit('a', 1, 10)
+        limiter.hit('c', 1, 10)
+        
+        # 'a' foi usada depois de 'b' e continua limitada; 'b' saiu e volta com o balde cheio
+        self.assertGreater(limiter.hit('a', 1, 10), 0)
+        self.assertEqual(limiter.hit('b', 1, 10), 0)
+
+class CacheRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = Clock(6000.0)
+        patcher = mock.patch.object(ratelimit.time, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = CacheRateLimiter()
+    
+    def test_limit_within_window(self):
+        self.assertEqual(self.limiter.hit('k', 2, 60), 0)
+        self.assertEqual(self.limiter.hit('k', 2, 60), 0)
+        self.assertEqual(self.limiter.hit('k', 2, 60), 60)
+    
+    def test_previous_window_is_weighted(self):
+        for _ in range(2):
+            self.limiter.hit('k', 2, 60)
+        
+        # Metade da janela anterior ainda conta: 2 * 0.5 + 1 <= 2
+        self.clock.now += 90
+        self.assertEqual(self.limiter.hit('k', 2, 60), 0)
+        self.assertGreater(self.limiter.hit('k', 2, 60), 0)
+        
+        self.clock.now += 60
+        self.assertEqual(self.limiter.hit('k', 2, 60), 0)
+
+@override_settings(
+    FIREBASE_RATELIMIT_ENABLED=True,
+    FIREBASE_RATELIMIT_IP='3/60',
+    FIREBASE_RATELIMIT_EMAIL='2/60',
+    FIREBASE_RATELIMIT_GLOBAL='',
+    FIREBASE_RATELIMIT_IP_HEADER='',
+)
+class CheckAuthRateLimitTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit, '_limiter', LocalRateLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def request(self, ip='10.0.0.1', **extra):
+        return RequestFactory().post('/login/', REMOTE_ADDR=ip, **extra)
+    
+    def test_email_limit(self):
+        for _ in range(2):
+            self.assertIsNone(check_auth_rate_limit(self.request(), 'user@example.com', 'login'))
+        scope, retry_after = check_auth_rate_limit(self.request(), 'USER@example.com ', 'login')
+        self.assertEqual(scope, 'email')
+        self.assertAlmostEqual(retry_after, 30, delta=1)
+    
+    def test_ip_limit(self):
+        for index in range(3):
+            self.assertIsNone(check_auth_rate_limit(self.request(), f'user{index}@example.com', 'login'))
+        self.assertEqual(check_auth_rate_limit(self.request(), 'other@example.com', 'login')[0], 'ip')
+        self.assertIsNone(check_auth_rate_limit(self.request('10.0.0.2'), 'other@example.com', 'login'))
+    
+    @override_settings(FIREBASE_RATELIMIT_GLOBAL='1/60', FIREBASE_RATELIMIT_IP='', FIREBASE_RATELIMIT_EMAIL='')
+    def test_global_limit(self):
+        self.assertIsNone(check_auth_rate_limit(self.request('10.0.0.1'), 'a@example.com', 'login'))
+        self.assertEqual(check_auth_rate_limit(self.request('10.0.0.2'), 'b@example.com', 'login')[0], 'global')
+    
+    @override_settings(FIREBASE_RATELIMIT_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(10):
+            self.assertIsNone(check_auth_rate_limit(self.request(), 'user@example.com', 'login'))
+    
+    @override_settings(FIREBASE_RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR', FIREBASE_RATELIMIT_TRUSTED_PROXIES=1)
+    def test_client_ip_from_proxy_header(self):
+        # O proxy acrescenta o endereço de quem o chamou; o resto do header vem do cliente
+        request = self.request(HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.7')
+        self.assertEqual(get_client_ip(request), '203.0.113.7')
+        self.assertEqual(get_client_ip(self.request(HTTP_X_FORWARDED_FOR='203.0.113.7')), '203.0.113.7')
+        self.assertEqual(get_client_ip(self.request()), '10.0.0.1')
+    
+    @override_settings(FIREBASE_RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR', FIREBASE_RATELIMIT_TRUSTED_PROXIES=2)
+    def test_client_ip_behind_two_proxies(self):
+        request = self.request(HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.7, 10.0.0.5')
+        self.assertEqual(get_client_ip(request), '203.0.113.7')
+        self.assertEqual(get_client_ip(self.request(HTTP_X_FORWARDED_FOR='203.0.113.7')), '203.0.113.7')
+    
+    @override_settings(FIREBASE_RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_spoofed_forwarded_for_does_not_dodge_the_ip_limit(self):
+        for index in range(3):
+            request = self.request(HTTP_X_FORWARDED_FOR=f'198.51.100.{index}, 203.0.113.7')
+            self.assertIsNone(check_auth_rate_limit(request, f'user{index}@example.com', 'login'))
+        request = self.request(HTTP_X_FORWARDED_FOR='198.51.100.99, 203.0.113.7')
+        self.assertEqual(check_auth_rate_limit(request, 'other@example.com', 'login')[0], 'ip')
+
+@override_settings(
+    FIREBASE_RATELIMIT_ENABLED=True,
+    FIREBASE_RATELIMIT_IP='',
+    FIREBASE_RATELIMIT_EMAIL='2/60',
+    FIREBASE_RATELIMIT_GLOBAL='',
+)
+class RateLimitedViewTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit, '_limiter', LocalRateLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    @mock.patch('accounts.views.firebase_sign_in', return_value=(False, 'INVALID_LOGIN_CREDENTIALS'))
+    def test_login_returns_429_without_calling_firebase(self, sign_in):
+        data = {'email': 'user@example.com', 'password': 'wrong password'}
+        for _ in range(2):
+            self.assertEqual(self.client.post('/login/', data).status_code, 200)
+        
+        response = self.client.post('/login/', data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(sign_in.call_count, 2)
+    
+    @mock.patch('accounts.views.firebase_sign_up', return_value=(False, 'EMAIL_EXISTS'))
+    def test_register_returns_429_without_calling_firebase(self, sign_up):
+        data = {'email': 'user@example.com', 'password': 'secret1', 'confirm_password': 'secret1'}
+        for _ in range(2):
+            self.client.post('/register/', data)
+        
+        response = self.client.post('/register/', data)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(sign_up.call_count, 2)
@@ -0,0 +1,213 @@
+from datetime import timedelta
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock
+from accounts import reconcile as reconcile_module
+from accounts.models import CustomUser, FirebaseOutbox, suppress_firebase_sync
+from accounts.reconcile import find_orphaned_user_ids, firebase_fingerprint, purge_orphaned_users, reconcile_firebase_users
+from firebase_config import FirebaseUserRecord
+
+CREATED_AT = 1704067200000
+
+def firebase_user(uid='uid-ada', email='ada@example.com', **kwargs):
+    return FirebaseUserRecord(uid, email, created_at=CREATED_AT, **kwargs)
+
+def reconcile(*firebase_users, **kwargs):
+    with suppress_firebase_sync():
+        return reconcile_firebase_users(list(firebase_users), **kwargs)
+
+def stored_fingerprint(uid='uid-ada'):
+    return CustomUser.objects.values_list('firebase_fingerprint', flat=True).get(firebase_uid=uid)
+
+class OrphanPurgeTests(TestCase):
+    def setUp(self):
+        with suppress_firebase_sync():
+            self.synced = CustomUser.objects.create_user('synced', 'synced@example.com', firebase_uid='live-uid')
+            self.orphan = CustomUser.objects.create_user('orphan', 'orphan@example.com', firebase_uid='gone-uid')
+    
+    def test_deletes_users_missing_from_firebase(self):
+        self.assertEqual(purge_orphaned_users({'live-uid'}), 1)
+        self.assertFalse(CustomUser.objects.filter(pk=self.orphan.pk).exists())
+        self.assertTrue(CustomUser.objects.filter(pk=self.synced.pk).exists())
+    
+    def test_keeps_user_with_pending_create(self):
+        user = CustomUser.objects.create_user('local', 'local@example.com', 'x')
+        self.assertTrue(
+            FirebaseOutbox.objects.filter(firebase_uid=user.firebase_uid, operation=FirebaseOutbox.OP_CREATE).exists()
+        )
+        
+        self.assertEqual(find_orphaned_user_ids({'live-uid'}), [self.orphan.pk])
+        purge_orphaned_users({'live-uid'})
+        self.assertTrue(CustomUser.objects.filter(pk=user.pk).exists())
+    
+    def test_keeps_user_with_failed_create(self):
+        user = CustomUser.objects.create_user('local', 'local@example.com', 'x')
+        FirebaseOutbox.objects.filter(firebase_uid=user.firebase_uid).update(status=FirebaseOutbox.STATUS_FAILED)
+        
+        self.assertNotIn(user.pk, find_orphaned_user_ids({'live-uid'}))
+    
+    def test_user_is_orphan_once_create_was_sent(self):
+        user = CustomUser.objects.create_user('local', 'local@example.com', 'x')
+        # O drain apaga a entrada depois de criar o usuário no Firebase
+        FirebaseOutbox.objects.filter(firebase_uid=user.firebase_uid).delete()
+        
+        self.assertCountEqual(find_orphaned_user_ids({'live-uid'}), [self.orphan.pk, user.pk])
+    
+    def test_pending_update_does_not_protect_orphan(self):
+        self.orphan.email = 'renamed@example.com'
+        self.orphan.save()
+        self.assertTrue(FirebaseOutbox.objects.filter(firebase_uid='gone-uid', operation=FirebaseOutbox.OP_UPDATE).exists())
+        
+        self.assertEqual(find_orphaned_user_ids({'live-uid'}), [self.orphan.pk])
+    
+    def test_user_created_after_the_listing_started_is_not_an_orphan(self):
+        started_at = timezone.now()
+        with suppress_firebase_sync():
+            # Criado no Firebase e logado no Django depois que a listagem passou pela posição dele
+            late = CustomUser.objects.create_user('late', 'late@example.com', firebase_uid='late-uid')
+        
+        self.assertEqual(find_orphaned_user_ids({'live-uid'}, started_at=started_at), [self.orphan.pk])
+        self.assertEqual(purge_orphaned_users({'live-uid'}, started_at=started_at), 1)
+        self.assertTrue(CustomUser.objects.filter(pk=late.pk).exists())
+    
+    def test_user_created_before_the_listing_started_is_an_orphan(self):
+        started_at = self.orphan.created_at + timedelta(microseconds=1)
+        self.assertEqual(find_orphaned_user_ids({'live-uid'}, started_at=started_at), [self.orphan.pk])
+        self.assertEqual(find_orphaned_user_ids({'live-uid'}, started_at=self.orphan.created_at), [])
+
+class FingerprintTests(TestCase):
+    def setUp(self):
+        self.record = firebase_user()
+        reconcile(self.record)
+        self.user = CustomUser.objects.get(firebase_uid='uid-ada')
+    
+    def test_first_sync_stores_the_fingerprint(self):
+        self.assertEqual(stored_fingerprint(), firebase_fingerprint(self.record))
+    
+    def test_unchanged_record_is_skipped_without_a_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reconcile(firebase_user()), (1, 0, 0))
+        
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('UPDATE', 'INSERT'))]
+        self.assertEqual(writes, [])
+        # Só a leitura de (firebase_uid, firebase_fingerprint)
+        self.assertEqual(len(queries), 1)
+    
+    def test_changed_record_is_rewritten(self):
+        changed = firebase_user(email='lovelace@example.com', email_verified=True)
+        self.assertEqual(reconcile(changed), (1, 0, 1))
+        
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.email, self.user.email_verified), ('lovelace@example.com', True))
+        self.assertEqual(self.user.firebase_fingerprint, firebase_fingerprint(changed))
+        self.assertNotEqual(self.user.firebase_fingerprint, firebase_fingerprint(self.record))
+    
+    def test_local_edit_clears_the_fingerprint(self):
+        with suppress_firebase_sync():
+            self.user.email = 'edited@example.com'
+            self.user.save()
+        self.assertEqual(stored_fingerprint(), '')
+        
+        # O Firebase não mudou, mas a linha sim: a sincronização volta a comparar e regrava
+        self.assertEqual(reconcile(firebase_user()), (1, 0, 1))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'ada@example.com')
+        self.assertEqual(self.user.firebase_fingerprint, firebase_fingerprint(self.record))
+    
+    def test_local_edit_with_update_fields_clears_the_fingerprint(self):
+        with suppress_firebase_sync():
+            self.user.email_verified = True
+            self.user.save(update_fields=['email_verified'])
+        self.assertEqual(stored_fingerprint(), '')
+    
+    def test_edit_of_other_fields_keeps_the_fingerprint(self):
+        self.user.first_name = 'Ada'
+        self.user.save()
+        self.assertEqual(stored_fingerprint(), firebase_fingerprint(self.record))
+        self.assertEqual(reconcile(firebase_user()), (1, 0, 0))
+
+class BulkReconcileTests(TestCase):
+    def test_new_users_are_created_in_bulk(self):
+        records = [firebase_user(f'uid-{index}', f'user{index}@example.com') for index in range(5)]
+        with mock.patch.object(CustomUser.objects, 'bulk_create', wraps=CustomUser.objects.bulk_create) as bulk_create:
+            self.assertEqual(reconcile(*records, batch_size=2), (5, 5, 0))
+        
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 2, 1])
+        user = CustomUser.objects.get(firebase_uid='uid-3')
+        self.assertEqual((user.email, user.email_normalized, user.username), ('user3@example.com', 'user3@example.com', 'user3'))
+        self.assertFalse(user.has_usable_password())
+        self.assertFalse(FirebaseOutbox.objects.exists())
+    
+    def test_existing_user_is_matched_by_uid(self):
+        with suppress_firebase_sync():
+            user = CustomUser.objects.create_user('ada', 'old@example.com', firebase_uid='uid-ada')
+        
+        with mock.patch.object(CustomUser.objects, 'bulk_update', wraps=CustomUser.objects.bulk_update) as bulk_update:
+            self.assertEqual(reconcile(firebase_user(email='Ada@Example.com')), (1, 0, 1))
+        bulk_update.assert_called_once()
+        
+        user.refresh_from_db()
+        self.assertEqual((user.email, user.email_normalized), ('Ada@Example.com', 'ada@example.com'))
+        self.assertEqual(CustomUser.objects.count(), 1)
+    
+    def test_existing_user_is_matched_by_email(self):
+        with suppress_firebase_sync():
+            user = CustomUser.objects.create_user('ada', 'ADA@example.com ')
+        
+        self.assertEqual(reconcile(firebase_user(email_verified=True)), (1, 0, 1))
+        user.refresh_from_db()
+        self.assertEqual((user.firebase_uid, user.email, user.email_verified), ('uid-ada', 'ada@example.com', True))
+        self.assertEqual(CustomUser.objects.count(), 1)
+    
+    def test_without_create_missing_only_existing_users_are_updated(self):
+        with suppress_firebase_sync():
+            CustomUser.objects.create_user('ada', 'ada@example.com', firebase_uid='uid-ada')
+        self.assertEqual(
+            reconcile(firebase_user(email_verified=True), firebase_user('uid-bob', 'bob@example.com'), create_missing=False),
+            (1, 0, 1),
+        )
+        self.assertFalse(CustomUser.objects.filter(firebase_uid='uid-bob').exists())
+    
+    def test_username_taken_after_allocation_falls_back_to_single_saves(self):
+        with suppress_firebase_sync():
+            # Gravado por outro processo depois que os usernames da página foram escolhidos
+            CustomUser.objects.create_user('ada', 'other@example.com', firebase_uid='uid-other')
+        records = [firebase_user(), firebase_user('uid-bob', 'bob@example.com')]
+        
+        errors = {}
+        with mock.patch.object(reconcile_module, 'allocate_usernames', return_value=['ada', 'bob']):
+            self.assertEqual(reconcile(*records, errors=errors), (2, 2, 0))
+        
+        self.assertEqual(errors, {})
+        self.assertEqual(CustomUser.objects.get(firebase_uid='uid-ada').username, 'ada1')
+        self.assertEqual(CustomUser.objects.get(firebase_uid='uid-bob').username, 'bob')
+    
+    def test_failed_row_in_a_chunk_does_not_block_the_others(self):
+        records = [firebase_user(f'uid-{index}', f'user{index}@example.com') for index in range(3)]
+        save_with_unique_username = reconcile_module.save_with_unique_username
+        
+        def save(user, base):
+            if user.firebase_uid == 'uid-1':
+                raise IntegrityError('linha inválida')
+            return save_with_unique_username(user, base)
+        
+        errors = {}
+        with mock.patch.object(CustomUser.objects, 'bulk_create', side_effect=IntegrityError('lote inválido')):
+            with mock.patch.object(reconcile_module, 'save_with_unique_username', side_effect=save):
+                self.assertEqual(reconcile(*records, errors=errors), (2, 2, 0))
+        
+        self.assertEqual(list(errors), ['uid-1'])
+        self.assertCountEqual(CustomUser.objects.values_list('firebase_uid', flat=True), ['uid-0', 'uid-2'])
+    
+    def test_failed_update_chunk_falls_back_to_single_saves(self):
+        with suppress_firebase_sync():
+            for index in range(3):
+                CustomUser.objects.create_user(f'user{index}', f'user{index}@example.com', firebase_uid=f'uid-{index}')
+        records = [firebase_user(f'uid-{index}', f'user{index}@example.com', email_verified=True) for index in range(3)]
+        
+        with mock.patch.object(CustomUser.objects, 'bulk_update', side_effect=IntegrityError('lote inválido')):
+            self.assertEqual(reconcile(*records), (3, 0, 3))
+        self.assertEqual(CustomUser.objects.filter(email_verified=True).count(), 3)
+        self.assertFalse(FirebaseOutbox.objects.exists())
@@ -0,0 +1,227 @@
+from cryptography.fernet import Fernet
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from unittest import mock
+from accounts import session_tokens
+from accounts.session_tokens import (
+    SESSION_KEY,
+    TokenRefreshError,
+    TokenRefresher,
+    decrypt_tokens,
+    encrypt_tokens,
+    get_id_token,
+    load_session_tokens,
+    store_session_tokens,
+)
+import threading
+import time
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+    
+    def json(self):
+        return dict(self.data)
+
+class FakeSecureToken:
+    """Endpoint securetoken local: conta as chamadas e pode segurar a resposta até ser liberado"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.error = None
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+    
+    def refresh_id_token(self, refresh_token):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        self.entered.set()
+        self.release.wait(5)
+        if self.error:
+            return FakeResponse(400, {'error': {'message': self.error}})
+        return FakeResponse(200, {
+            'id_token': f'id-token-{call}',
+            'refresh_token': f'{refresh_token}-rotated',
+            'expires_in': '3600',
+            'user_id': 'uid-1',
+        })
+
+class CountingFlight(session_tokens._Flight):
+    """_Flight que avisa quando uma requisição passa a esperar a chamada em andamento"""
+    
+    waiting = None
+    
+    def __init__(self):
+        super().__init__()
+        done, waiting = self.done, self.waiting
+        
+        class Done:
+            def wait(self, timeout=None):
+                waiting.release()
+                return done.wait(timeout)
+            
+            def set(self):
+                done.set()
+        
+        self.done = Done()
+
+def expiring_tokens(expires_in=60):
+    return {'uid': 'uid-1', 'id_token': 'old-id-token', 'refresh_token': 'refresh-1', 'expires_at': time.time() + expires_in}
+
+class SessionTokensTestMixin:
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.secure_token = FakeSecureToken()
+        patcher = mock.patch.object(session_tokens, 'get_identity_toolkit_client', return_value=self.secure_token)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # A MultiFernet é montada uma vez por processo
+        patcher = mock.patch.object(session_tokens, '_fernet', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+class TokenRefresherTests(SessionTokensTestMixin, SimpleTestCase):
+    def test_refresh_calls_securetoken(self):
+        refreshed = TokenRefresher().refresh(expiring_tokens(), 300)
+        self.assertEqual(refreshed['id_token'], 'id-token-1')
+        self.assertEqual(refreshed['refresh_token'], 'refresh-1-rotated')
+        self.assertGreater(refreshed['expires_at'], time.time() + 3500)
+    
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_concurrent_refreshes_make_one_call(self):
+        refresher = TokenRefresher()
+        self.secure_token.release.clear()
+        results = []
+        
+        def refresh():
+            results.append(refresher.refresh(expiring_tokens(), 300)['id_token'])
+        
+        CountingFlight.waiting = threading.Semaphore(0)
+        with mock.patch.object(session_tokens, '_Flight', CountingFlight):
+            leader = threading.Thread(target=refresh)
+            leader.start()
+            self.assertTrue(self.secure_token.entered.wait(5))
+            
+            followers = [threading.Thread(target=refresh) for _ in range(4)]
+            for thread in followers:
+                thread.start()
+            for _ in followers:
+                self.assertTrue(CountingFlight.waiting.acquire(timeout=5))
+            
+            self.secure_token.release.set()
+            for thread in [leader, *followers]:
+                thread.join(5)
+        
+        self.assertEqual(self.secure_token.calls, 1)
+        self.assertEqual(results, ['id-token-1'] * 5)
+    
+    def test_result_is_shared_through_the_cache(self):
+        TokenRefresher().refresh(expiring_tokens(), 300)
+        
+        # Outro processo: o resultado vem do cache do Django, sem nova chamada
+        refreshed = TokenRefresher().refresh(expiring_tokens(), 300)
+        self.assertEqual(refreshed['id_token'], 'id-token-1')
+        self.assertEqual(self.secure_token.calls, 1)
+        # Cifrado também no cache
+        self.assertNotIn('id-token-1', cache.get(f'{session_tokens.CACHE_KEY_PREFIX}:uid-1'))
+    
+    def test_cached_result_close_to_expiry_is_refreshed_again(self):
+        TokenRefresher().refresh(expiring_tokens(), 300)
+        refreshed = TokenRefresher().refresh(expiring_tokens(), 3600)
+        self.assertEqual(refreshed['id_token'], 'id-token-2')
+        self.assertEqual(self.secure_token.calls, 2)
+    
+    def test_revoked_refresh_token(self):
+        self.secure_token.error = 'TOKEN_EXPIRED'
+        with self.assertRaises(TokenRefreshError) as raised:
+            TokenRefresher().refresh(expiring_tokens(), 300)
+        self.assertTrue(raised.exception.revoked)
+        
+        self.secure_token.error = 'TOO_MANY_ATTEMPTS_TRY_LATER'
+        with self.assertRaises(TokenRefreshError) as raised:
+            TokenRefresher().refresh(expiring_tokens(), 300)
+        self.assertFalse(raised.exception.revoked)
+
+class GetIdTokenTests(SessionTokensTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(session_tokens, 'token_refresher', TokenRefresher())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = mock.Mock(session={})
+    
+    def store(self, expires_in):
+        store_session_tokens(self.request, {
+            'localId': 'uid-1', 'idToken': 'old-id-token', 'refreshToken': 'refresh-1', 'expiresIn': str(expires_in),
+        })
+    
+    def test_fresh_token_is_returned_without_a_call(self):
+        self.store(3600)
+        self.assertEqual(get_id_token(self.request), 'old-id-token')
+        self.assertEqual(self.secure_token.calls, 0)
+    
+    def test_token_near_expiry_is_refreshed_into_the_session(self):
+        self.store(60)
+        self.assertEqual(get_id_token(self.request), 'id-token-1')
+        self.assertEqual(load_session_tokens(self.request)['refresh_token'], 'refresh-1-rotated')
+        self.assertEqual(get_id_token(self.request), 'id-token-1')
+        self.assertEqual(self.secure_token.calls, 1)
+    
+    def test_revoked_refresh_token_clears_the_session(self):
+        self.store(60)
+        self.secure_token.error = 'USER_DISABLED'
+        self.assertIsNone(get_id_token(self.request))
+        self.assertNotIn(SESSION_KEY, self.request.session)
+    
+    def test_temporary_error_keeps_the_session(self):
+        self.store(60)
+        self.secure_token.error = 'TOO_MANY_ATTEMPTS_TRY_LATER'
+        self.assertIsNone(get_id_token(self.request))
+        self.assertIn(SESSION_KEY, self.request.session)
+    
+    def test_no_tokens_in_the_session(self):
+        self.assertIsNone(get_id_token(self.request))
+
+class EncryptionKeyRotationTests(SimpleTestCase):
+    def setUp(self):
+        self.old_key = Fernet.generate_key().decode()
+        self.new_key = Fernet.generate_key().decode()
+        patcher = mock.patch.object(session_tokens, '_fernet', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def encrypt_with(self, keys, tokens):
+        with override_settings(FIREBASE_TOKEN_ENCRYPTION_KEYS=keys):
+            session_tokens._fernet = None
+            return encrypt_tokens(tokens)
+    
+    def decrypt_with(self, keys, value):
+        with override_settings(FIREBASE_TOKEN_ENCRYPTION_KEYS=keys):
+            session_tokens._fernet = None
+            return decrypt_tokens(value)
+    
+    def test_old_key_still_decrypts_after_rotation(self):
+        tokens = expiring_tokens()
+        value = self.encrypt_with([self.old_key], tokens)
+        self.assertNotIn('refresh-1', value)
+        self.assertEqual(self.decrypt_with([self.new_key, self.old_key], value), tokens)
+    
+    def test_first_key_encrypts(self):
+        value = self.encrypt_with([self.new_key, self.old_key], expiring_tokens())
+        self.assertIsNotNone(self.decrypt_with([self.new_key], value))
+        self.assertIsNone(self.decrypt_with([self.old_key], value))
+    
+    def test_removed_key_no_longer_decrypts(self):
+        value = self.encrypt_with([self.old_key], expiring_tokens())
+        self.assertIsNone(self.decrypt_with([self.new_key], value))
+    
+    def test_default_key_is_derived_from_the_secret_key(self):
+        value = self.encrypt_with([], expiring_tokens())
+        self.assertIsNotNone(self.decrypt_with([], value))
+        with override_settings(SECRET_KEY='another-secret-key'):
+            self.assertIsNone(self.decrypt_with([], value))
@@ -0,0 +1,131 @@
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase
+from accounts.models import CustomUser, FirebaseOutbox, firebase_sync_suppressed, suppress_firebase_sync
+from accounts.pipeline import run_pipeline
+import asyncio
+import threading
+
+# SQLite em memória não espera pelo lock de escrita: os writers gravam um de cada vez
+write_lock = threading.Lock()
+
+def create_user(username):
+    with write_lock:
+        return CustomUser.objects.create_user(username, f'{username}@example.com')
+
+def queued_usernames():
+    return set(FirebaseOutbox.objects.values_list('display_name', flat=True))
+
+class SuppressFirebaseSyncTests(TransactionTestCase):
+    """A supressão vale só para a thread ou task que entrou no escopo"""
+    
+    def test_concurrent_thread_is_not_suppressed(self):
+        suppressed = threading.Event()
+        other_saved = threading.Event()
+        errors = []
+        
+        def suppressed_thread():
+            try:
+                with suppress_firebase_sync():
+                    suppressed.set()
+                    # Fica no escopo enquanto a outra thread grava
+                    other_saved.wait(5)
+                    create_user('suppressed')
+            except Exception as e:
+                errors.append(e)
+        
+        def other_thread():
+            try:
+                suppressed.wait(5)
+                create_user('propagated')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                other_saved.set()
+        
+        threads = [threading.Thread(target=suppressed_thread), threading.Thread(target=other_thread)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(CustomUser.objects.count(), 2)
+        self.assertEqual(queued_usernames(), {'propagated'})
+    
+    def test_concurrent_task_is_not_suppressed(self):
+        async def main():
+            suppressed = asyncio.Event()
+            other_saved = asyncio.Event()
+            
+            async def suppressed_task():
+                with suppress_firebase_sync():
+                    suppressed.set()
+                    await other_saved.wait()
+                    await sync_to_async(create_user)('suppressed')
+            
+            async def other_task():
+                await suppressed.wait()
+                self.assertFalse(firebase_sync_suppressed())
+                await sync_to_async(create_user)('propagated')
+                other_saved.set()
+            
+            await asyncio.wait_for(asyncio.gather(suppressed_task(), other_task()), 10)
+        
+        asyncio.run(main())
+        self.assertEqual(CustomUser.objects.count(), 2)
+        self.assertEqual(queued_usernames(), {'propagated'})
+    
+    def test_scope_ends_with_the_block(self):
+        with suppress_firebase_sync():
+            with suppress_firebase_sync():
+                create_user('inner')
+            self.assertTrue(firebase_sync_suppressed())
+        self.assertFalse(firebase_sync_suppressed())
+        
+        create_user('after')
+        self.assertEqual(queued_usernames(), {'after'})
+    
+    def test_decorator(self):
+        started_threads = []
+        
+        @suppress_firebase_sync()
+        def import_users():
+            create_user('decorated')
+            # Threads novas começam fora do escopo
+            thread = threading.Thread(target=lambda: started_threads.append(firebase_sync_suppressed()))
+            thread.start()
+            thread.join()
+            return firebase_sync_suppressed()
+        
+        self.assertTrue(import_users())
+        self.assertEqual(started_threads, [False])
+        self.assertFalse(firebase_sync_suppressed())
+        self.assertEqual(queued_usernames(), set())
+    
+    def test_pipeline_workers_inherit_the_scope(self):
+        seen = []
+        
+        def handle(usernames):
+            seen.append(firebase_sync_suppressed())
+            for username in usernames:
+                create_user(username)
+            return len(usernames)
+        
+        pages = [['ada', 'bob'], ['carol', 'dave']]
+        with suppress_firebase_sync():
+            run_pipeline(iter(pages), handle, workers=2, queue_depth=1, key=lambda username: username)
+        
+        self.assertTrue(seen)
+        self.assertTrue(all(seen))
+        self.assertEqual(CustomUser.objects.count(), 4)
+        self.assertEqual(queued_usernames(), set())
+    
+    def test_pipeline_outside_the_scope_propagates(self):
+        run_pipeline(
+            iter([['ada', 'bob']]),
+            lambda usernames: [create_user(username) for username in usernames],
+            workers=2,
+            queue_depth=1,
+            key=lambda username: username,
+        )
+        self.assertEqual(queued_usernames(), {'ada', 'bob'})
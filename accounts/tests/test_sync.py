@@ -0,0 +1,132 @@
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest import mock
+from accounts import sync_utils
+from accounts.models import CustomUser, FirebaseOutbox, FirebaseSyncState, suppress_firebase_sync
+from accounts.sync_utils import get_sync_state, sync_firebase_users
+from firebase_config import FirebaseUserRecord
+import time
+
+DAY = 24 * 60 * 60
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def firebase_user(uid, changed_at, email=None):
+    return FirebaseUserRecord(uid, email or f'{uid}@example.com', created_at=changed_at, last_refresh_at=changed_at)
+
+class FakeListing:
+    """Substitui iter_firebase_user_pages: devolve as páginas configuradas e conta as listagens"""
+    
+    def __init__(self, *pages):
+        self.pages = [list(page) for page in pages]
+        self.calls = 0
+    
+    def __call__(self, page_size=None):
+        self.calls += 1
+        yield from self.pages
+
+@override_settings(FIREBASE_FULL_SYNC_INTERVAL=DAY, FIREBASE_SYNC_WATERMARK_OVERLAP=300, FIREBASE_ORPHAN_MAX_RATIO=1)
+class SyncFirebaseUsersTests(TestCase):
+    def sync(self, *pages, **kwargs):
+        listing = FakeListing(*pages)
+        with mock.patch.object(sync_utils, 'iter_firebase_user_pages', listing):
+            return sync_firebase_users(**kwargs)
+    
+    def save_state(self, watermark, last_full_sync_at):
+        FirebaseSyncState.objects.update_or_create(
+            project_id=get_sync_state().project_id,
+            defaults={'watermark': watermark, 'last_full_sync_at': last_full_sync_at, 'last_sync_at': last_full_sync_at},
+        )
+    
+    def test_incremental_without_a_watermark_runs_a_full_sync(self):
+        with suppress_firebase_sync():
+            CustomUser.objects.create_user('orphan', 'orphan@example.com', firebase_uid='gone-uid')
+        old = now_ms() - 30 * DAY * 1000
+        
+        result = self.sync([firebase_user('uid-1', old), firebase_user('uid-2', old)], full=False)
+        
+        # Antes da correção: TypeError engolido e (0, 0, 0, 0)
+        self.assertEqual(result, (2, 2, 0, 1))
+        state = get_sync_state()
+        self.assertIsNotNone(state.watermark)
+        self.assertIsNotNone(state.last_full_sync_at)
+    
+    def test_first_sync_is_full(self):
+        result = self.sync([firebase_user('uid-1', now_ms() - 30 * DAY * 1000)])
+        self.assertEqual(result, (1, 1, 0, 0))
+        self.assertIsNotNone(get_sync_state().last_full_sync_at)
+    
+    def test_incremental_applies_only_the_overlap_window(self):
+        watermark = now_ms() - 60 * 1000
+        last_full_sync_at = timezone.now() - timedelta(hours=1)
+        self.save_state(watermark, last_full_sync_at)
+        since = watermark - 300 * 1000
+        
+        result = self.sync([
+            firebase_user('before-window', since - 1),
+            firebase_user('at-window', since),
+            firebase_user('in-overlap', watermark - 1000),
+            firebase_user('after-watermark', watermark + 1000),
+        ])
+        
+        self.assertEqual(result, (3, 3, 0, 0))
+        self.assertCountEqual(
+            CustomUser.objects.values_list('firebase_uid', flat=True),
+            ['at-window', 'in-overlap', 'after-watermark'],
+        )
+        state = get_sync_state()
+        self.assertGreater(state.watermark, watermark)
+        self.assertEqual(state.last_full_sync_at, last_full_sync_at)
+    
+    def test_incremental_does_not_purge_orphans(self):
+        self.save_state(now_ms(), timezone.now())
+        with suppress_firebase_sync():
+            CustomUser.objects.create_user('orphan', 'orphan@example.com', firebase_uid='gone-uid')
+        
+        self.assertEqual(self.sync([firebase_user('uid-1', now_ms())])[3], 0)
+        self.assertTrue(CustomUser.objects.filter(firebase_uid='gone-uid').exists())
+    
+    def test_full_sync_is_due_after_the_interval(self):
+        watermark = now_ms()
+        self.save_state(watermark, timezone.now() - timedelta(seconds=DAY + 1))
+        
+        self.sync([firebase_user('old-user', watermark - 30 * DAY * 1000)])
+        self.assertTrue(CustomUser.objects.filter(firebase_uid='old-user').exists())
+        self.assertGreater(get_sync_state().last_full_sync_at, timezone.now() - timedelta(minutes=1))
+    
+    def test_explicit_full_ignores_the_watermark(self):
+        watermark = now_ms()
+        self.save_state(watermark, timezone.now())
+        self.sync([firebase_user('old-user', watermark - 30 * DAY * 1000)], full=True)
+        self.assertTrue(CustomUser.objects.filter(firebase_uid='old-user').exists())
+    
+    def test_user_who_signs_in_during_the_listing_is_kept(self):
+        def listing(page_size=None):
+            yield [firebase_user('uid-1', now_ms())]
+            # Criado no Firebase depois que a listagem passou pela posição dele
+            with suppress_firebase_sync():
+                CustomUser.objects.create_user('late', 'late@example.com', firebase_uid='late-uid')
+            yield [firebase_user('uid-2', now_ms())]
+        
+        with mock.patch.object(sync_utils, 'iter_firebase_user_pages', listing):
+            self.assertEqual(sync_firebase_users(full=True)[3], 0)
+        self.assertTrue(CustomUser.objects.filter(firebase_uid='late-uid').exists())
+    
+    def test_synced_users_are_not_sent_back_to_firebase(self):
+        self.sync([firebase_user('uid-1', now_ms())])
+        self.assertFalse(FirebaseOutbox.objects.exists())
+
+class IsFullSyncDueTests(TestCase):
+    def state(self, watermark, last_full_sync_at):
+        return FirebaseSyncState(project_id='demo', watermark=watermark, last_full_sync_at=last_full_sync_at)
+    
+    def test_without_a_previous_sync(self):
+        self.assertTrue(self.state(None, None).is_full_sync_due(DAY))
+        self.assertTrue(self.state(None, timezone.now()).is_full_sync_due(DAY))
+        self.assertTrue(self.state(now_ms(), None).is_full_sync_due(DAY))
+    
+    def test_interval(self):
+        self.assertFalse(self.state(now_ms(), timezone.now() - timedelta(seconds=DAY - 60)).is_full_sync_due(DAY))
+        self.assertTrue(self.state(now_ms(), timezone.now() - timedelta(seconds=DAY)).is_full_sync_due(DAY))
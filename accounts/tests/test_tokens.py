@@ -0,0 +1,268 @@
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from datetime import datetime, timedelta, timezone
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from unittest import mock
+from accounts import tokens
+from accounts.backends import FirebaseTokenBackend
+from accounts.cache import user_cache
+from accounts.middleware import FirebaseTokenMiddleware
+from accounts.models import CustomUser, suppress_firebase_sync
+from accounts.tokens import GoogleCertificateCache, InvalidIdToken, verify_id_token
+import jwt
+import time
+
+PROJECT_ID = 'demo-project'
+
+def generate_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def certificate_pem(private_key):
+    """Certificado autoassinado no formato servido pelo endpoint de certificados do Google"""
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'securetoken.system.gserviceaccount.com')])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(private_key, hashes.SHA256())
+    )
+    return certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+class FakeCertsResponse:
+    def __init__(self, certificates, max_age=3600):
+        self.certificates = certificates
+        self.headers = {'Cache-Control': f'public, max-age={max_age}, must-revalidate'}
+    
+    def raise_for_status(self):
+        pass
+    
+    def json(self):
+        return dict(self.certificates)
+
+class FirebaseTokenTestMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = generate_key()
+        cls.other_key = generate_key()
+    
+    def setUp(self):
+        super().setUp()
+        self.certificates = {'key-1': certificate_pem(self.private_key)}
+        self.max_age = 3600
+        self.certificate_cache = GoogleCertificateCache(url='https://certs.example.com')
+        self.fetch = mock.patch.object(
+            self.certificate_cache.session,
+            'get',
+            side_effect=lambda *args, **kwargs: FakeCertsResponse(self.certificates, self.max_age),
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+    
+    def make_token(self, key=None, kid='key-1', algorithm='RS256', **overrides):
+        now = int(time.time())
+        claims = {
+            'iss': f'https://securetoken.google.com/{PROJECT_ID}',
+            'aud': PROJECT_ID,
+            'sub': 'firebase-uid-1',
+            'iat': now,
+            'exp': now + 3600,
+            'auth_time': now,
+        }
+        claims.update(overrides)
+        claims = {claim: value for claim, value in claims.items() if value is not None}
+        headers = {'kid': kid} if kid else {}
+        return jwt.encode(claims, key or self.private_key, algorithm=algorithm, headers=headers)
+
+class VerifyIdTokenTests(FirebaseTokenTestMixin, TestCase):
+    def verify(self, token):
+        return verify_id_token(token, project_id=PROJECT_ID, certificate_cache=self.certificate_cache)
+    
+    def test_valid_token_returns_claims(self):
+        claims = self.verify(self.make_token(email='user@example.com'))
+        self.assertEqual(claims['sub'], 'firebase-uid-1')
+        self.assertEqual(claims['email'], 'user@example.com')
+    
+    def test_wrong_audience(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(aud='another-project'))
+    
+    def test_wrong_issuer(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(iss='https://securetoken.google.com/another-project'))
+    
+    def test_expired_token(self):
+        past = int(time.time()) - 7200
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(iat=past, exp=past + 3600, auth_time=past))
+    
+    def test_expiry_within_clock_skew_is_accepted(self):
+        now = int(time.time())
+        self.verify(self.make_token(iat=now - 3600, exp=now - 2))
+    
+    def test_missing_required_claim(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(sub=None))
+    
+    def test_empty_subject(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(sub=''))
+    
+    def test_auth_time_in_the_future(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(auth_time=int(time.time()) + 3600))
+    
+    def test_algorithm_other_than_rs256(self):
+        token = jwt.encode({'sub': 'firebase-uid-1'}, 'secret' * 6, algorithm='HS256', headers={'kid': 'key-1'})
+        with self.assertRaises(InvalidIdToken):
+            self.verify(token)
+        self.fetch.assert_not_called()
+    
+    def test_rs512_signed_with_the_right_key(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(algorithm='RS512'))
+    
+    def test_missing_kid(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(kid=None))
+    
+    def test_signed_by_another_key(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify(self.make_token(key=self.other_key))
+    
+    def test_malformed_token(self):
+        with self.assertRaises(InvalidIdToken):
+            self.verify('not-a-jwt')
+    
+    def test_missing_project_id(self):
+        with override_settings(FIREBASE_CONFIG={'projectId': None}):
+            with self.assertRaises(InvalidIdToken):
+                verify_id_token(self.make_token(), certificate_cache=self.certificate_cache)
+
+class GoogleCertificateCacheTests(FirebaseTokenTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        mock.patch.object(tokens.time, 'monotonic', side_effect=lambda: self.now).start()
+    
+    def test_certificates_are_cached_until_max_age(self):
+        self.max_age = 100
+        key = self.certificate_cache.get_key('key-1')
+        self.now += 99
+        self.assertIs(self.certificate_cache.get_key('key-1'), key)
+        self.assertEqual(self.fetch.call_count, 1)
+        
+        self.now += 2
+        self.certificate_cache.get_key('key-1')
+        self.assertEqual(self.fetch.call_count, 2)
+    
+    def test_missing_cache_control_uses_default_max_age(self):
+        self.fetch.side_effect = lambda *args, **kwargs: mock.Mock(
+            headers={}, json=lambda: dict(self.certificates), raise_for_status=lambda: None,
+        )
+        self.certificate_cache.get_key('key-1')
+        self.now += tokens.DEFAULT_CERTS_MAX_AGE - 1
+        self.certificate_cache.get_key('key-1')
+        self.assertEqual(self.fetch.call_count, 1)
+    
+    def test_unknown_kid_forces_a_throttled_refresh(self):
+        self.certificate_cache.get_key('key-1')
+        
+        # Chave rotacionada: a busca forçada encontra o kid novo
+        self.certificates['key-2'] = certificate_pem(self.other_key)
+        self.now += 1
+        self.certificate_cache.get_key('key-2')
+        self.assertEqual(self.fetch.call_count, 2)
+        
+        # Um kid inventado não gera uma busca por requisição
+        self.now += 1
+        for _ in range(5):
+            with self.assertRaises(InvalidIdToken):
+                self.certificate_cache.get_key('forged')
+        self.assertEqual(self.fetch.call_count, 2)
+        
+        self.now += tokens.MIN_FORCED_REFRESH_INTERVAL
+        with self.assertRaises(InvalidIdToken):
+            self.certificate_cache.get_key('forged')
+        self.assertEqual(self.fetch.call_count, 3)
+    
+    def test_fetch_error_is_an_invalid_token(self):
+        self.fetch.side_effect = ConnectionError('offline')
+        with self.assertRaises(InvalidIdToken):
+            self.certificate_cache.get_key('key-1')
+
+@override_settings(FIREBASE_CONFIG={'projectId': PROJECT_ID})
+class FirebaseTokenAuthenticationTests(FirebaseTokenTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        user_cache.local.clear()
+        mock.patch.object(tokens, '_certificate_cache', self.certificate_cache).start()
+        with suppress_firebase_sync():
+            self.user = CustomUser.objects.create_user('token-user', 'token@example.com', firebase_uid='firebase-uid-1')
+            self.session_user = CustomUser.objects.create_user('session-user', 'session@example.com', 'x')
+    
+    def test_backend_maps_sub_to_firebase_uid(self):
+        user = FirebaseTokenBackend().authenticate(None, id_token=self.make_token())
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.firebase_claims['sub'], 'firebase-uid-1')
+    
+    def test_backend_unknown_subject(self):
+        self.assertIsNone(FirebaseTokenBackend().authenticate(None, id_token=self.make_token(sub='someone-else')))
+    
+    def test_backend_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(FirebaseTokenBackend().authenticate(None, id_token=self.make_token()))
+    
+    def test_backend_invalid_token(self):
+        self.assertIsNone(FirebaseTokenBackend().authenticate(None, id_token=self.make_token(aud='another-project')))
+    
+    def run_middleware(self, request, user=None):
+        request.user = user or AnonymousUser()
+        seen = {}
+        
+        def get_response(request):
+            seen['user'] = request.user
+            return HttpResponse()
+        
+        FirebaseTokenMiddleware(get_response)(request)
+        return seen['user']
+    
+    def test_middleware_bearer_token(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.make_token()}')
+        user = self.run_middleware(request)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(request.firebase_claims['sub'], 'firebase-uid-1')
+    
+    def test_middleware_cookie_token(self):
+        request = RequestFactory().get('/')
+        request.COOKIES['firebase_id_token'] = self.make_token()
+        self.assertEqual(self.run_middleware(request).pk, self.user.pk)
+    
+    def test_middleware_bad_bearer_keeps_session_user(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.make_token(key=self.other_key)}')
+        self.assertIs(self.run_middleware(request, self.session_user), self.session_user)
+        self.assertFalse(hasattr(request, 'firebase_claims'))
+    
+    def test_bad_bearer_falls_back_to_session(self):
+        self.client.force_login(self.session_user, backend='accounts.backends.CachedModelBackend')
+        response = self.client.get('/login/', HTTP_AUTHORIZATION='Bearer not-a-jwt')
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+    
+    def test_bad_bearer_without_session_is_anonymous(self):
+        response = self.client.get('/login/', HTTP_AUTHORIZATION=f'Bearer {self.make_token(exp=int(time.time()) - 60)}')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_valid_bearer_authenticates_without_session(self):
+        response = self.client.get('/login/', HTTP_AUTHORIZATION=f'Bearer {self.make_token()}')
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
@@ -0,0 +1,110 @@
+from django.db import IntegrityError
+from django.test import TestCase
+from unittest import mock
+from accounts import usernames
+from accounts.models import CustomUser, suppress_firebase_sync
+from accounts.usernames import (
+    USERNAME_MAX_LENGTH,
+    allocate_username,
+    allocate_usernames,
+    create_user_with_unique_username,
+    is_username_variant,
+    save_with_unique_username,
+    username_base,
+)
+
+class UsernameTestMixin:
+    def setUp(self):
+        super().setUp()
+        suppressed = suppress_firebase_sync()
+        suppressed.__enter__()
+        self.addCleanup(suppressed.__exit__, None, None, None)
+    
+    def make_users(self, *names):
+        for name in names:
+            CustomUser.objects.create_user(name, f'{name}@example.com')
+
+class AllocateUsernamesTests(UsernameTestMixin, TestCase):
+    def test_free_base_is_used_as_is(self):
+        self.assertEqual(allocate_username('ada'), 'ada')
+    
+    def test_collision_gets_the_next_free_suffix(self):
+        self.make_users('ada', 'ada1', 'ada2')
+        self.assertEqual(allocate_username('ada'), 'ada3')
+    
+    def test_gaps_are_reused(self):
+        self.make_users('ada', 'ada2')
+        self.assertEqual(allocate_username('ada'), 'ada1')
+    
+    def test_batch_does_not_repeat_names(self):
+        self.make_users('ada')
+        self.assertEqual(allocate_usernames(['ada', 'bob', 'ada', 'bob']), ['ada1', 'bob', 'ada2', 'bob1'])
+    
+    def test_empty_base_uses_the_default(self):
+        self.make_users('user')
+        self.assertEqual(allocate_username(username_base('  ')), 'user1')
+    
+    def test_long_base_is_truncated_for_the_suffix(self):
+        base = 'x' * USERNAME_MAX_LENGTH
+        self.make_users(base)
+        username = allocate_username(base)
+        self.assertEqual(username, 'x' * (USERNAME_MAX_LENGTH - 1) + '1')
+        self.assertTrue(is_username_variant(username, base))
+    
+    def test_prefix_query_loads_only_numeric_variants(self):
+        self.make_users('user', 'user1', 'username', 'user_x', 'user01', 'users2', 'other')
+        self.assertEqual(usernames._taken_usernames(['user']), {'user', 'user1'})
+    
+    def test_free_bases_skip_the_variant_query(self):
+        self.make_users('ada1')
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_usernames(['ada', 'bob']), ['ada', 'bob'])
+    
+    def test_is_username_variant(self):
+        self.assertTrue(is_username_variant('ada', 'ada'))
+        self.assertTrue(is_username_variant('ada12', 'ada'))
+        self.assertFalse(is_username_variant('ada012', 'ada'))
+        self.assertFalse(is_username_variant('adam', 'ada'))
+        self.assertFalse(is_username_variant('', 'ada'))
+
+class UniqueUsernameWriteTests(UsernameTestMixin, TestCase):
+    def test_create_picks_a_free_username(self):
+        self.make_users('ada')
+        user = create_user_with_unique_username('ada', email='ada@other.com', firebase_uid='uid-ada')
+        self.assertEqual(user.username, 'ada1')
+    
+    def test_concurrent_writer_takes_the_username(self):
+        # Outra gravação ocupou "ada" entre a escolha do nome e o INSERT
+        self.make_users('ada')
+        with mock.patch.object(usernames, 'allocate_username', side_effect=['ada', 'ada1']) as allocate:
+            user = create_user_with_unique_username('ada', email='ada@other.com', firebase_uid='uid-ada')
+        
+        self.assertEqual(user.username, 'ada1')
+        self.assertEqual(allocate.call_count, 2)
+    
+    def test_other_integrity_errors_are_raised(self):
+        CustomUser.objects.create_user('taken', 'taken@example.com', firebase_uid='uid-1')
+        with self.assertRaises(IntegrityError):
+            create_user_with_unique_username('ada', email='ada@example.com', firebase_uid='uid-1')
+        self.assertFalse(CustomUser.objects.filter(username='ada').exists())
+    
+    def test_gives_up_after_the_attempts(self):
+        self.make_users('ada')
+        with mock.patch.object(usernames, 'allocate_username', return_value='ada') as allocate:
+            with self.assertRaises(IntegrityError):
+                usernames._write_with_unique_username(
+                    'ada',
+                    lambda username: CustomUser.objects.create_user(username, 'ada@other.com'),
+                    attempts=3,
+                )
+        self.assertEqual(allocate.call_count, 3)
+    
+    def test_save_keeps_a_free_username(self):
+        user = CustomUser(username='ada', email='ada@example.com', firebase_uid='uid-ada')
+        self.assertEqual(save_with_unique_username(user, 'ada').username, 'ada')
+    
+    def test_save_retries_on_a_duplicate_username(self):
+        self.make_users('ada')
+        user = CustomUser(username='ada', email='ada@other.com', firebase_uid='uid-ada')
+        save_with_unique_username(user, 'ada')
+        self.assertEqual(CustomUser.objects.get(firebase_uid='uid-ada').username, 'ada1')
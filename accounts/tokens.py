@@ -0,0 +1,134 @@
+from django.conf import settings
+import logging
+import re
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Certificados públicos usados pelo Firebase para assinar os ID tokens
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+
+DEFAULT_CERTS_MAX_AGE = 60 * 60
+DEFAULT_CLOCK_SKEW = 10
+
+# Intervalo mínimo entre buscas forçadas por um "kid" desconhecido (rotação de chaves)
+MIN_FORCED_REFRESH_INTERVAL = 60
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+class InvalidIdToken(Exception):
+    pass
+
+class GoogleCertificateCache:
+    """Cache em memória das chaves públicas do Google, renovado conforme o Cache-Control"""
+    
+    def __init__(self, url=None):
+        self.url = url or getattr(settings, 'FIREBASE_TOKEN_CERTS_URL', GOOGLE_CERTS_URL)
+        self.session = requests.Session()
+        self._keys = {}
+        self._expires_at = 0
+        self._last_forced_refresh = 0
+        self._lock = threading.Lock()
+    
+    def _fetch(self):
+        from cryptography.x509 import load_pem_x509_certificate
+        
+        timeout = (
+            getattr(settings, 'FIREBASE_HTTP_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'FIREBASE_HTTP_READ_TIMEOUT', 10),
+        )
+        response = self.session.get(self.url, timeout=timeout)
+        response.raise_for_status()
+        
+        keys = {
+            kid: load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in response.json().items()
+        }
+        match = MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+        max_age = int(match.group(1)) if match else DEFAULT_CERTS_MAX_AGE
+        
+        self._keys = keys
+        self._expires_at = time.monotonic() + max_age
+        logger.debug(f"🔑 {len(keys)} certificados do Firebase carregados (válidos por {max_age}s)")
+    
+    def get_key(self, kid):
+        now = time.monotonic()
+        keys = self._keys
+        if now < self._expires_at and kid in keys:
+            return keys[kid]
+        
+        with self._lock:
+            expired = time.monotonic() >= self._expires_at
+            unknown = kid not in self._keys
+            if expired or (unknown and now - self._last_forced_refresh >= MIN_FORCED_REFRESH_INTERVAL):
+                if unknown and not expired:
+                    self._last_forced_refresh = now
+                try:
+                    self._fetch()
+                except Exception as e:
+                    raise InvalidIdToken(f'Não foi possível obter os certificados do Firebase: {e}')
+            
+            key = self._keys.get(kid)
+        
+        if key is None:
+            raise InvalidIdToken('Token assinado por uma chave desconhecida')
+        return key
+
+_certificate_cache = None
+_certificate_cache_lock = threading.Lock()
+
+def get_certificate_cache():
+    global _certificate_cache
+    
+    if _certificate_cache is None:
+        with _certificate_cache_lock:
+            if _certificate_cache is None:
+                _certificate_cache = GoogleCertificateCache()
+    return _certificate_cache
+
+def verify_id_token(id_token, project_id=None, certificate_cache=None):
+    """Valida localmente um ID token do Firebase e retorna as claims.
+    
+    Só há chamada de rede quando os certificados em cache expiram.
+    """
+    # PyJWT/cryptography só são carregados por quem de fato recebe um token
+    import jwt
+    
+    project_id = project_id or settings.FIREBASE_CONFIG.get('projectId')
+    if not project_id:
+        raise InvalidIdToken('FIREBASE_PROJECT_ID não configurado')
+    
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except jwt.PyJWTError as e:
+        raise InvalidIdToken(f'Token malformado: {e}')
+    
+    if header.get('alg') != 'RS256' or not header.get('kid'):
+        raise InvalidIdToken('Cabeçalho do token inválido')
+    
+    key = (certificate_cache or get_certificate_cache()).get_key(header['kid'])
+    leeway = getattr(settings, 'FIREBASE_TOKEN_CLOCK_SKEW', DEFAULT_CLOCK_SKEW)
+    
+    try:
+        claims = jwt.decode(
+            id_token,
+            key=key,
+            algorithms=['RS256'],
+            audience=project_id,
+            issuer=f'https://securetoken.google.com/{project_id}',
+            leeway=leeway,
+            options={'require': ['exp', 'iat', 'aud', 'iss', 'sub']},
+        )
+    except jwt.PyJWTError as e:
+        raise InvalidIdToken(f'Token inválido: {e}')
+    
+    subject = claims.get('sub')
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise InvalidIdToken('Claim "sub" inválida')
+    
+    if claims.get('auth_time', 0) > time.time() + leeway:
+        raise InvalidIdToken('Claim "auth_time" no futuro')
+    
+    return claims
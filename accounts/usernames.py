@@ -0,0 +1,141 @@
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from .models import CustomUser
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+USERNAME_MAX_LENGTH = CustomUser._meta.get_field('username').max_length
+
+# Espaço reservado ao sufixo numérico na consulta por prefixo (até 999999 homônimos)
+MAX_SUFFIX_DIGITS = 6
+
+# Bases por consulta ao alocar nomes para uma página inteira da sincronização
+EXACT_QUERY_CHUNK = 500
+PREFIX_QUERY_CHUNK = 100
+
+DEFAULT_ATTEMPTS = 5
+
+DEFAULT_BASE = 'user'
+
+def username_base(value):
+    """Nome desejado (display_name ou parte local do email) já no tamanho do campo"""
+    value = (value or '').strip()[:USERNAME_MAX_LENGTH]
+    return value or DEFAULT_BASE
+
+def _with_suffix(base, counter):
+    if counter == 0:
+        return base
+    suffix = str(counter)
+    return f"{base[:USERNAME_MAX_LENGTH - len(suffix)]}{suffix}"
+
+def _query_prefix(base):
+    return base[:USERNAME_MAX_LENGTH - MAX_SUFFIX_DIGITS]
+
+def _variant_pattern(base):
+    """Regex dos nomes base<dígitos>; bases longas perdem caracteres do fim para caber o sufixo"""
+    prefixes = {}
+    for digits in range(1, MAX_SUFFIX_DIGITS + 1):
+        prefixes.setdefault(base[:USERNAME_MAX_LENGTH - digits], []).append(digits)
+    return '|'.join(
+        f'{re.escape(prefix)}[1-9][0-9]{{{min(digits) - 1},{max(digits) - 1}}}'
+        for prefix, digits in prefixes.items()
+    )
+
+def is_username_variant(username, base):
+    """True se o username já é a base ou a base com um sufixo numérico (ex.: contato, contato3)"""
+    if not username:
+        return False
+    if username == base:
+        return True
+    for digits in range(1, MAX_SUFFIX_DIGITS + 1):
+        suffix = username[-digits:]
+        if len(username) > digits and suffix.isdigit() and suffix[0] != '0' and username == _with_suffix(base, int(suffix)):
+            return True
+    return False
+
+def _existing(usernames):
+    taken = set()
+    for start in range(0, len(usernames), EXACT_QUERY_CHUNK):
+        chunk = usernames[start:start + EXACT_QUERY_CHUNK]
+        taken.update(CustomUser.objects.filter(username__in=chunk).values_list('username', flat=True))
+    return taken
+
+def _taken_usernames(bases):
+    """Usernames em uso que podem colidir com as bases.
+    
+    Primeiro uma busca exata pelas bases (índice único do username); só as
+    bases já ocupadas, normalmente poucas, passam pela consulta das variantes
+    numéricas. O prefixo usa o índice e a regex deixa de fora os demais nomes
+    que começam igual (para a base "user": "username", "user_x"...).
+    """
+    bases = sorted(set(bases))
+    taken = _existing(bases)
+    
+    collided = [base for base in bases if base in taken]
+    for start in range(0, len(collided), PREFIX_QUERY_CHUNK):
+        condition = Q()
+        for base in collided[start:start + PREFIX_QUERY_CHUNK]:
+            condition |= Q(username__startswith=_query_prefix(base), username__regex=f'^(?:{_variant_pattern(base)})$')
+        taken.update(CustomUser.objects.filter(condition).values_list('username', flat=True))
+    return taken
+
+def allocate_usernames(bases):
+    """Escolhe um username livre para cada base, sem repetir nomes dentro do próprio lote.
+    
+    Os nomes já usados são carregados em poucas consultas e o próximo sufixo livre é
+    calculado em memória. A reserva não é garantida: gravações concorrentes
+    ainda podem colidir e devem tratar o IntegrityError (ver save_with_unique_username).
+    """
+    if not bases:
+        return []
+    
+    taken = _taken_usernames(bases)
+    usernames = []
+    for base in bases:
+        counter = 0
+        while _with_suffix(base, counter) in taken:
+            counter += 1
+        username = _with_suffix(base, counter)
+        taken.add(username)
+        usernames.append(username)
+    return usernames
+
+def allocate_username(base):
+    return allocate_usernames([base])[0]
+
+def _is_taken(username):
+    return CustomUser.objects.filter(username=username).exists()
+
+def _write_with_unique_username(base, write, username=None, attempts=DEFAULT_ATTEMPTS):
+    username = username or allocate_username(base)
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return write(username)
+        except IntegrityError:
+            # Só repete se o conflito foi no username; outros (ex.: firebase_uid) sobem
+            if attempt == attempts - 1 or not _is_taken(username):
+                raise
+            logger.warning(f"⚠️ Username {username} ocupado por outra gravação, tentando outro")
+            username = allocate_username(base)
+
+def create_user_with_unique_username(base, **fields):
+    """Cria o usuário com o primeiro username livre a partir da base"""
+    base = username_base(base)
+    return _write_with_unique_username(
+        base,
+        lambda username: CustomUser.objects.create_user(username=username, **fields),
+    )
+
+def save_with_unique_username(user, base):
+    """Grava o usuário e, se o username colidir, escolhe o próximo livre e tenta de novo"""
+    base = username_base(base)
+    
+    def write(username):
+        user.username = username
+        user.save()
+        return user
+    
+    return _write_with_unique_username(base, write, username=user.username or None)
@@ -1,7 +1,11 @@
-import requests
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError
+from .cache import user_cache
+from .circuit import CircuitOpenError
+from .usernames import create_user_with_unique_username
+from .http_client import get_identity_toolkit_client, get_async_identity_toolkit_client
 from .sync_utils import sync_firebase_users 
 
 User = get_user_model()
@@ -9,13 +13,13 @@ User = get_user_model()
 def get_or_create_user(username, email, firebase_uid, email_verified=False):
     try:
         try:
-            user = User.objects.get(firebase_uid=firebase_uid)
+            user = user_cache.get_by_firebase_uid(firebase_uid)
             print(f"✅ Usuário encontrado por UID: {user.email}")
             return user
         except (ObjectDoesNotExist, AttributeError):
             pass
         
-        user = User.objects.get(email=email)
+        user = user_cache.get_by_email(email)
         print(f"✅ Usuário encontrado por email: {user.email}")
         
         try:
@@ -26,74 +30,101 @@ def get_or_create_user(username, email, firebase_uid, email_verified=False):
                 print(f"🔄 UID adicionado ao usuário existente: {user.email}")
         except AttributeError:
             pass
-            
-        return user
         
+        return user
+    
     except ObjectDoesNotExist:
-        username = email.split('@')[0]  
-        counter = 1
-        original_username = username
-        
-        while User.objects.filter(username=username).exists():
-            username = f"{original_username}{counter}"
-            counter += 1
+        # O UID já vem do Firebase: criar com ele evita que a outbox crie outro usuário lá
+        try:
+            user = create_user_with_unique_username(
+                email.split('@')[0],
+                email=email,
+                firebase_uid=firebase_uid,
+                email_verified=email_verified,
+            )
+        except IntegrityError:
+            # Outra requisição criou o mesmo usuário do Firebase ao mesmo tempo
+            return User.objects.get(firebase_uid=firebase_uid)
         
-        user = User.objects.create_user(
-            username=username,
-            email=email
-        )
+        print(f"🎉 NOVO usuário criado no Django: {email}")
+        return user
+
+async def aget_or_create_user(username, email, firebase_uid, email_verified=False):
+    """Versão assíncrona de get_or_create_user, usando o ORM assíncrono do Django"""
+    try:
+        user = await sync_to_async(user_cache.get_by_firebase_uid)(firebase_uid)
+        print(f"✅ Usuário encontrado por UID: {user.email}")
+        return user
+    except ObjectDoesNotExist:
+        pass
+    
+    try:
+        user = await sync_to_async(user_cache.get_by_email)(email)
+        print(f"✅ Usuário encontrado por email: {user.email}")
         
-        try:
+        if not user.firebase_uid:
             user.firebase_uid = firebase_uid
             user.email_verified = email_verified
-        except AttributeError:
-            pass
-            
-        user.set_unusable_password()  
-        user.save()
+            await user.asave()
+            print(f"🔄 UID adicionado ao usuário existente: {user.email}")
+        
+        return user
+    
+    except ObjectDoesNotExist:
+        try:
+            user = await sync_to_async(create_user_with_unique_username)(
+                email.split('@')[0],
+                email=email,
+                firebase_uid=firebase_uid,
+                email_verified=email_verified,
+            )
+        except IntegrityError:
+            return await User.objects.aget(firebase_uid=firebase_uid)
         
         print(f"🎉 NOVO usuário criado no Django: {email}")
         return user
 
+def _parse_identity_toolkit_response(status_code, result, default_error):
+    if status_code == 200:
+        return True, result
+    else:
+        error_message = result.get('error', {}).get('message', default_error)
+        return False, error_message
+
 def firebase_sign_in(email, password):
-    url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={settings.FIREBASE_CONFIG['apiKey']}"
-    
-    data = {
-        'email': email,
-        'password': password,
-        'returnSecureToken': True
-    }
-    
     try:
-        response = requests.post(url, json=data)
-        result = response.json()
-        
-        if response.status_code == 200:
-            return True, result
-        else:
-            error_message = result.get('error', {}).get('message', 'Erro de autenticação')
-            return False, error_message
+        response = get_identity_toolkit_client().sign_in_with_password(email, password)
+        return _parse_identity_toolkit_response(response.status_code, response.json(), 'Erro de autenticação')
+    except CircuitOpenError:
+        # Quem chama responde "serviço indisponível" na hora, em vez de um erro de login
+        raise
     except Exception as e:
         return False, f"Erro de conexão: {str(e)}"
 
 def firebase_sign_up(email, password):
-    url = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={settings.FIREBASE_CONFIG['apiKey']}"
-    
-    data = {
-        'email': email,
-        'password': password,
-        'returnSecureToken': True
-    }
-    
     try:
-        response = requests.post(url, json=data)
-        result = response.json()
-        
-        if response.status_code == 200:
-            return True, result
-        else:
-            error_message = result.get('error', {}).get('message', 'Erro ao criar conta')
-            return False, error_message
+        response = get_identity_toolkit_client().sign_up(email, password)
+        return _parse_identity_toolkit_response(response.status_code, response.json(), 'Erro ao criar conta')
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        return False, f"Erro de conexão: {str(e)}"
+
+async def afirebase_sign_in(email, password):
+    try:
+        response = await get_async_identity_toolkit_client().sign_in_with_password(email, password)
+        return _parse_identity_toolkit_response(response.status_code, response.json(), 'Erro de autenticação')
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        return False, f"Erro de conexão: {str(e)}"
+
+async def afirebase_sign_up(email, password):
+    try:
+        response = await get_async_identity_toolkit_client().sign_up(email, password)
+        return _parse_identity_toolkit_response(response.status_code, response.json(), 'Erro ao criar conta')
+    except CircuitOpenError:
+        raise
     except Exception as e:
         return False, f"Erro de conexão: {str(e)}"
 
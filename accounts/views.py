@@ -1,8 +1,70 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, logout
+from django.contrib.auth import login, alogin, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .utils import firebase_sign_in, firebase_sign_up, get_or_create_user
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .circuit import CircuitOpenError, circuit_states
+from .events import SIGNATURE_HEADER, InvalidEvent, get_webhook_secrets, parse_events, store_events, verify_signature
+from .metrics import metrics_enabled, render_metrics
+from .ratelimit import check_auth_rate_limit
+from .session_tokens import store_session_tokens
+from .utils import (
+    firebase_sign_in,
+    firebase_sign_up,
+    get_or_create_user,
+    afirebase_sign_in,
+    afirebase_sign_up,
+    aget_or_create_user,
+)
+import math
+
+# Com mais de um backend configurado o login precisa dizer qual foi usado
+LOGIN_BACKEND = 'accounts.backends.CachedModelBackend'
+
+# O context processor de auth acessa request.user (consulta ao banco) ao renderizar
+arender = sync_to_async(render)
+
+# Com o backend 'cache' a verificação consulta o cache (rede)
+acheck_auth_rate_limit = sync_to_async(check_auth_rate_limit)
+
+RATE_LIMITED_MESSAGE = 'Muitas tentativas. Aguarde alguns segundos e tente novamente.'
+UNAVAILABLE_MESSAGE = 'Serviço temporariamente indisponível. Tente novamente em instantes.'
+
+def _with_retry_after(response, retry_after):
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def _read_login_form(request):
+    email = request.POST.get('email')
+    password = request.POST.get('password')
+    
+    if not email or not password:
+        messages.error(request, 'Por favor, preencha todos os campos.')
+        return None
+    
+    return email, password
+
+def _read_register_form(request):
+    email = request.POST.get('email')
+    password = request.POST.get('password')
+    confirm_password = request.POST.get('confirm_password')
+    
+    if not email or not password or not confirm_password:
+        messages.error(request, 'Por favor, preencha todos os campos.')
+        return None
+    
+    if password != confirm_password:
+        messages.error(request, 'As senhas não coincidem.')
+        return None
+    
+    if len(password) < 6:
+        messages.error(request, 'A senha deve ter pelo menos 6 caracteres.')
+        return None
+    
+    return email, password
 
 def home(request):
     return render(request, 'home.html')
@@ -12,14 +74,21 @@ def login_view(request):
         return redirect('home')
     
     if request.method == 'POST':
-        email = request.POST.get('email')
-        password = request.POST.get('password')
-        
-        if not email or not password:
-            messages.error(request, 'Por favor, preencha todos os campos.')
+        credentials = _read_login_form(request)
+        if credentials is None:
             return render(request, 'login.html')
+        email, password = credentials
         
-        success, result = firebase_sign_in(email, password)
+        rejection = check_auth_rate_limit(request, email, 'login')
+        if rejection:
+            messages.error(request, RATE_LIMITED_MESSAGE)
+            return _with_retry_after(render(request, 'login.html', status=429), rejection[1])
+        
+        try:
+            success, result = firebase_sign_in(email, password)
+        except CircuitOpenError as e:
+            messages.error(request, UNAVAILABLE_MESSAGE)
+            return _with_retry_after(render(request, 'login.html', status=503), e.retry_after)
         
         if success:
             user = get_or_create_user(
@@ -28,7 +97,8 @@ def login_view(request):
                 firebase_uid=result['localId'],
                 email_verified=False
             )
-            login(request, user)
+            login(request, user, backend=LOGIN_BACKEND)
+            store_session_tokens(request, result)
             messages.success(request, 'Login realizado com sucesso!')
             return redirect('home')
         else:
@@ -41,23 +111,21 @@ def register_view(request):
         return redirect('home')
     
     if request.method == 'POST':
-        email = request.POST.get('email')
-        password = request.POST.get('password')
-        confirm_password = request.POST.get('confirm_password')
-        
-        if not email or not password or not confirm_password:
-            messages.error(request, 'Por favor, preencha todos os campos.')
+        credentials = _read_register_form(request)
+        if credentials is None:
             return render(request, 'register.html')
+        email, password = credentials
         
-        if password != confirm_password:
-            messages.error(request, 'As senhas não coincidem.')
-            return render(request, 'register.html')
-        
-        if len(password) < 6:
-            messages.error(request, 'A senha deve ter pelo menos 6 caracteres.')
-            return render(request, 'register.html')
+        rejection = check_auth_rate_limit(request, email, 'register')
+        if rejection:
+            messages.error(request, RATE_LIMITED_MESSAGE)
+            return _with_retry_after(render(request, 'register.html', status=429), rejection[1])
         
-        success, result = firebase_sign_up(email, password)
+        try:
+            success, result = firebase_sign_up(email, password)
+        except CircuitOpenError as e:
+            messages.error(request, UNAVAILABLE_MESSAGE)
+            return _with_retry_after(render(request, 'register.html', status=503), e.retry_after)
         
         if success:
             user = get_or_create_user(
@@ -66,7 +134,8 @@ def register_view(request):
                 firebase_uid=result['localId'],
                 email_verified=False
             )
-            login(request, user)
+            login(request, user, backend=LOGIN_BACKEND)
+            store_session_tokens(request, result)
             messages.success(request, 'Conta criada com sucesso!')
             return redirect('home')
         else:
@@ -74,7 +143,123 @@ def register_view(request):
     
     return render(request, 'register.html')
 
+async def alogin_view(request):
+    """Versão assíncrona de login_view: não ocupa uma thread enquanto espera o Firebase"""
+    user = await request.auser()
+    if user.is_authenticated:
+        return redirect('home')
+    
+    if request.method == 'POST':
+        credentials = _read_login_form(request)
+        if credentials is None:
+            return await arender(request, 'login.html')
+        email, password = credentials
+        
+        rejection = await acheck_auth_rate_limit(request, email, 'login')
+        if rejection:
+            messages.error(request, RATE_LIMITED_MESSAGE)
+            return _with_retry_after(await arender(request, 'login.html', status=429), rejection[1])
+        
+        try:
+            success, result = await afirebase_sign_in(email, password)
+        except CircuitOpenError as e:
+            messages.error(request, UNAVAILABLE_MESSAGE)
+            return _with_retry_after(await arender(request, 'login.html', status=503), e.retry_after)
+        
+        if success:
+            user = await aget_or_create_user(
+                username=email.split('@')[0],
+                email=email,
+                firebase_uid=result['localId'],
+                email_verified=False
+            )
+            await alogin(request, user, backend=LOGIN_BACKEND)
+            store_session_tokens(request, result)
+            messages.success(request, 'Login realizado com sucesso!')
+            return redirect('home')
+        else:
+            messages.error(request, result)
+    
+    return await arender(request, 'login.html')
+
+async def aregister_view(request):
+    """Versão assíncrona de register_view"""
+    user = await request.auser()
+    if user.is_authenticated:
+        return redirect('home')
+    
+    if request.method == 'POST':
+        credentials = _read_register_form(request)
+        if credentials is None:
+            return await arender(request, 'register.html')
+        email, password = credentials
+        
+        rejection = await acheck_auth_rate_limit(request, email, 'register')
+        if rejection:
+            messages.error(request, RATE_LIMITED_MESSAGE)
+            return _with_retry_after(await arender(request, 'register.html', status=429), rejection[1])
+        
+        try:
+            success, result = await afirebase_sign_up(email, password)
+        except CircuitOpenError as e:
+            messages.error(request, UNAVAILABLE_MESSAGE)
+            return _with_retry_after(await arender(request, 'register.html', status=503), e.retry_after)
+        
+        if success:
+            user = await aget_or_create_user(
+                username=email.split('@')[0],
+                email=email,
+                firebase_uid=result['localId'],
+                email_verified=False
+            )
+            await alogin(request, user, backend=LOGIN_BACKEND)
+            store_session_tokens(request, result)
+            messages.success(request, 'Conta criada com sucesso!')
+            return redirect('home')
+        else:
+            messages.error(request, result)
+    
+    return await arender(request, 'register.html')
+
 def logout_view(request):
     logout(request)
     messages.success(request, 'Logout realizado com sucesso!')
-    return redirect('home')
\ No newline at end of file
+    return redirect('home')
+
+def metrics_view(request):
+    """Métricas do processo no formato de texto do Prometheus; 404 se FIREBASE_METRICS_ENABLED estiver desligado"""
+    if not metrics_enabled():
+        raise Http404()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def health_view(request):
+    """Estado dos circuit breakers do Firebase neste processo.
+    
+    Responde 200 mesmo com algum circuito aberto ("degraded"): o Firebase fora
+    do ar não é motivo para o balanceador tirar o processo de circulação.
+    """
+    circuits = circuit_states()
+    degraded = any(circuit['state'] != 'closed' for circuit in circuits.values())
+    return JsonResponse({'status': 'degraded' if degraded else 'ok', 'circuits': circuits})
+
+@csrf_exempt
+@require_POST
+def firebase_events_view(request):
+    """Webhook dos eventos de usuário do Firebase (ex.: encaminhados por uma Cloud Function de auth).
+    
+    Só enfileira: os eventos são aplicados pelo process_firebase_events. A
+    requisição precisa vir assinada (X-Firebase-Signature, HMAC-SHA256 com um
+    de FIREBASE_WEBHOOK_SECRETS); sem segredo configurado o endpoint não existe.
+    """
+    if not get_webhook_secrets():
+        raise Http404()
+    if not verify_signature(request.body, request.headers.get(SIGNATURE_HEADER)):
+        return JsonResponse({'error': 'Assinatura inválida'}, status=401)
+    
+    try:
+        events = parse_events(request.body)
+    except InvalidEvent as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    accepted, duplicates = store_events(events)
+    return JsonResponse({'accepted': accepted, 'duplicates': duplicates}, status=202)
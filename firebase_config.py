@@ -1,124 +1,262 @@
-import firebase_admin
-from firebase_admin import credentials, auth, exceptions
+from django.conf import settings
+from accounts.circuit import get_breaker
+from accounts.metrics import admin_call
+from contextlib import contextmanager
 import os
 from pathlib import Path
-import json
-from django.conf import settings
+import sys
+import threading
+
+# firebase_admin (e o google-auth por trás dele) só é importado na primeira chamada ao Firebase
+auth = None
 
 _firebase_initialized = False
-_service_account_created = False
+# Falha guardada como a flag de sucesso: sem credenciais, as próximas chamadas falham sem tentar (e imprimir) de novo
+_firebase_init_failed = False
+_init_lock = threading.Lock()
+
+# Arquivo opcional, para quem já tinha o JSON da conta de serviço no projeto; nunca é gravado
+SERVICE_ACCOUNT_FILE = Path(__file__).parent / 'firebase-service-account.json'
 
-def create_firebase_service_account_file():
-    global _service_account_created
+def get_service_account_info():
+    """Monta a conta de serviço a partir das variáveis de ambiente, em memória"""
+    service_account_data = {
+        "type": os.getenv('FIREBASE_TYPE', 'service_account'),
+        "project_id": os.getenv('FIREBASE_PROJECT_ID', ''),
+        "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID', ''),
+        "private_key": os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
+        "client_email": os.getenv('FIREBASE_CLIENT_EMAIL', ''),
+        "client_id": os.getenv('FIREBASE_CLIENT_ID', ''),
+        "auth_uri": os.getenv('FIREBASE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth'),
+        "token_uri": os.getenv('FIREBASE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
+        "auth_provider_x509_CERT_URL": os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL', 'https://www.googleapis.com/oauth2/v1/certs'),
+        "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_X509_CERT_URL', ''),
+        "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN', 'googleapis.com')
+    }
     
-    if _service_account_created:
-        return True
-        
-    try:
-        service_account_data = {
-            "type": os.getenv('FIREBASE_TYPE', 'service_account'),
-            "project_id": os.getenv('FIREBASE_PROJECT_ID', ''),
-            "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID', ''),
-            "private_key": os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
-            "client_email": os.getenv('FIREBASE_CLIENT_EMAIL', ''),
-            "client_id": os.getenv('FIREBASE_CLIENT_ID', ''),
-            "auth_uri": os.getenv('FIREBASE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth'),
-            "token_uri": os.getenv('FIREBASE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
-            "auth_provider_x509_CERT_URL": os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL', 'https://www.googleapis.com/oauth2/v1/certs'),
-            "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_X509_CERT_URL', ''),
-            "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN', 'googleapis.com')
-        }
-        
-        required_fields = ['project_id', 'private_key', 'client_email']
-        for field in required_fields:
-            if not service_account_data[field]:
-                print(f"❌ Campo obrigatório faltando: {field}")
-                return False
-        
-        cred_path = Path(__file__).parent / 'firebase-service-account.json'
-        
-        with open(cred_path, 'w') as f:
-            json.dump(service_account_data, f, indent=2)
-        
-        print(f"✅ Arquivo firebase-service-account.json criado")
-        _service_account_created = True
-        return True
+    required_fields = ['project_id', 'private_key', 'client_email']
+    missing = [field for field in required_fields if not service_account_data[field]]
+    if missing:
+        if not SERVICE_ACCOUNT_FILE.exists():
+            print(f"❌ Campo obrigatório faltando: {', '.join(missing)}")
+        return None
+    
+    return service_account_data
+
+def _initialize_firebase_app():
+    global auth, _firebase_initialized
+    
+    import firebase_admin
+    from firebase_admin import credentials, auth as firebase_auth
+    
+    if firebase_admin._apps:
+        print("✅ Firebase já está inicializado")
+    else:
+        service_account_info = get_service_account_info()
+        if service_account_info is not None:
+            cred = credentials.Certificate(service_account_info)
+        elif SERVICE_ACCOUNT_FILE.exists():
+            print("✅ Arquivo de serviço encontrado!")
+            cred = credentials.Certificate(str(SERVICE_ACCOUNT_FILE))
+        else:
+            print("❌ Credenciais do Firebase não configuradas.")
+            return False
         
-    except Exception as e:
-        print(f"❌ Erro ao criar arquivo de serviço: {e}")
-        return False
+        firebase_admin.initialize_app(cred)
+        print("✅ Firebase Admin inicializado com sucesso!")
+    
+    if auth is None:
+        auth = firebase_auth
+    _firebase_initialized = True
+    return True
 
 def initialize_firebase():
-    global _firebase_initialized
+    """Inicializa o Admin SDK na primeira chamada ao Firebase; seguro entre threads.
     
-    try:
-        if firebase_admin._apps:
-            if not _firebase_initialized:
-                print("✅ Firebase já está inicializado")
-                _firebase_initialized = True
-            return True
-            
+    O resultado fica guardado para o processo: depois de uma falha (ex.: credenciais
+    não configuradas) as chamadas seguintes retornam False sem tentar de novo.
+    """
+    global _firebase_init_failed
+    
+    if _firebase_initialized:
+        return True
+    if _firebase_init_failed:
+        return False
+    
+    with _init_lock:
         if _firebase_initialized:
             return True
-            
-        cred_path = Path(__file__).parent / 'firebase-service-account.json'
-        
-        if not cred_path.exists():
-            if not _service_account_created:
-                print("🔍 Criando arquivo de serviço a partir de variáveis de ambiente...")
-            if not create_firebase_service_account_file():
-                if not _service_account_created:
-                    print("❌ Não foi possível criar o arquivo de serviço")
-                return False
-        
-        if cred_path.exists():
-            if not _firebase_initialized:
-                print("✅ Arquivo de serviço encontrado!")
-            cred = credentials.Certificate(str(cred_path))
-            firebase_admin.initialize_app(cred)
-            if not _firebase_initialized:
-                print("✅ Firebase Admin inicializado com sucesso!")
-            _firebase_initialized = True
-            return True
-        else:
-            if not _firebase_initialized:
-                print("❌ Arquivo de serviço do Firebase não encontrado.")
+        if _firebase_init_failed:
             return False
-                
-    except Exception as e:
-        if not _firebase_initialized:
+        try:
+            initialized = _initialize_firebase_app()
+        except Exception as e:
             print(f"❌ Erro ao inicializar Firebase: {e}")
-        return False
+            initialized = False
+        _firebase_init_failed = not initialized
+        return initialized
+
+def _firebase_error():
+    """Classe base dos erros do Admin SDK, importada só quando uma exceção precisa ser tratada"""
+    from firebase_admin import exceptions
+    return exceptions.FirebaseError
+
+def _is_unavailable(error):
+    """Erros que indicam o serviço fora do ar (e abrem o circuito), não um problema com o usuário"""
+    import requests
+    from firebase_admin import exceptions
+    
+    return isinstance(error, (
+        exceptions.UnavailableError,
+        exceptions.DeadlineExceededError,
+        exceptions.InternalError,
+        exceptions.UnknownError,
+        requests.exceptions.RequestException,
+        OSError,
+    ))
+
+@contextmanager
+def _admin_call(operation):
+    """Chamada ao Admin SDK medida e protegida pelo circuito da operação (CircuitOpenError se aberto)"""
+    with get_breaker(f'admin:{operation}').guard(_is_unavailable), admin_call(operation):
+        yield
+
+# Limite do Admin SDK para auth.list_users(max_results=...)
+MAX_LIST_USERS_PAGE_SIZE = 1000
+
+def get_list_users_page_size(page_size=None):
+    if page_size is None:
+        page_size = getattr(settings, 'FIREBASE_SYNC_PAGE_SIZE', MAX_LIST_USERS_PAGE_SIZE)
+    return max(1, min(int(page_size), MAX_LIST_USERS_PAGE_SIZE))
+
+def firebase_user_to_dict(user):
+    return {
+        'uid': user.uid,
+        'email': user.email,
+        'email_verified': user.email_verified,
+        'display_name': user.display_name or (user.email or '').split('@')[0],
+        'created_at': user.user_metadata.creation_timestamp,
+        'last_refresh_at': user.user_metadata.last_refresh_timestamp,
+        'last_sign_in_at': user.user_metadata.last_sign_in_timestamp,
+    }
+
+class FirebaseUserRecord:
+    """Usuário do Firebase como a sincronização o mantém em memória.
+    
+    Bem menor que um dict por usuário: __slots__, o email dividido em parte
+    local e domínio internado (milhões de usuários dividem poucos domínios),
+    display_name guardado só quando difere do padrão e timestamps como int (ms).
+    """
+    
+    __slots__ = (
+        'uid', 'local_part', 'domain', 'email_verified', '_display_name',
+        'created_at', 'last_refresh_at', 'last_sign_in_at',
+    )
+    
+    def __init__(self, uid, email, email_verified=False, display_name=None,
+                 created_at=None, last_refresh_at=None, last_sign_in_at=None):
+        self.uid = uid
+        self.email_verified = bool(email_verified)
+        
+        self.local_part = self.domain = None
+        if email:
+            local_part, at, domain = email.rpartition('@')
+            if at:
+                self.local_part, self.domain = local_part, sys.intern(domain)
+            else:
+                self.local_part = email
+        
+        # O padrão é a parte local do email, que já está guardada
+        self._display_name = display_name if display_name and display_name != self.local_part else None
+        self.created_at = int(created_at) if created_at is not None else None
+        self.last_refresh_at = int(last_refresh_at) if last_refresh_at is not None else None
+        self.last_sign_in_at = int(last_sign_in_at) if last_sign_in_at is not None else None
+    
+    @classmethod
+    def from_user(cls, user):
+        metadata = user.user_metadata
+        return cls(
+            user.uid,
+            user.email,
+            user.email_verified,
+            user.display_name,
+            metadata.creation_timestamp,
+            metadata.last_refresh_timestamp,
+            metadata.last_sign_in_timestamp,
+        )
+    
+    @property
+    def email(self):
+        if self.domain is None:
+            return self.local_part
+        return f'{self.local_part}@{self.domain}'
+    
+    @property
+    def display_name(self):
+        return self._display_name or self.local_part or ''
+    
+    def to_dict(self):
+        return {
+            'uid': self.uid,
+            'email': self.email,
+            'email_verified': self.email_verified,
+            'display_name': self.display_name,
+            'created_at': self.created_at,
+            'last_refresh_at': self.last_refresh_at,
+            'last_sign_in_at': self.last_sign_in_at,
+        }
+    
+    def __repr__(self):
+        return f'<FirebaseUserRecord {self.uid} {self.email}>'
+
+def get_firebase_user_changed_at(firebase_user):
+    """Maior timestamp (ms) entre criação, último refresh e último login"""
+    timestamps = (
+        firebase_user.created_at,
+        firebase_user.last_refresh_at,
+        firebase_user.last_sign_in_at,
+    )
+    return max((timestamp for timestamp in timestamps if timestamp), default=0)
+
+def get_firebase_project_id():
+    return settings.FIREBASE_CONFIG.get('projectId') or os.getenv('FIREBASE_PROJECT_ID') or 'default'
+
+def iter_firebase_user_pages(page_size=None):
+    """Percorre os usuários do Firebase em uma única passada, uma página por vez.
+    
+    Erros do Admin SDK são propagados: quem consome o iterador precisa saber
+    se a listagem foi interrompida antes de usá-la para detectar órfãos.
+    """
+    if not initialize_firebase():
+        return
+    
+    with _admin_call('list_users'):
+        page = auth.list_users(max_results=get_list_users_page_size(page_size))
+    
+    while page:
+        yield [FirebaseUserRecord.from_user(user) for user in page.users]
+        with _admin_call('list_users'):
+            page = page.get_next_page()
+
+def iter_firebase_users(page_size=None):
+    for page in iter_firebase_user_pages(page_size):
+        yield from page
 
 def get_firebase_users():
+    """Todos os usuários do Firebase como dicts (uid, email, email_verified, display_name e timestamps).
+    
+    Mantém o formato de sempre para quem usa user['uid']; a sincronização usa
+    iter_firebase_user_pages(), que devolve FirebaseUserRecord sem montar a lista inteira.
+    """
     try:
-        if not initialize_firebase():
-            return []
-        
-        users = []
-        page = auth.list_users()
-        
-        user_count = 0
-        while page:
-            for user in page.users:
-                user_data = {
-                    'uid': user.uid,
-                    'email': user.email,
-                    'email_verified': user.email_verified,
-                    'display_name': user.display_name or user.email.split('@')[0],
-                    'created_at': user.user_metadata.creation_timestamp,
-                }
-                user_count += 1
-                users.append(user_data)
-            
-            page = page.get_next_page()
+        users = [user.to_dict() for user in iter_firebase_users()]
         
-        if user_count > 0 and not hasattr(get_firebase_users, '_printed_count'):
-            print(f"✅ {user_count} usuários encontrados no Firebase")
+        if users and not hasattr(get_firebase_users, '_printed_count'):
+            print(f"✅ {len(users)} usuários encontrados no Firebase")
             get_firebase_users._printed_count = True
-            
-        return users
         
+        return users
+    
     except Exception as e:
         if not hasattr(get_firebase_users, '_error_printed'):
             print(f"❌ Erro ao buscar usuários do Firebase: {e}")
@@ -127,19 +265,8 @@ def get_firebase_users():
 
 def get_firebase_user_uids():
     try:
-        if not initialize_firebase():
-            return set()
-        
-        uids = set()
-        page = auth.list_users()
-        
-        while page:
-            for user in page.users:
-                uids.add(user.uid)
-            page = page.get_next_page()
-        
-        return uids
-        
+        return {user.uid for user in iter_firebase_users()}
+    
     except Exception as e:
         print(f"❌ Erro ao buscar UIDs do Firebase: {e}")
         return set()
@@ -148,7 +275,7 @@ def create_firebase_user(email, password=None, display_name=None):
     try:
         if not initialize_firebase():
             return None
-            
+        
         user_data = {
             'email': email,
             'email_verified': False,
@@ -158,11 +285,12 @@ def create_firebase_user(email, password=None, display_name=None):
         if password:
             user_data['password'] = password
         
-        user = auth.create_user(**user_data)
+        with _admin_call('create_user'):
+            user = auth.create_user(**user_data)
         print(f"✅ Usuário criado no Firebase: {email}")
         return user.uid
-        
-    except exceptions.FirebaseError as e:
+    
+    except _firebase_error() as e:
         print(f"❌ Erro ao criar usuário no Firebase: {e}")
         return None
     except Exception as e:
@@ -174,7 +302,7 @@ def update_firebase_user(uid, email=None, display_name=None, email_verified=None
     try:
         if not initialize_firebase():
             return False
-            
+        
         update_data = {}
         
         if email:
@@ -183,15 +311,16 @@ def update_firebase_user(uid, email=None, display_name=None, email_verified=None
             update_data['display_name'] = display_name
         if email_verified is not None:
             update_data['email_verified'] = email_verified
-            
+        
         if update_data:
-            auth.update_user(uid, **update_data)
+            with _admin_call('update_user'):
+                auth.update_user(uid, **update_data)
             print(f"✅ Usuário atualizado no Firebase: {uid}")
             return True
-            
-        return False
         
-    except exceptions.FirebaseError as e:
+        return False
+    
+    except _firebase_error() as e:
         print(f"❌ Erro ao atualizar usuário no Firebase: {e}")
         return False
 
@@ -199,24 +328,72 @@ def delete_firebase_user(uid):
     try:
         if not initialize_firebase():
             return False
-            
-        auth.delete_user(uid)
+        
+        with _admin_call('delete_user'):
+            auth.delete_user(uid)
         print(f"✅ Usuário deletado do Firebase: {uid}")
         return True
-        
-    except exceptions.FirebaseError as e:
+    
+    except _firebase_error() as e:
         print(f"❌ Erro ao deletar usuário do Firebase: {e}")
         return False
     except Exception as e:
         print(f"❌ Erro inesperado ao deletar usuário: {e}")
         return False
 
+# Limite do Admin SDK para auth.import_users() e auth.delete_users()
+MAX_BATCH_WRITE_SIZE = 1000
+
+def import_firebase_users(users):
+    """Cria (ou sobrescreve) até 1000 usuários numa chamada. Retorna {índice: motivo} das falhas"""
+    try:
+        if not initialize_firebase():
+            return {index: 'Firebase não inicializado' for index in range(len(users))}
+        
+        records = [
+            auth.ImportUserRecord(
+                uid=user['uid'],
+                email=user.get('email') or None,
+                email_verified=user.get('email_verified', False),
+                display_name=user.get('display_name') or None,
+            )
+            for user in users
+        ]
+        with _admin_call('import_users'):
+            result = auth.import_users(records)
+        
+        if result.success_count:
+            print(f"✅ {result.success_count} usuários criados no Firebase")
+        return {error.index: error.reason for error in result.errors}
+    
+    except Exception as e:
+        print(f"❌ Erro ao importar usuários no Firebase: {e}")
+        return {index: str(e) for index in range(len(users))}
+
+def delete_firebase_users(uids):
+    """Remove até 1000 usuários numa chamada. Retorna {índice: motivo} das falhas"""
+    try:
+        if not initialize_firebase():
+            return {index: 'Firebase não inicializado' for index in range(len(uids))}
+        
+        with _admin_call('delete_users'):
+            result = auth.delete_users(uids)
+        
+        if result.success_count:
+            print(f"✅ {result.success_count} usuários deletados do Firebase")
+        return {error.index: error.reason for error in result.errors}
+    
+    except Exception as e:
+        print(f"❌ Erro ao deletar usuários do Firebase: {e}")
+        return {index: str(e) for index in range(len(uids))}
+
 def get_firebase_user_by_uid(uid):
     try:
         if not initialize_firebase():
             return None
-            
-        user = auth.get_user(uid)
+        
+        with _admin_call('get_user'):
+            user = auth.get_user(uid)
         return {
             'uid': user.uid,
             'email': user.email,
@@ -224,15 +401,9 @@ def get_firebase_user_by_uid(uid):
             'display_name': user.display_name,
             'created_at': user.user_metadata.creation_timestamp,
         }
-        
-    except exceptions.FirebaseError:
+    
+    except _firebase_error():
         return None
     except Exception as e:
         print(f"❌ Erro ao buscar usuário no Firebase: {e}")
         return None
-
-try:
-    if not _firebase_initialized:
-        initialize_firebase()
-except:
-    pass
\ No newline at end of file
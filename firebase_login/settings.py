@@ -30,6 +30,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.FirebaseTokenMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,6 +62,14 @@ DATABASES = {
     }
 }
 
+# O ModelBackend continua na lista para as sessões criadas antes do CachedModelBackend: o Django guarda na sessão
+# o backend do login e descarta sessões cujo backend não está mais configurado
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.CachedModelBackend',
+    'accounts.backends.FirebaseTokenBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -98,6 +107,123 @@ FIREBASE_CONFIG = {
     'appId': os.getenv('FIREBASE_APP_ID'),
 }
 
+# Cliente HTTP da Identity Toolkit (login/cadastro): pool de conexões, timeouts (s) e tentativas.
+# FIREBASE_HTTP_TOTAL_TIMEOUT limita o tempo de uma chamada somando todas as tentativas e esperas
+FIREBASE_IDENTITY_TOOLKIT_URL = os.getenv('FIREBASE_IDENTITY_TOOLKIT_URL', 'https://identitytoolkit.googleapis.com/v1')
+FIREBASE_HTTP_CONNECT_TIMEOUT = float(os.getenv('FIREBASE_HTTP_CONNECT_TIMEOUT', '3.05'))
+FIREBASE_HTTP_READ_TIMEOUT = float(os.getenv('FIREBASE_HTTP_READ_TIMEOUT', '10'))
+FIREBASE_HTTP_POOL_MAXSIZE = int(os.getenv('FIREBASE_HTTP_POOL_MAXSIZE', '10'))
+FIREBASE_HTTP_RETRIES = int(os.getenv('FIREBASE_HTTP_RETRIES', '2'))
+FIREBASE_HTTP_TOTAL_TIMEOUT = float(os.getenv('FIREBASE_HTTP_TOTAL_TIMEOUT', '15'))
+FIREBASE_HTTP_ASYNC_POOL_MAXSIZE = int(os.getenv('FIREBASE_HTTP_ASYNC_POOL_MAXSIZE', '100'))
+
+# Tokens do Firebase (idToken/refreshToken) guardados na sessão, cifrados com Fernet. Chaves separadas por vírgula
+# (a primeira cifra; as demais só decifram, para rotação); vazio deriva uma chave do SECRET_KEY.
+# O ID token é renovado no securetoken quando faltam menos de FIREBASE_TOKEN_REFRESH_MARGIN segundos para expirar.
+FIREBASE_SECURE_TOKEN_URL = os.getenv('FIREBASE_SECURE_TOKEN_URL', 'https://securetoken.googleapis.com/v1')
+FIREBASE_TOKEN_ENCRYPTION_KEYS = [key for key in os.getenv('FIREBASE_TOKEN_ENCRYPTION_KEYS', '').split(',') if key]
+FIREBASE_TOKEN_REFRESH_MARGIN = int(os.getenv('FIREBASE_TOKEN_REFRESH_MARGIN', '300'))
+
+# Limite de taxa do login/cadastro antes de chamar a Identity Toolkit, no formato "requisições/segundos"
+# (vazio desliga o escopo). Backend 'local' (token bucket por processo) ou 'cache' (janela deslizante no
+# cache do Django, compartilhada entre workers). Atrás de um proxy, FIREBASE_RATELIMIT_IP_HEADER indica o
+# header com o IP do cliente (ex.: HTTP_X_FORWARDED_FOR) e FIREBASE_RATELIMIT_TRUSTED_PROXIES quantos proxies
+# acrescentam um endereço a ele. Sem o header o limite por IP fica desligado por padrão: atrás de um proxy o
+# REMOTE_ADDR é o do proxy, e todos os clientes dividiriam o mesmo limite
+FIREBASE_RATELIMIT_ENABLED = os.getenv('FIREBASE_RATELIMIT_ENABLED', 'True') == 'True'
+FIREBASE_RATELIMIT_BACKEND = os.getenv('FIREBASE_RATELIMIT_BACKEND', 'local')
+FIREBASE_RATELIMIT_CACHE_ALIAS = os.getenv('FIREBASE_RATELIMIT_CACHE_ALIAS', 'default')
+FIREBASE_RATELIMIT_IP_HEADER = os.getenv('FIREBASE_RATELIMIT_IP_HEADER', '')
+FIREBASE_RATELIMIT_TRUSTED_PROXIES = int(os.getenv('FIREBASE_RATELIMIT_TRUSTED_PROXIES', '1'))
+FIREBASE_RATELIMIT_IP = os.getenv('FIREBASE_RATELIMIT_IP', '20/60' if FIREBASE_RATELIMIT_IP_HEADER else '')
+FIREBASE_RATELIMIT_EMAIL = os.getenv('FIREBASE_RATELIMIT_EMAIL', '5/60')
+FIREBASE_RATELIMIT_GLOBAL = os.getenv('FIREBASE_RATELIMIT_GLOBAL', '100/1')
+
+# Circuit breaker por endpoint do Firebase (Identity Toolkit e Admin SDK): abre depois de
+# FIREBASE_CIRCUIT_FAILURE_THRESHOLD falhas seguidas e deixa passar uma chamada de teste a cada
+# FIREBASE_CIRCUIT_RECOVERY_TIMEOUT segundos. FIREBASE_CIRCUIT_BREAKERS sobrescreve os dois por endpoint,
+# ex.: {'accounts:signInWithPassword': {'failure_threshold': 3, 'recovery_timeout': 10}}
+FIREBASE_CIRCUIT_BREAKER_ENABLED = os.getenv('FIREBASE_CIRCUIT_BREAKER_ENABLED', 'True') == 'True'
+FIREBASE_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('FIREBASE_CIRCUIT_FAILURE_THRESHOLD', '5'))
+FIREBASE_CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv('FIREBASE_CIRCUIT_RECOVERY_TIMEOUT', '30'))
+FIREBASE_CIRCUIT_BREAKERS = {}
+
+# Usa as views assíncronas de login/cadastro (ativado automaticamente pelo asgi.py)
+ASYNC_AUTH_VIEWS = os.getenv('ASYNC_AUTH_VIEWS', 'False') == 'True'
+
+# Métricas (contadores e histogramas em /metrics, formato Prometheus) das chamadas ao Firebase e da sincronização.
+# Desligadas, as medições viram no-ops; o tracing usa o OpenTelemetry, se instalado
+FIREBASE_METRICS_ENABLED = os.getenv('FIREBASE_METRICS_ENABLED', 'False') == 'True'
+FIREBASE_TRACING_ENABLED = os.getenv('FIREBASE_TRACING_ENABLED', 'False') == 'True'
+
+# Autenticação por ID token do Firebase (header "Authorization: Bearer" ou cookie), validado localmente
+FIREBASE_ID_TOKEN_COOKIE = os.getenv('FIREBASE_ID_TOKEN_COOKIE', 'firebase_id_token')
+FIREBASE_TOKEN_CERTS_URL = os.getenv(
+    'FIREBASE_TOKEN_CERTS_URL',
+    'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com',
+)
+FIREBASE_TOKEN_CLOCK_SKEW = int(os.getenv('FIREBASE_TOKEN_CLOCK_SKEW', '10'))
+
+# Cache read-through de CustomUser (por pk, firebase_uid e email) no cache do Django,
+# com um LRU local por processo na frente (TTL curto, em segundos). O alias precisa ser compartilhado
+# entre os workers (Redis, memcached, banco); com LocMemCache/DummyCache só o LRU local é usado
+FIREBASE_USER_CACHE_ALIAS = os.getenv('FIREBASE_USER_CACHE_ALIAS', 'default')
+FIREBASE_USER_CACHE_TIMEOUT = int(os.getenv('FIREBASE_USER_CACHE_TIMEOUT', '300'))
+FIREBASE_USER_CACHE_LOCAL_TTL = float(os.getenv('FIREBASE_USER_CACHE_LOCAL_TTL', '5'))
+FIREBASE_USER_CACHE_LOCAL_SIZE = int(os.getenv('FIREBASE_USER_CACHE_LOCAL_SIZE', '1024'))
+
+# Usuários buscados por página em auth.list_users() durante a sincronização (máx. 1000)
+FIREBASE_SYNC_PAGE_SIZE = int(os.getenv('FIREBASE_SYNC_PAGE_SIZE', '1000'))
+
+# Linhas por lote de bulk_create/bulk_update; cada lote roda na sua própria transação
+FIREBASE_SYNC_BATCH_SIZE = int(os.getenv('FIREBASE_SYNC_BATCH_SIZE', '500'))
+
+# Threads de escrita da sincronização em paralelo com a busca no Firebase (0 = sequencial) e
+# quantos lotes podem esperar em cada fila antes de a busca pausar
+FIREBASE_SYNC_WORKERS = int(os.getenv('FIREBASE_SYNC_WORKERS', '0'))
+FIREBASE_SYNC_QUEUE_DEPTH = int(os.getenv('FIREBASE_SYNC_QUEUE_DEPTH', '2'))
+
+# Intervalo (s) entre varreduras completas; entre elas a sincronização é incremental
+FIREBASE_FULL_SYNC_INTERVAL = int(os.getenv('FIREBASE_FULL_SYNC_INTERVAL', str(24 * 60 * 60)))
+
+# Margem (s) subtraída da marca d'água na sincronização incremental
+FIREBASE_SYNC_WATERMARK_OVERLAP = int(os.getenv('FIREBASE_SYNC_WATERMARK_OVERLAP', '300'))
+
+# Lease no banco que permite uma única sincronização por vez no cluster; renovado a cada TTL/3 (s)
+FIREBASE_SYNC_LEASE_TTL = int(os.getenv('FIREBASE_SYNC_LEASE_TTL', '60'))
+
+# Agendador periódico (python manage.py run_sync_scheduler, ou dentro do processo web se habilitado):
+# intervalo em segundos e variação aleatória como fração do intervalo
+FIREBASE_SYNC_SCHEDULER_ENABLED = os.getenv('FIREBASE_SYNC_SCHEDULER_ENABLED', 'False') == 'True'
+FIREBASE_SYNC_INTERVAL = int(os.getenv('FIREBASE_SYNC_INTERVAL', '300'))
+FIREBASE_SYNC_JITTER = float(os.getenv('FIREBASE_SYNC_JITTER', '0.1'))
+
+# Remoção de órfãos: tamanho do lote e proporção máxima antes de abortar (listagem truncada)
+FIREBASE_ORPHAN_DELETE_BATCH_SIZE = int(os.getenv('FIREBASE_ORPHAN_DELETE_BATCH_SIZE', '500'))
+FIREBASE_ORPHAN_MAX_RATIO = float(os.getenv('FIREBASE_ORPHAN_MAX_RATIO', '0.2'))
+
+# last_login em lote: o login só marca o usuário em memória e uma thread grava tudo num bulk_update
+# a cada FIREBASE_LAST_LOGIN_FLUSH_INTERVAL segundos, ou assim que o buffer juntar
+# FIREBASE_LAST_LOGIN_FLUSH_BATCH_SIZE usuários (e ao encerrar o processo)
+FIREBASE_LAST_LOGIN_WRITE_BEHIND = os.getenv('FIREBASE_LAST_LOGIN_WRITE_BEHIND', 'False') == 'True'
+FIREBASE_LAST_LOGIN_FLUSH_INTERVAL = float(os.getenv('FIREBASE_LAST_LOGIN_FLUSH_INTERVAL', '5'))
+FIREBASE_LAST_LOGIN_FLUSH_BATCH_SIZE = int(os.getenv('FIREBASE_LAST_LOGIN_FLUSH_BATCH_SIZE', '500'))
+
+# Webhook de eventos de usuário do Firebase (/firebase/events/), assinado com HMAC-SHA256. Segredos separados
+# por vírgula (todos validam, o primeiro assina no replay_firebase_events); vazio desliga o endpoint.
+# Os eventos são aplicados por python manage.py process_firebase_events, até FIREBASE_EVENTS_BATCH_SIZE UIDs
+# por rodada, e os processados ficam FIREBASE_EVENTS_RETENTION_DAYS dias para detectar reenvios
+FIREBASE_WEBHOOK_SECRETS = [secret for secret in os.getenv('FIREBASE_WEBHOOK_SECRETS', '').split(',') if secret]
+FIREBASE_WEBHOOK_TOLERANCE = int(os.getenv('FIREBASE_WEBHOOK_TOLERANCE', '300'))
+FIREBASE_EVENTS_BATCH_SIZE = int(os.getenv('FIREBASE_EVENTS_BATCH_SIZE', '100'))
+FIREBASE_EVENTS_MAX_ATTEMPTS = int(os.getenv('FIREBASE_EVENTS_MAX_ATTEMPTS', '5'))
+FIREBASE_EVENTS_RETENTION_DAYS = int(os.getenv('FIREBASE_EVENTS_RETENTION_DAYS', '7'))
+
+# Outbox (python manage.py drain_firebase_outbox): tentativas e backoff exponencial em segundos
+FIREBASE_OUTBOX_MAX_ATTEMPTS = int(os.getenv('FIREBASE_OUTBOX_MAX_ATTEMPTS', '8'))
+FIREBASE_OUTBOX_BACKOFF_BASE = int(os.getenv('FIREBASE_OUTBOX_BACKOFF_BASE', '5'))
+FIREBASE_OUTBOX_BACKOFF_MAX = int(os.getenv('FIREBASE_OUTBOX_BACKOFF_MAX', '3600'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -116,5 +242,8 @@ LOGGING = {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': False,
         },
+        'httpx': {
+            'level': 'WARNING',
+        },
     },
 }
\ No newline at end of file
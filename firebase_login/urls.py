@@ -1,6 +1,21 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from accounts.views import home, login_view, register_view, logout_view
+from accounts.views import (
+    home,
+    login_view,
+    register_view,
+    logout_view,
+    alogin_view,
+    aregister_view,
+    metrics_view,
+    health_view,
+    firebase_events_view,
+)
+
+# No ASGI as views de login/cadastro assíncronas não prendem uma thread esperando o Firebase
+if settings.ASYNC_AUTH_VIEWS:
+    login_view, register_view = alogin_view, aregister_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -8,4 +23,7 @@ urlpatterns = [
     path('login/', login_view, name='login'),
     path('register/', register_view, name='register'),
     path('logout/', logout_view, name='logout'),
+    path('metrics', metrics_view, name='metrics'),
+    path('health/', health_view, name='health'),
+    path('firebase/events/', firebase_events_view, name='firebase_events'),
 ]
\ No newline at end of file